@@ -0,0 +1,181 @@
+from matplotlib import pyplot
+import argparse
+import pandas
+import numpy
+import sys
+import os
+
+
+"""
+Group the results of a profile.py --thread_sweep run by tool and region (without the _t<threads> suffix), and compute
+speedup and parallel efficiency of each sweep point relative to the single threaded run of the same region
+"""
+def get_sweep_table(df):
+    df = df[(df["elapsed_real_min"] > 0) & df["cpu_count"].notna()].copy()
+
+    df["threads"] = df["cpu_count"].astype(int)
+    df["base_region"] = df["region"].str.replace(r"_t\d+$", "", regex=True)
+
+    baseline = df[df["threads"] == 1][["tool", "base_region", "elapsed_real_min", "ram_max_mbyte"]]
+    baseline = baseline.rename(columns={"elapsed_real_min": "elapsed_1", "ram_max_mbyte": "ram_1"})
+
+    n_groups = df.groupby(["tool", "base_region"]).ngroups
+    df = df.merge(baseline, on=["tool", "base_region"], how="inner")
+
+    n_missing = n_groups - df.groupby(["tool", "base_region"]).ngroups
+    if n_missing > 0:
+        sys.stderr.write("WARNING: %d regions have no single threaded run and were excluded\n" % n_missing)
+
+    df["speedup"] = df["elapsed_1"]/df["elapsed_real_min"]
+    df["efficiency"] = df["speedup"]/df["threads"]
+    df["ram_ratio"] = df["ram_max_mbyte"]/df["ram_1"]
+
+    return df[["tool", "base_region", "threads", "elapsed_real_min", "ram_max_mbyte", "ram_1", "speedup", "efficiency", "ram_ratio"]]
+
+
+def get_amdahl_speedup(parallel_fraction, threads):
+    return 1.0/((1 - parallel_fraction) + parallel_fraction/threads)
+
+
+"""
+Fit Amdahl's law to all sweep points of one tool. With times normalized by the single threaded time,
+T(p)/T(1) - 1 = f*(1/p - 1), so the parallel fraction f is a least squares slope through the origin.
+The RAM cost of each extra thread is fit the same way, as (RAM(p) - RAM(1)) = b*(p - 1).
+"""
+def fit_amdahl(tool_df, min_efficiency, max_threads):
+    p = tool_df["threads"].to_numpy(dtype=float)
+    y = 1.0/tool_df["speedup"].to_numpy(dtype=float) - 1
+    x = 1.0/p - 1
+
+    denominator = numpy.dot(x, x)
+    f = numpy.dot(x, y)/denominator if denominator > 0 else 0.0
+    f = float(numpy.clip(f, 0, 1))
+
+    residuals = y - f*x
+    total = numpy.sum((y - numpy.mean(y))**2)
+    r_squared = 1 - numpy.sum(residuals**2)/total if total > 0 else 1.0
+
+    ram_x = p - 1
+    ram_y = (tool_df["ram_max_mbyte"] - tool_df["ram_1"]).to_numpy(dtype=float)
+    ram_denominator = numpy.dot(ram_x, ram_x)
+    ram_per_thread = numpy.dot(ram_x, ram_y)/ram_denominator if ram_denominator > 0 else 0.0
+
+    # Efficiency S(p)/p = 1/(p*(1 - f) + f) stays above the threshold for p <= (1/e - f)/(1 - f)
+    if f < 1:
+        recommended = int(max(1, min(max_threads, numpy.floor((1/min_efficiency - f)/(1 - f)))))
+    else:
+        recommended = max_threads
+
+    return {
+        "parallel_fraction": f,
+        "max_speedup": 1/(1 - f) if f < 1 else float("inf"),
+        "r_squared": r_squared,
+        "ram_mbyte_per_thread": ram_per_thread,
+        "recommended_threads": recommended,
+        "n_observations": len(tool_df)
+    }
+
+
+def plot_sweep(sweep, fits, output_path):
+    figure, axes = pyplot.subplots(nrows=1, ncols=3, figsize=(15,5))
+
+    max_threads = sweep["threads"].max()
+    p = numpy.linspace(1, max_threads, 200)
+
+    for i,(tool,tool_df) in enumerate(sweep.groupby("tool")):
+        color = "C%d" % i
+        medians = tool_df.groupby("threads")[["speedup", "efficiency", "ram_ratio"]].median()
+
+        f = fits[tool]["parallel_fraction"]
+
+        axes[0].scatter(tool_df["threads"], tool_df["speedup"], color=color, alpha=0.2, s=6, linewidths=0)
+        axes[0].plot(medians.index, medians["speedup"], color=color, marker='o', label="%s (f=%.3f)" % (tool, f))
+        axes[0].plot(p, get_amdahl_speedup(f, p), color=color, linestyle=':')
+
+        axes[1].plot(medians.index, medians["efficiency"], color=color, marker='o', label=tool)
+        axes[1].plot(p, get_amdahl_speedup(f, p)/p, color=color, linestyle=':')
+
+        axes[2].scatter(tool_df["threads"], tool_df["ram_ratio"], color=color, alpha=0.2, s=6, linewidths=0)
+        axes[2].plot(medians.index, medians["ram_ratio"], color=color, marker='o', label=tool)
+
+    axes[0].plot(p, p, color="gray", linestyle="--", linewidth=0.8, label="ideal")
+
+    axes[0].set_ylabel("Speedup over 1 thread")
+    axes[1].set_ylabel("Parallel efficiency")
+    axes[2].set_ylabel("Peak RAM relative to 1 thread")
+
+    for a in axes:
+        a.set_xlabel("Threads")
+        a.set_xscale("log", base=2)
+        a.legend()
+
+    axes[0].set_title("Speedup (dotted: Amdahl fit)")
+    axes[1].set_title("Efficiency")
+    axes[2].set_title("RAM vs threads")
+
+    figure.tight_layout()
+    figure.savefig(output_path, dpi=200)
+
+
+def main(results_path, min_efficiency, output_directory):
+    output_directory = os.path.abspath(output_directory)
+
+    if not os.path.exists(output_directory):
+        os.makedirs(output_directory)
+
+    df = pandas.read_table(results_path, sep='\t', header=0)
+
+    sweep = get_sweep_table(df)
+
+    if len(sweep) == 0:
+        exit("ERROR: no thread sweep results with a single threaded baseline found in: %s" % results_path)
+
+    sweep_path = os.path.join(output_directory, "thread_scaling.tsv")
+    sweep.to_csv(sweep_path, sep='\t', index=False)
+
+    fits = dict()
+    for tool,tool_df in sweep.groupby("tool"):
+        fits[tool] = fit_amdahl(tool_df, min_efficiency, int(sweep["threads"].max()))
+
+        print("%s: parallel fraction %.4f, max speedup %.2f, r2 %.3f, %.1f MB/thread, recommended threads: %d" % (
+            tool,
+            fits[tool]["parallel_fraction"],
+            fits[tool]["max_speedup"],
+            fits[tool]["r_squared"],
+            fits[tool]["ram_mbyte_per_thread"],
+            fits[tool]["recommended_threads"]))
+
+    fits_path = os.path.join(output_directory, "thread_scaling_fits.tsv")
+    pandas.DataFrame.from_dict(fits, orient="index").rename_axis("tool").to_csv(fits_path, sep='\t')
+
+    plot_sweep(sweep, fits, os.path.join(output_directory, "thread_scaling.png"))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+
+    parser.add_argument(
+        "-i",
+        required=True,
+        type=str,
+        help="Consolidated results table (TSV) written by compare_profile_results.py, for profile.py --thread_sweep outputs"
+    )
+
+    parser.add_argument(
+        "--min_efficiency",
+        required=False,
+        default=0.5,
+        type=float,
+        help="Recommend the largest thread count whose predicted parallel efficiency is at least this"
+    )
+
+    parser.add_argument(
+        "-o",
+        required=True,
+        type=str,
+        help="Output directory"
+    )
+
+    args = parser.parse_args()
+
+    main(results_path=args.i, min_efficiency=args.min_efficiency, output_directory=args.o)
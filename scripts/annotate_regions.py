@@ -0,0 +1,274 @@
+from module.Kmer import encode_sequence, get_canonical_kmers
+from multiprocessing import Pool
+import argparse
+import pandas
+import numpy
+import time
+import sys
+import re
+import os
+
+
+FEATURE_COLUMNS = [
+    "region",
+    "contig",
+    "start",
+    "stop",
+    "length",
+    "gc_fraction",
+    "n_fraction",
+    "lowercase_fraction",
+    "homopolymer_fraction",
+    "distinct_kmer_count",
+    "distinct_kmer_fraction",
+]
+
+# Runs of one base at least this long count towards the homopolymer fraction
+HOMOPOLYMER_MIN_LENGTH = 6
+
+# Set once per worker process by init_worker
+reference = None
+reference_index = None
+
+
+"""
+Parse a samtools .fai index: name, length, offset of the first base, bases per line, and bytes per line
+"""
+def load_fasta_index(fai_path):
+    index = dict()
+
+    with open(fai_path, 'r') as file:
+        for line in file:
+            name, length, offset, line_bases, line_width = line.split('\t')[:5]
+            index[name] = (int(length), int(offset), int(line_bases), int(line_width))
+
+    return index
+
+
+def init_worker(reference_path, fai_path):
+    global reference, reference_index
+
+    # Memory mapped, so all workers share the OS page cache and only the pages of the regions they read are loaded
+    reference = numpy.memmap(reference_path, dtype=numpy.uint8, mode='r')
+    reference_index = load_fasta_index(fai_path)
+
+
+"""
+Bytes of a 0-based half-open interval of a contig, found directly from the .fai line geometry without reading anything
+before it. Line breaks inside the interval are removed.
+"""
+def get_sequence(reference, index_entry, start, stop):
+    length, offset, line_bases, line_width = index_entry
+
+    start = max(0, start)
+    stop = min(stop, length)
+
+    if stop <= start:
+        return numpy.zeros(0, dtype=numpy.uint8)
+
+    first = offset + (start // line_bases)*line_width + start % line_bases
+    last = offset + ((stop - 1) // line_bases)*line_width + (stop - 1) % line_bases + 1
+
+    data = numpy.asarray(reference[first:last])
+
+    if line_width > line_bases:
+        data = data[(data != ord('\n')) & (data != ord('\r'))]
+
+    return data
+
+
+"""
+Fraction of bases in runs of a single (valid) base of at least `min_length`
+"""
+def get_homopolymer_fraction(codes, min_length):
+    if len(codes) == 0:
+        return 0.0
+
+    run_starts = numpy.concatenate([[0], numpy.flatnonzero(codes[1:] != codes[:-1]) + 1])
+    run_lengths = numpy.diff(numpy.concatenate([run_starts, [len(codes)]]))
+
+    is_long = (run_lengths >= min_length) & (codes[run_starts] < 4)
+
+    return float(run_lengths[is_long].sum())/len(codes)
+
+
+"""
+Sequence content features of one region. Soft-masked (lowercase) bases in the reference mark repeats, so their fraction
+is the repeat density. The fraction of distinct k-mers among all k-mers of the region is low for tandem repeats and
+other low complexity sequence, which collapse into few graph nodes.
+"""
+def get_region_features(region):
+    name, contig, start, stop, k = region
+
+    if contig not in reference_index:
+        sys.stderr.write("WARNING: contig not in reference index, skipping region: %s\n" % name)
+        return None
+
+    # Regions are given as for samtools (1-based, inclusive)
+    data = get_sequence(reference, reference_index[contig], start - 1, stop)
+    codes = encode_sequence(data.tobytes())
+
+    n = len(codes)
+    n_valid = int(numpy.count_nonzero(codes < 4))
+    n_gc = int(numpy.count_nonzero((codes == 1) | (codes == 2)))
+    n_lowercase = int(numpy.count_nonzero((data >= ord('a')) & (data <= ord('z'))))
+
+    # Sorting in place and counting changes is several times faster than numpy.unique
+    kmers = get_canonical_kmers(codes, k)
+    kmers.sort()
+    n_distinct = int(numpy.count_nonzero(kmers[1:] != kmers[:-1])) + 1 if len(kmers) > 0 else 0
+
+    return {
+        "region": name,
+        "contig": contig,
+        "start": start,
+        "stop": stop,
+        "length": n,
+        "gc_fraction": n_gc/n_valid if n_valid > 0 else 0.0,
+        "n_fraction": (n - n_valid)/n if n > 0 else 0.0,
+        "lowercase_fraction": n_lowercase/n if n > 0 else 0.0,
+        "homopolymer_fraction": get_homopolymer_fraction(codes, HOMOPOLYMER_MIN_LENGTH),
+        "distinct_kmer_count": n_distinct,
+        "distinct_kmer_fraction": n_distinct/len(kmers) if len(kmers) > 0 else 0.0
+    }
+
+
+"""
+Regions from a BED file as written by get_random_intervals.py, named as in the merge_bams_by_interval.py/profile.py
+outputs (contig_start-stop). Duplicate regions are only annotated once.
+"""
+def load_regions(bed_path, k):
+    regions = dict()
+
+    with open(bed_path, 'r') as file:
+        for line in file:
+            if len(line.strip()) == 0 or line.startswith(("#", "track", "browser")):
+                continue
+
+            contig, start, stop = line.strip().split()[:3]
+            name = "%s_%s-%s" % (contig, start, stop)
+
+            regions[name] = (name, contig, int(start), int(stop), k)
+
+    return list(regions.values())
+
+
+"""
+Strip the subsample and thread suffixes that profile.py adds to region names, e.g. chr1_100-200_n20_t4 -> chr1_100-200
+"""
+def get_base_region(region):
+    return re.sub(r"(_n\d+)?(_t\d+)?$", "", region)
+
+
+def annotate_results(results_path, features, output_path):
+    df = pandas.read_table(results_path, sep='\t', header=0)
+
+    df["base_region"] = df["region"].astype(str).map(get_base_region)
+
+    features = features.drop(columns=["contig", "start", "stop"]).rename(columns={"region": "base_region"})
+    df = df.merge(features, on="base_region", how="left").drop(columns=["base_region"])
+
+    n_missing = int(df["gc_fraction"].isna().sum())
+    if n_missing > 0:
+        sys.stderr.write("WARNING: %d of %d result rows have no region features (region not in BED?)\n" % (n_missing, len(df)))
+
+    df.to_csv(output_path, sep='\t', index=False)
+    sys.stderr.write("Annotated results written to: %s\n" % output_path)
+
+
+def main(reference_path, bed_path, k, n_cores, output_directory, results_path=None):
+    output_directory = os.path.abspath(output_directory)
+
+    if not os.path.exists(output_directory):
+        os.makedirs(output_directory)
+
+    fai_path = reference_path + ".fai"
+    if not os.path.exists(fai_path):
+        exit("ERROR: reference has no .fai index (run samtools faidx on it): %s" % reference_path)
+
+    if reference_path.endswith(".gz"):
+        exit("ERROR: reference must be uncompressed to be memory mapped: %s" % reference_path)
+
+    regions = load_regions(bed_path, k)
+
+    t = time.perf_counter()
+
+    with Pool(processes=n_cores, initializer=init_worker, initargs=(reference_path, fai_path)) as pool:
+        # Large chunks keep the per-task overhead small relative to the few milliseconds each region takes
+        chunk_size = max(1, min(1000, len(regions)//(4*n_cores)))
+        features = [f for f in pool.imap(get_region_features, regions, chunksize=chunk_size) if f is not None]
+
+    seconds = time.perf_counter() - t
+    sys.stderr.write("Annotated %d regions in %.2fs (%.0f regions/s)\n" % (len(regions), seconds, len(regions)/max(seconds, 1e-9)))
+
+    features = pandas.DataFrame(features, columns=FEATURE_COLUMNS)
+
+    features_path = os.path.join(output_directory, "region_features.tsv")
+    features.to_csv(features_path, sep='\t', index=False)
+    sys.stderr.write("Region features written to: %s\n" % features_path)
+
+    if results_path is not None:
+        output_name = os.path.basename(results_path).rsplit('.', 1)[0] + "_annotated.tsv"
+        annotate_results(results_path, features, os.path.join(output_directory, output_name))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+
+    parser.add_argument(
+        "--reference",
+        required=True,
+        type=str,
+        help="Uncompressed reference FASTA with a samtools .fai index next to it. Soft-masked (lowercase) bases are "
+             "counted as repeats"
+    )
+
+    parser.add_argument(
+        "--bed",
+        required=True,
+        type=str,
+        help="BED file of regions, as given to merge_bams_by_interval.py (e.g. from get_random_intervals.py)"
+    )
+
+    parser.add_argument(
+        "-k",
+        required=False,
+        default=31,
+        type=int,
+        help="K-mer length used for the distinct k-mer features (at most 32)"
+    )
+
+    parser.add_argument(
+        "-c",
+        required=False,
+        default=1,
+        type=int,
+        help="Number of processes to use"
+    )
+
+    parser.add_argument(
+        "--results",
+        required=False,
+        default=None,
+        type=str,
+        help="Consolidated results table (TSV) from compare_profile_results.py. If given, the region features are "
+             "joined to it by region name and written as <name>_annotated.tsv, for use as fit_scaling_models.py features"
+    )
+
+    parser.add_argument(
+        "-o",
+        required=True,
+        type=str,
+        help="Output directory"
+    )
+
+    args = parser.parse_args()
+
+    main(
+        reference_path=args.reference,
+        bed_path=args.bed,
+        k=args.k,
+        n_cores=args.c,
+        output_directory=args.o,
+        results_path=args.results
+    )
@@ -0,0 +1,226 @@
+from compare_profile_results import get_region_stats_for_tarball, plot_scatter, plot_density
+import generate_synthetic_workload
+import convert_ggcat_fasta_to_gfa
+import profile
+
+from matplotlib import pyplot
+import argparse
+import tarfile
+import time
+import sys
+import os
+
+
+class Stage:
+    def __init__(self, name, n_items, n_bytes, seconds):
+        self.name = name
+        self.n_items = n_items
+        self.n_bytes = n_bytes
+        self.seconds = seconds
+
+    def to_tsv_line(self):
+        seconds = max(self.seconds, 1e-9)
+
+        return "%s\t%d\t%d\t%.4f\t%.2f\t%.2f\n" % (
+            self.name,
+            self.n_items,
+            self.n_bytes,
+            self.seconds,
+            self.n_items/seconds,
+            float(self.n_bytes)/1e6/seconds)
+
+
+def get_total_size(paths):
+    return sum(os.path.getsize(p) for p in paths)
+
+
+def list_tarballs(directory):
+    return sorted([os.path.join(directory, x) for x in os.listdir(directory) if x.endswith(".tar.gz")])
+
+
+"""
+Run profile.main on the region tarballs with the no-op 'test' builder, so that only the extraction, FASTA combination
+and archiving overhead of the pipeline itself is measured
+"""
+def benchmark_extraction(region_tarballs, output_directory):
+    t = time.perf_counter()
+    profile.main(tar_paths=region_tarballs, k=31, graph_builder="test", n_cores=1, timeout=60, n_samples=None, output_directory=output_directory)
+    seconds = time.perf_counter() - t
+
+    return Stage("extraction", len(region_tarballs), get_total_size(region_tarballs), seconds)
+
+
+def benchmark_conversion(ggcat_tarballs, output_directory):
+    fasta_directory = os.path.join(output_directory, "fasta")
+    gfa_directory = os.path.join(output_directory, "gfa")
+
+    # Extraction is not part of this stage
+    fasta_paths = list()
+    for tar_path in ggcat_tarballs:
+        with tarfile.open(tar_path, "r:gz") as tar:
+            for item in tar.getmembers():
+                if os.path.basename(item.name) == "ggcat.fasta":
+                    item.name = os.path.basename(tar_path).split('.')[0] + ".fasta"
+                    tar.extract(item, fasta_directory)
+                    fasta_paths.append(os.path.join(fasta_directory, item.name))
+
+    t = time.perf_counter()
+    for fasta_path in fasta_paths:
+        gfa_path = os.path.join(gfa_directory, os.path.basename(fasta_path).replace(".fasta", ".gfa"))
+        convert_ggcat_fasta_to_gfa.main(fasta_path=fasta_path, output_path=gfa_path, no_sequence=False)
+    seconds = time.perf_counter() - t
+
+    return Stage("conversion", len(fasta_paths), get_total_size(fasta_paths), seconds)
+
+
+def benchmark_parsing(result_tarballs):
+    t = time.perf_counter()
+    stats = [get_region_stats_for_tarball(p) for p in result_tarballs]
+    seconds = time.perf_counter() - t
+
+    return Stage("parsing", len(result_tarballs), get_total_size(result_tarballs), seconds), stats
+
+
+def benchmark_plotting(stats, mode, output_directory):
+    pyplot.switch_backend("Agg")
+
+    x = [s["total_coverage"] for s in stats]
+    y_elapsed = [s["elapsed_real_min"] for s in stats]
+    y_ram = [s["ram_max_mbyte"] for s in stats]
+    y_cpu = [s["cpu_percent"] for s in stats]
+
+    plot_path = os.path.join(output_directory, "resource_usage_%s.png" % mode)
+
+    t = time.perf_counter()
+    fig,axes = pyplot.subplots(nrows=2,ncols=2)
+
+    if mode == "scatter":
+        plot_scatter(axes, x, y_elapsed, y_ram, y_cpu, color="black")
+    else:
+        plot_density(axes, x, y_elapsed, y_ram, y_cpu, color="black", name="benchmark", axes_x_max=max(x)+1, gridsize=200)
+
+    fig.savefig(plot_path, dpi=200)
+    pyplot.close(fig)
+    seconds = time.perf_counter() - t
+
+    return Stage("plotting_" + mode, len(stats), os.path.getsize(plot_path), seconds)
+
+
+def main(output_directory, n_regions, region_length, n_samples, depth, read_length, seed):
+    output_directory = os.path.abspath(output_directory)
+
+    if os.path.exists(output_directory):
+        exit("ERROR: output directory exists already: %s" % output_directory)
+
+    workload_directory = os.path.join(output_directory, "workload")
+
+    t = time.perf_counter()
+    workload = generate_synthetic_workload.main(
+        output_directory=workload_directory,
+        n_regions=n_regions,
+        region_length=region_length,
+        n_samples=n_samples,
+        depth=depth,
+        read_length=read_length,
+        k=31,
+        seed=seed)
+    seconds = time.perf_counter() - t
+
+    region_tarballs = list_tarballs(workload["regions"])
+
+    stages = [Stage("generation", n_regions, workload["fasta_bytes"], seconds)]
+
+    stages.append(benchmark_extraction(region_tarballs, os.path.join(output_directory, "extraction")))
+
+    ggcat_tarballs = list_tarballs(os.path.join(workload["results"], "ggcat"))
+    stages.append(benchmark_conversion(ggcat_tarballs, os.path.join(output_directory, "conversion")))
+
+    result_tarballs = list()
+    for tool in sorted(os.listdir(workload["results"])):
+        result_tarballs.extend(list_tarballs(os.path.join(workload["results"], tool)))
+
+    stage, stats = benchmark_parsing(result_tarballs)
+    stages.append(stage)
+
+    for mode in ["scatter", "density"]:
+        stages.append(benchmark_plotting(stats, mode, output_directory))
+
+    report_path = os.path.join(output_directory, "benchmark.tsv")
+    with open(report_path, 'w') as file:
+        file.write("stage\titems\tbytes\tseconds\titems_per_s\tMB_per_s\n")
+        for stage in stages:
+            file.write(stage.to_tsv_line())
+
+    with open(report_path, 'r') as file:
+        sys.stdout.write(file.read())
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+
+    parser.add_argument(
+        "--regions",
+        required=False,
+        default=10,
+        type=int,
+        help="Number of regions to generate"
+    )
+
+    parser.add_argument(
+        "--length",
+        required=False,
+        default=10000,
+        type=int,
+        help="Length of each region"
+    )
+
+    parser.add_argument(
+        "-n",
+        required=False,
+        default=4,
+        type=int,
+        help="Number of samples per region"
+    )
+
+    parser.add_argument(
+        "-d",
+        required=False,
+        default=10,
+        type=float,
+        help="Read depth per sample"
+    )
+
+    parser.add_argument(
+        "-r",
+        required=False,
+        default=150,
+        type=int,
+        help="Read length"
+    )
+
+    parser.add_argument(
+        "--seed",
+        required=False,
+        default=0,
+        type=int,
+        help="Random seed"
+    )
+
+    parser.add_argument(
+        "-o",
+        required=True,
+        type=str,
+        help="Output directory (must not exist)"
+    )
+
+    args = parser.parse_args()
+
+    main(
+        output_directory=args.o,
+        n_regions=args.regions,
+        region_length=args.length,
+        n_samples=args.n,
+        depth=args.d,
+        read_length=args.r,
+        seed=args.seed
+    )
@@ -0,0 +1,232 @@
+from merge_bams_by_interval import get_region_view_args, get_region_coverage, get_reads_from_bam, set_reference_environment, parse_comma_separated_string
+from module.Authenticator import GoogleToken
+
+import subprocess
+import argparse
+import hashlib
+import tempfile
+import shutil
+import time
+import sys
+import os
+
+
+"""
+Bytes received on all network interfaces of this network namespace, from /proc/net/dev. Regions are extracted one at
+a time, so the difference before and after one samtools call is (mostly) the bytes it transferred.
+"""
+def get_network_rx_bytes():
+    total = 0
+
+    with open("/proc/net/dev", 'r') as file:
+        for l,line in enumerate(file):
+            # Two header lines
+            if l < 2:
+                continue
+
+            interface, data = line.split(':', 1)
+
+            if interface.strip() != "lo":
+                total += int(data.split()[0])
+
+    return total
+
+
+"""
+Run a command and measure it: wall time, CPU time, and bytes read through read() syscalls (rchar from /proc/pid/io,
+which covers local files and pipes but not sockets). /proc/pid/io is read after the process exits but before it is
+reaped, so nothing is missed at the end of the run.
+"""
+def run_measured(args):
+    sys.stderr.write(" ".join(args)+'\n')
+
+    rx_start = get_network_rx_bytes()
+    t = time.perf_counter()
+
+    process = subprocess.Popen(args, stderr=subprocess.DEVNULL)
+
+    os.waitid(os.P_PID, process.pid, os.WEXITED | os.WNOWAIT)
+
+    io = dict()
+    with open("/proc/%d/io" % process.pid, 'r') as file:
+        for line in file:
+            key, value = line.split(':')
+            io[key] = int(value)
+
+    pid, status, rusage = os.wait4(process.pid, 0)
+    process.returncode = os.waitstatus_to_exitcode(status)
+
+    return {
+        "success": process.returncode == 0,
+        "seconds": time.perf_counter() - t,
+        "cpu_s": rusage.ru_utime + rusage.ru_stime,
+        "rchar": io.get("rchar", 0),
+        "rx_bytes": get_network_rx_bytes() - rx_start
+    }
+
+
+def get_file_digest(path):
+    digest = hashlib.sha256()
+
+    with open(path, 'rb') as file:
+        for chunk in iter(lambda: file.read(1024*1024), b''):
+            digest.update(chunk)
+
+    return digest.hexdigest()
+
+
+def benchmark_region(alignment_path, contig, start, stop, reference_path, token, working_directory):
+    region_string = "%s:%d-%d" % (contig, start, stop)
+    sample_name = os.path.basename(alignment_path).split('.')[0]
+    file_format = "cram" if alignment_path.endswith(".cram") else "bam"
+
+    local_bam_path = os.path.join(working_directory, sample_name + ".bam")
+    fasta_path = os.path.join(working_directory, sample_name + ".fasta")
+
+    token.update_environment()
+
+    args = get_region_view_args(alignment_path, local_bam_path, region_string, reference_path if file_format == "cram" else None)
+    result = run_measured(args)
+
+    result.update({
+        "sample": sample_name,
+        "format": file_format,
+        "region": region_string,
+        "local_bam_bytes": os.path.getsize(local_bam_path) if os.path.exists(local_bam_path) else 0,
+        "fasta_sha256": None,
+        "coverage_sha256": None
+    })
+
+    if result["success"]:
+        subprocess.run(["samtools", "index", local_bam_path], check=True)
+
+        coverage = get_region_coverage(local_bam_path, contig, start, stop, token)
+        get_reads_from_bam(local_bam_path, fasta_path, token)
+
+        # Both formats must produce the same region FASTA and coverage row for the same sample
+        result["fasta_sha256"] = get_file_digest(fasta_path)
+        if coverage is not None:
+            result["coverage_sha256"] = hashlib.sha256(coverage[1].encode("utf8")).hexdigest()
+
+    for path in [local_bam_path, local_bam_path + ".bai", fasta_path]:
+        if os.path.exists(path):
+            os.remove(path)
+
+    return result
+
+
+def main(alignment_paths, bed_path, reference_path, ref_cache, output_directory):
+    output_directory = os.path.abspath(output_directory)
+
+    if not os.path.exists(output_directory):
+        os.makedirs(output_directory)
+
+    set_reference_environment(reference_path, ref_cache)
+
+    token = GoogleToken()
+
+    regions = list()
+    with open(bed_path, 'r') as file:
+        for line in file:
+            contig,start,stop = line.strip().split()[:3]
+            regions.append((contig, int(start), int(stop)))
+
+    columns = ["sample", "format", "region", "success", "seconds", "cpu_s", "rchar", "rx_bytes", "local_bam_bytes", "fasta_sha256", "coverage_sha256"]
+    results = list()
+
+    working_directory = tempfile.mkdtemp(dir=output_directory)
+
+    output_path = os.path.join(output_directory, "region_extraction_benchmark.tsv")
+    with open(output_path, 'w') as file:
+        file.write("\t".join(columns) + '\n')
+
+        # One extraction at a time, so that the network counters are attributable to it
+        for contig,start,stop in regions:
+            for alignment_path in alignment_paths:
+                result = benchmark_region(alignment_path, contig, start, stop, reference_path, token, working_directory)
+                results.append(result)
+
+                file.write("\t".join([str(result[c]) for c in columns]) + '\n')
+                file.flush()
+
+    shutil.rmtree(working_directory)
+
+    # Per format totals
+    for file_format in sorted(set(r["format"] for r in results)):
+        subset = [r for r in results if r["format"] == file_format]
+
+        sys.stderr.write("%s: %d extractions, %.2fs wall, %.2fs cpu, %.2fMB received, %.2fMB read\n" % (
+            file_format,
+            len(subset),
+            sum(r["seconds"] for r in subset),
+            sum(r["cpu_s"] for r in subset),
+            sum(r["rx_bytes"] for r in subset)/1e6,
+            sum(r["rchar"] for r in subset)/1e6))
+
+    # Check that BAM and CRAM copies of the same sample gave identical outputs
+    outputs = dict()
+    n_mismatches = 0
+    for r in results:
+        key = (r["sample"], r["region"])
+        value = (r["fasta_sha256"], r["coverage_sha256"])
+
+        if key in outputs and outputs[key] != value:
+            sys.stderr.write("ERROR: outputs differ between formats for %s %s\n" % key)
+            n_mismatches += 1
+
+        outputs.setdefault(key, value)
+
+    sys.stderr.write("Outputs differing between formats: %d\n" % n_mismatches)
+    sys.stderr.write("Results written to: %s\n" % output_path)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+
+    parser.add_argument(
+        "--alignments",
+        required=True,
+        type=parse_comma_separated_string,
+        help="BAMs and/or CRAMs to extract from (comma separated). Copies of the same sample in both formats should "
+             "share a basename (e.g. HG002.bam, HG002.cram) so that their outputs are compared"
+    )
+
+    parser.add_argument(
+        "--bed",
+        required=True,
+        type=str,
+        help="BED file containing the regions to extract"
+    )
+
+    parser.add_argument(
+        "--reference",
+        required=False,
+        default=None,
+        type=str,
+        help="Local FASTA reference used to decode CRAM inputs"
+    )
+
+    parser.add_argument(
+        "--ref_cache",
+        required=False,
+        default=None,
+        type=str,
+        help="Shared directory of reference sequences by MD5, used for REF_CACHE/REF_PATH"
+    )
+
+    parser.add_argument(
+        "-o",
+        required=True,
+        type=str,
+        help="Output directory"
+    )
+
+    args = parser.parse_args()
+
+    main(
+        alignment_paths=args.alignments,
+        bed_path=args.bed,
+        reference_path=args.reference,
+        ref_cache=args.ref_cache,
+        output_directory=args.o
+    )
@@ -0,0 +1,363 @@
+from module.Kmer import write_partitions, get_distinct_kmers, reverse_complement_kmers, DECODING, MAX_K
+from module.Edge import Edge
+
+from multiprocessing import Pool
+import argparse
+import tempfile
+import shutil
+import numpy
+import time
+import sys
+import os
+
+
+"""
+Reference compacted de Bruijn graph builder in NumPy, needing no external binaries. It builds the same graph as ggcat
+with --min-multiplicity 1 (every k-mer of the input, canonical, with maximal non-branching unitigs), and writes it as
+GFA in the same form as convert_ggcat_fasta_to_gfa.py output, so that either can be checked against the other with
+compare_graph_kmers.py or compute_graph_stats.py.
+
+Nodes are oriented: vertex 2*i is the canonical k-mer i as stored, and vertex 2*i + 1 is its reverse complement, so the
+mirror of any vertex v is v ^ 1. K-mers are limited to odd k, so that no k-mer is its own reverse complement.
+"""
+
+# Set once per worker process by init_worker
+kmers = None
+k_value = None
+
+
+def init_worker(kmers_path, k):
+    global kmers, k_value
+
+    # Memory mapped, so all workers share one copy of the sorted k-mers
+    kmers = numpy.load(kmers_path, mmap_mode='r')
+    k_value = k
+
+
+def unique_partition(path):
+    result = get_distinct_kmers(numpy.fromfile(path, dtype=numpy.uint64))
+    os.remove(path)
+
+    return result
+
+
+"""
+Find the vertex of each (oriented) k-mer value in the sorted canonical k-mers. Returns the vertex ids, and a mask of
+which values are present at all.
+"""
+def find_vertices(values, kmers, k):
+    reverse = reverse_complement_kmers(values, k)
+    canonical = numpy.minimum(values, reverse)
+
+    # Binary search is many times faster for sorted keys, since consecutive searches touch the same cache lines
+    order = numpy.argsort(canonical)
+    index = numpy.empty(len(canonical), dtype=numpy.int64)
+    index[order] = numpy.searchsorted(kmers, canonical[order])
+    found = index < len(kmers)
+    found[found] = kmers[index[found]] == canonical[found]
+
+    vertices = 2*index.astype(numpy.int64) + (values != canonical)
+
+    return vertices, found
+
+
+"""
+Successors of the given vertices: each one can be followed by at most 4 k-mers, one per appended base. Returns the
+successor vertices as an array of shape (n, 4), and a mask of which of them exist.
+"""
+def get_successors(vertices, kmers, k):
+    mask = numpy.uint64((1 << (2*k)) - 1)
+
+    values = kmers[vertices >> 1]
+    is_reverse = (vertices & 1) == 1
+    values = numpy.where(is_reverse, reverse_complement_kmers(values, k), values)
+
+    candidates = ((values[:,None] << numpy.uint64(2)) | numpy.arange(4, dtype=numpy.uint64)[None,:]) & mask
+
+    successors, found = find_vertices(candidates.ravel(), kmers, k)
+
+    return successors.reshape(-1, 4), found.reshape(-1, 4)
+
+
+"""
+Out-degree of both orientations of the k-mers in [start, stop), and their successor where the out-degree is 1 (else -1)
+"""
+def get_out_edges(bounds):
+    start, stop = bounds
+
+    vertices = numpy.arange(2*start, 2*stop, dtype=numpy.int64)
+    successors, found = get_successors(vertices, kmers, k_value)
+
+    degree = found.sum(axis=1).astype(numpy.uint8)
+
+    # With exactly one successor, argmax finds which of the 4 it is
+    unique = numpy.full(len(vertices), -1, dtype=numpy.int64)
+    is_unique = degree == 1
+    unique[is_unique] = successors[is_unique, numpy.argmax(found[is_unique], axis=1)]
+
+    return degree, unique
+
+
+"""
+Pointer jumping (Wyllie's list ranking) over `pred`, where heads point to themselves. Returns the head of every vertex
+and its distance from it, after at most log2(n) vectorized rounds. Vertices on cycles never reach a head.
+"""
+def rank_vertices(pred):
+    n = len(pred)
+    is_head = pred < 0
+
+    pointer = numpy.where(is_head, numpy.arange(n, dtype=numpy.int64), pred)
+    rank = (~is_head).astype(numpy.int64)
+
+    for i in range(max(1, n.bit_length()) + 1):
+        next_pointer = pointer[pointer]
+
+        if numpy.array_equal(next_pointer, pointer):
+            break
+
+        # Heads have rank 0, so vertices that already reach their head stop accumulating
+        rank = rank + rank[pointer]
+        pointer = next_pointer
+
+    return pointer, rank
+
+
+"""
+Cut every cycle of compactable edges (circular unitigs) at its lowest vertex, so that all unitigs are linear chains
+"""
+def cut_cycles(succ, pred, on_cycle):
+    cycle_vertices = numpy.flatnonzero(on_cycle)
+
+    # Minimum over each cycle by pointer jumping along it, within the cycle vertices only
+    position = numpy.full(len(succ), -1, dtype=numpy.int64)
+    position[cycle_vertices] = numpy.arange(len(cycle_vertices))
+
+    pointer = position[succ[cycle_vertices]]
+    minimum = cycle_vertices.copy()
+
+    for i in range(max(1, len(cycle_vertices).bit_length()) + 1):
+        minimum = numpy.minimum(minimum, minimum[pointer])
+        pointer = pointer[pointer]
+
+    heads = cycle_vertices[minimum == cycle_vertices]
+
+    succ[pred[heads]] = -1
+    pred[heads] = -1
+
+    return len(heads)
+
+
+def decode_kmers(values, k):
+    shifts = numpy.uint64(2)*numpy.arange(k - 1, -1, -1, dtype=numpy.uint64)
+    codes = (values[:,None] >> shifts[None,:]) & numpy.uint64(3)
+
+    return DECODING[codes]
+
+
+def build_graph(fasta_path, output_path, k, n_threads, n_partitions, batch_size, chunk_size, tmp_directory):
+    t = time.perf_counter()
+
+    with Pool(n_threads) as pool:
+        partition_paths = write_partitions(fasta_path, k, n_partitions, batch_size, pool, os.path.join(tmp_directory, "partitions"))
+        kmers = numpy.concatenate([numpy.zeros(0, dtype=numpy.uint64)] + pool.map(unique_partition, partition_paths))
+
+    kmers.sort()
+    n = len(kmers)
+
+    sys.stderr.write("Found %d distinct canonical k-mers in %.2fs\n" % (n, time.perf_counter() - t))
+
+    kmers_path = os.path.join(tmp_directory, "kmers.npy")
+    numpy.save(kmers_path, kmers)
+
+    # Adjacency of every oriented vertex, in chunks so that the (n, 4) candidate arrays stay small
+    t = time.perf_counter()
+    bounds = [(start, min(n, start + chunk_size)) for start in range(0, n, chunk_size)]
+
+    with Pool(n_threads, initializer=init_worker, initargs=(kmers_path, k)) as pool:
+        results = pool.map(get_out_edges, bounds)
+
+    degree = numpy.concatenate([numpy.zeros(0, dtype=numpy.uint8)] + [r[0] for r in results])
+    unique = numpy.concatenate([numpy.zeros(0, dtype=numpy.int64)] + [r[1] for r in results])
+    del results
+
+    # An edge v -> w is compacted if it is the only edge out of v and into w. The edges into w are the mirrors of the
+    # edges out of its mirror. Edges from a k-mer to itself (either orientation) are never compacted.
+    vertices = numpy.arange(2*n, dtype=numpy.int64)
+    is_compactable = (unique >= 0)
+    is_compactable[is_compactable] = (degree[unique[is_compactable] ^ 1] == 1) & ((unique[is_compactable] >> 1) != (vertices[is_compactable] >> 1))
+
+    succ = numpy.where(is_compactable, unique, -1)
+    pred = numpy.full(2*n, -1, dtype=numpy.int64)
+    pred[succ[is_compactable]] = vertices[is_compactable]
+    del unique, is_compactable
+
+    head, rank = rank_vertices(pred)
+
+    on_cycle = pred[head] >= 0
+    if numpy.any(on_cycle):
+        n_cycles = cut_cycles(succ, pred, on_cycle)
+        sys.stderr.write("Cut %d circular unitigs\n" % n_cycles)
+
+        head, rank = rank_vertices(pred)
+
+    # Every unitig is found once per strand, keep the strand whose head has the lower id
+    keep = head <= head[vertices ^ 1]
+
+    # Order the kept vertices by unitig (head id) and position within it, by counting rather than sorting
+    sizes = numpy.bincount(head[keep], minlength=2*n)
+    offsets = numpy.cumsum(sizes) - sizes
+
+    kept = numpy.empty(numpy.count_nonzero(keep), dtype=numpy.int64)
+    kept[offsets[head[keep]] + rank[keep]] = vertices[keep]
+    del sizes, offsets
+
+    is_start = rank[kept] == 0
+    starts = numpy.flatnonzero(is_start)
+    n_unitigs = len(starts)
+
+    unitig_ids = numpy.full(2*n, -1, dtype=numpy.int64)
+    unitig_ids[kept[starts]] = numpy.arange(n_unitigs)
+
+    sys.stderr.write("Compacted into %d unitigs in %.2fs\n" % (n_unitigs, time.perf_counter() - t))
+
+    # Sequences: the full k-mer of the first vertex of each unitig, then the last base of each vertex after it
+    values = kmers[kept >> 1]
+    values = numpy.where((kept & 1) == 1, reverse_complement_kmers(values, k), values)
+
+    lengths = numpy.where(is_start, k, 1)
+    offsets = numpy.concatenate([[0], numpy.cumsum(lengths)])
+
+    sequence = numpy.zeros(offsets[-1], dtype=numpy.uint8)
+    sequence[offsets[:-1][~is_start]] = DECODING[values[~is_start] & numpy.uint64(3)]
+    sequence[offsets[:-1][starts][:,None] + numpy.arange(k)[None,:]] = decode_kmers(values[starts], k)
+
+    sequence_bounds = numpy.append(offsets[starts], offsets[-1])
+    sequence = sequence.tobytes()
+
+    # Links leave the last vertex of each unitig (+), and the mirror of its first vertex (-). They always arrive at the
+    # first vertex of a unitig, which is either kept as is (+), or is the mirror of the last vertex of a kept unitig (-).
+    ends = numpy.append(starts, len(kept))[1:] - 1
+    sources = numpy.concatenate([kept[ends], kept[starts] ^ 1])
+    source_ids = numpy.tile(numpy.arange(n_unitigs), 2)
+    source_reversals = numpy.repeat([False, True], n_unitigs)
+
+    edges = set()
+
+    if len(sources) > 0:
+        successors, found = get_successors(sources, kmers, k)
+        source_index, column = numpy.nonzero(found)
+        targets = successors[source_index, column]
+
+        target_reversals = unitig_ids[targets] < 0
+        target_ids = numpy.where(target_reversals, unitig_ids[head[targets ^ 1]], unitig_ids[targets])
+
+        for a,reversal_a,b,reversal_b in zip(source_ids[source_index].tolist(), source_reversals[source_index].tolist(), target_ids.tolist(), target_reversals.tolist()):
+            e = Edge(str(a), reversal_a, str(b), reversal_b)
+            e.canonicalize()
+            edges.add(e.to_gfa_line())
+
+    with open(output_path, 'w') as file:
+        file.write("H\tVN:Z:1.0\n")
+
+        for i in range(n_unitigs):
+            file.write("S\t%d\t%s\n" % (i, sequence[sequence_bounds[i]:sequence_bounds[i+1]].decode("ascii")))
+
+        for line in sorted(edges):
+            file.write(line)
+            file.write('\n')
+
+    sys.stderr.write("Wrote %d unitigs and %d links to: %s\n" % (n_unitigs, len(edges), output_path))
+
+
+def main(fasta_path, output_path, k, n_threads, n_partitions, batch_size, chunk_size):
+    if k > MAX_K or k % 2 == 0:
+        exit("ERROR: k must be odd and at most %d: %d" % (MAX_K - 1, k))
+
+    if not os.path.exists(fasta_path):
+        exit("ERROR: input FASTA not found: %s" % fasta_path)
+
+    if not output_path.endswith(".gfa"):
+        exit("ERROR: output path does not have GFA suffix: " + output_path)
+
+    output_directory = os.path.dirname(os.path.abspath(output_path))
+
+    if not os.path.exists(output_directory):
+        os.makedirs(output_directory)
+
+    # Partitions and the k-mer array are kept next to the output, which is on the (scratch) working disk in profile.py
+    tmp_directory = tempfile.mkdtemp(dir=output_directory)
+
+    try:
+        build_graph(fasta_path, output_path, k, n_threads, n_partitions, batch_size, chunk_size, tmp_directory)
+    finally:
+        shutil.rmtree(tmp_directory)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+
+    parser.add_argument(
+        "-i",
+        required=True,
+        type=str,
+        help="Input FASTA (optionally gzipped), e.g. the combined reads of one region"
+    )
+
+    parser.add_argument(
+        "-o",
+        required=True,
+        type=str,
+        help="Output GFA path"
+    )
+
+    parser.add_argument(
+        "-k",
+        required=False,
+        default=31,
+        type=int,
+        help="K-mer length (odd, at most 31)"
+    )
+
+    parser.add_argument(
+        "-c",
+        required=False,
+        default=1,
+        type=int,
+        help="Number of processes to use"
+    )
+
+    parser.add_argument(
+        "--partitions",
+        required=False,
+        default=16,
+        type=int,
+        help="Number of hash partitions that k-mers are spilled to before deduplication. More partitions use less memory"
+    )
+
+    parser.add_argument(
+        "--batch_size",
+        required=False,
+        default=2_000_000,
+        type=int,
+        help="Approximate number of bases per batch of sequences. Each process holds the k-mers of one batch at a time"
+    )
+
+    parser.add_argument(
+        "--chunk_size",
+        required=False,
+        default=1_000_000,
+        type=int,
+        help="Number of k-mers per chunk when finding edges"
+    )
+
+    args = parser.parse_args()
+
+    main(
+        fasta_path=args.i,
+        output_path=args.o,
+        k=args.k,
+        n_threads=args.c,
+        n_partitions=args.partitions,
+        batch_size=args.batch_size,
+        chunk_size=args.chunk_size
+    )
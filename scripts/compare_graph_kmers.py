@@ -0,0 +1,226 @@
+from module.Kmer import get_canonical_kmers_of_sequences, iterate_sequence_batches, hash_kmers, decode_kmer, write_partitions
+
+from multiprocessing import Pool
+import argparse
+import tempfile
+import shutil
+import numpy
+import json
+import os
+
+
+"""
+Compare one partition of each graph by sorting and merging. Returns the set sizes, the intersection size, and up to
+`max_differences` k-mers unique to each side.
+"""
+def compare_partition(path_a, path_b, max_differences):
+    a = numpy.unique(numpy.fromfile(path_a, dtype=numpy.uint64))
+    b = numpy.unique(numpy.fromfile(path_b, dtype=numpy.uint64))
+
+    n_intersection = len(numpy.intersect1d(a, b, assume_unique=True))
+
+    only_a = numpy.setdiff1d(a, b, assume_unique=True)[:max_differences]
+    only_b = numpy.setdiff1d(b, a, assume_unique=True)[:max_differences]
+
+    os.remove(path_a)
+    os.remove(path_b)
+
+    return len(a), len(b), n_intersection, only_a, only_b
+
+
+"""
+Bottom-s MinHash sketch of one batch of sequences
+"""
+def sketch_batch(sequences, k, sketch_size):
+    hashes = numpy.unique(hash_kmers(get_canonical_kmers_of_sequences(sequences, k)))
+
+    return hashes[:sketch_size]
+
+
+def sketch_batch_star(args):
+    return sketch_batch(*args)
+
+
+def get_sketch(path, k, sketch_size, batch_size, pool):
+    sketch = numpy.zeros(0, dtype=numpy.uint64)
+
+    args = ((batch, k, sketch_size) for batch in iterate_sequence_batches(path, batch_size))
+
+    for batch_sketch in pool.imap(sketch_batch_star, args):
+        sketch = numpy.union1d(sketch, batch_sketch)[:sketch_size]
+
+    return sketch
+
+
+def estimate_jaccard(sketch_a, sketch_b, sketch_size):
+    union = numpy.union1d(sketch_a, sketch_b)[:sketch_size]
+
+    if len(union) == 0:
+        return 0.0
+
+    in_both = numpy.isin(union, sketch_a, assume_unique=True) & numpy.isin(union, sketch_b, assume_unique=True)
+
+    return float(numpy.count_nonzero(in_both))/len(union)
+
+
+def compare_exact(path_a, path_b, k, n_threads, n_partitions, batch_size, max_differences, tmp_directory):
+    with Pool(n_threads) as pool:
+        partitions_a = write_partitions(path_a, k, n_partitions, batch_size, pool, os.path.join(tmp_directory, "a"))
+        partitions_b = write_partitions(path_b, k, n_partitions, batch_size, pool, os.path.join(tmp_directory, "b"))
+
+        args = [[partitions_a[p], partitions_b[p], max_differences] for p in range(n_partitions)]
+        results = pool.starmap(compare_partition, args)
+
+    n_a = sum(r[0] for r in results)
+    n_b = sum(r[1] for r in results)
+    n_intersection = sum(r[2] for r in results)
+    n_union = n_a + n_b - n_intersection
+
+    only_a = numpy.concatenate([r[3] for r in results])[:max_differences]
+    only_b = numpy.concatenate([r[4] for r in results])[:max_differences]
+
+    report = {
+        "method": "exact",
+        "kmers_a": n_a,
+        "kmers_b": n_b,
+        "kmers_intersection": n_intersection,
+        "kmers_only_a": n_a - n_intersection,
+        "kmers_only_b": n_b - n_intersection,
+        "jaccard": float(n_intersection)/n_union if n_union > 0 else 0.0,
+    }
+
+    return report, only_a, only_b
+
+
+def main(path_a, path_b, k, n_threads, n_partitions, batch_size, sketch_size, max_differences, output_directory):
+    output_directory = os.path.abspath(output_directory)
+
+    if not os.path.exists(output_directory):
+        os.makedirs(output_directory)
+
+    for path in [path_a, path_b]:
+        if not os.path.exists(path):
+            exit("ERROR: input graph not found: %s" % path)
+
+    if sketch_size is not None:
+        with Pool(n_threads) as pool:
+            sketch_a = get_sketch(path_a, k, sketch_size, batch_size, pool)
+            sketch_b = get_sketch(path_b, k, sketch_size, batch_size, pool)
+
+        report = {
+            "method": "minhash",
+            "sketch_size": sketch_size,
+            "jaccard": estimate_jaccard(sketch_a, sketch_b, sketch_size)
+        }
+    else:
+        tmp_directory = tempfile.mkdtemp(dir=output_directory)
+
+        try:
+            report, only_a, only_b = compare_exact(path_a, path_b, k, n_threads, n_partitions, batch_size, max_differences, tmp_directory)
+        finally:
+            shutil.rmtree(tmp_directory)
+
+        # Write a sample of the differing k-mers, to help find out why the tools disagree
+        differences_path = os.path.join(output_directory, "kmer_differences.tsv")
+        with open(differences_path, 'w') as file:
+            file.write("graph\tkmer\n")
+            for kmer in only_a:
+                file.write("a\t%s\n" % decode_kmer(kmer, k))
+            for kmer in only_b:
+                file.write("b\t%s\n" % decode_kmer(kmer, k))
+
+    report["a"] = os.path.abspath(path_a)
+    report["b"] = os.path.abspath(path_b)
+    report["k"] = k
+
+    print(json.dumps(report, indent=2))
+
+    with open(os.path.join(output_directory, "kmer_comparison.json"), 'w') as file:
+        json.dump(report, file, indent=2)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+
+    parser.add_argument(
+        "-a",
+        required=True,
+        type=str,
+        help="First graph: GFA with sequences (e.g. Bifrost output, or convert_ggcat_fasta_to_gfa.py output), or unitig FASTA"
+    )
+
+    parser.add_argument(
+        "-b",
+        required=True,
+        type=str,
+        help="Second graph, in any of the same formats"
+    )
+
+    parser.add_argument(
+        "-k",
+        required=False,
+        default=31,
+        type=int,
+        help="K value to use for extracting k-mers (<= 32)"
+    )
+
+    parser.add_argument(
+        "-t",
+        required=False,
+        default=1,
+        type=int,
+        help="Number of threads to use"
+    )
+
+    parser.add_argument(
+        "--partitions",
+        required=False,
+        default=64,
+        type=int,
+        help="Number of on-disk k-mer partitions. Increase this for very large graphs so that each partition fits in memory"
+    )
+
+    parser.add_argument(
+        "--batch_size",
+        required=False,
+        default=10_000_000,
+        type=int,
+        help="Number of bases per batch of sequences processed by each thread"
+    )
+
+    parser.add_argument(
+        "--sketch",
+        required=False,
+        default=None,
+        type=int,
+        help="Estimate Jaccard similarity with a MinHash sketch of this size instead of an exact comparison"
+    )
+
+    parser.add_argument(
+        "--max_differences",
+        required=False,
+        default=1000,
+        type=int,
+        help="Maximum number of differing k-mers to write for each graph"
+    )
+
+    parser.add_argument(
+        "-o",
+        required=True,
+        type=str,
+        help="Output directory"
+    )
+
+    args = parser.parse_args()
+
+    main(
+        path_a=args.a,
+        path_b=args.b,
+        k=args.k,
+        n_threads=args.t,
+        n_partitions=args.partitions,
+        batch_size=args.batch_size,
+        sketch_size=args.sketch,
+        max_differences=args.max_differences,
+        output_directory=args.o
+    )
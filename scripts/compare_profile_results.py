@@ -1,8 +1,10 @@
 from module.GsUri import download_gs_uri
+from module.Archive import open_archive, get_archive_name
+from module.TimeLog import parse_time_as_minutes
 
 from multiprocessing import Pool
 import argparse
-import tarfile
+import io
 
 import numpy
 import pandas
@@ -17,6 +19,35 @@ from matplotlib import pyplot
 from matplotlib import colors
 
 
+# Columns of the consolidated results table, one row per region per tool
+RESULTS_COLUMNS = [
+    "tool",
+    "row",
+    "n",
+    "region",
+    "total_coverage",
+    "sample_count",
+    "elapsed_real_min",
+    "ram_max_mbyte",
+    "cpu_percent",
+    "cpu_count",
+    "k",
+    "node_count",
+    "edge_count",
+    "total_length",
+    "n50",
+    "cache_hit",
+    "archive_mbyte",
+    "fasta_bytes",
+    "read_count",
+    "repeat_count",
+    "elapsed_real_min_mad",
+    "ram_max_mbyte_mad",
+    "cpu_set",
+    "numa_nodes",
+    "numa_policy"
+]
+
 def truncate_colormap(cmap, minval=0.0, maxval=1.0, n=100):
     new_cmap = colors.LinearSegmentedColormap.from_list(
         'trunc({n},{a:.2f},{b:.2f})'.format(n=cmap.name, a=minval, b=maxval),
@@ -25,12 +56,13 @@ def truncate_colormap(cmap, minval=0.0, maxval=1.0, n=100):
 
 
 def untar(tar_path):
-    with tarfile.open(tar_path, "r:gz") as tar:
+    with open_archive(tar_path) as tar:
         tar.extractall()
 
 
 def parse_coverage_file(file):
     total_coverage = 0
+    n_samples = 0
     depth_index = None
 
     for l,line in enumerate(file.readlines()):
@@ -40,27 +72,10 @@ def parse_coverage_file(file):
             depth_index = data.index("meandepth")
         else:
             total_coverage += float(data[depth_index])
+            n_samples += 1
 
-    return total_coverage
-
-
-def parse_time_as_minutes(time):
-    if time.strip() == '0':
-        return 0
-
-    tokens = time.split(":")
-
-    minutes = None
+    return total_coverage, n_samples
 
-    if len(tokens) == 3:
-        minutes = 60*float(tokens[0]) + float(tokens[1]) + float(tokens[2])/60
-    elif len(tokens) == 2:
-        minutes = float(tokens[0]) + float(tokens[1])/60
-    else:
-        sys.stderr.write("ERROR: unparsable time string: %s\n" % time)
-        exit()
-
-    return minutes
 
 '''
 elapsed_real_s,0:01.30
@@ -91,48 +106,121 @@ def parse_log_file(file):
     return elapsed_real_s, ram_max_kbyte, cpu_percent, cpu_count
 
 
+"""
+Read every key,value pair in the log as strings, for fields that are optional or were added after the original
+time/RAM/CPU fields (e.g. the k value used for the run)
+"""
+def parse_log_fields(file):
+    fields = dict()
+
+    for l,line in enumerate(file.readlines()):
+        data = line.decode("utf8").strip().split(',')
+
+        if len(data) == 2:
+            fields[data[0]] = data[1]
+
+    return fields
+
+
 def get_resource_stats_for_each_tarball(tarball_paths):
     for tar_path in tarball_paths:
         yield get_resource_stats_for_tarball(tar_path)
 
 
 def get_resource_stats_for_tarball(tar_path):
+    stats = get_region_stats_for_tarball(tar_path)
+
+    return stats["total_coverage"], stats["elapsed_real_min"], stats["ram_max_mbyte"], stats["cpu_percent"]
+
+
+"""
+Parse the coverage and log files of one profiling result tarball into a single row of the consolidated results table
+"""
+def get_region_stats_for_tarball(tar_path):
     total_coverage = None
+    n_samples = None
     cpu_percent = None
     cpu_count = None
     elapsed_real_s = None
     ram_max_kbyte = None
     ram_max_mbyte = None
+    log_fields = dict()
+    graph_fields = dict()
 
-    with tarfile.open(tar_path, "r:gz") as tar:
-        for item in tar.getmembers():
+    # Result archives may be .tar.gz, .tar.zst, .tar.lz4 or .tar, the codec is detected from the file contents
+    with open_archive(tar_path) as tar:
+        for item in tar:
             name = os.path.basename(item.name)
 
             if name == "coverage.tsv":
                 f = tar.extractfile(item)
 
                 try:
-                    total_coverage = parse_coverage_file(f)
+                    total_coverage, n_samples = parse_coverage_file(f)
                 except Exception as e:
                     sys.stderr.write("ERROR: could not parse file: %s\n" % tar_path)
                     sys.stderr.write(str(e))
                     exit()
 
             if name == "log.csv":
-                f = tar.extractfile(item)
+                f = io.BytesIO(tar.extractfile(item).read())
 
                 try:
                     elapsed_real_s, ram_max_kbyte, cpu_percent, cpu_count = parse_log_file(f)
                     ram_max_mbyte = float(ram_max_kbyte)/1000
+
+                    f.seek(0)
+                    log_fields = parse_log_fields(f)
                 except Exception as e:
                     sys.stderr.write("ERROR: could not parse file: %s\n" % tar_path)
                     sys.stderr.write(str(e))
                     exit()
 
+            # Only present for results that were profiled with graph stats enabled
+            if name == "graph_stats.csv":
+                f = tar.extractfile(item)
+                graph_fields = parse_log_fields(f)
+
     # Normalize CPU percent so it shows percent of total CPUs, instead of e.g. 233%
     adjusted_cpu_percent = cpu_percent / cpu_count
 
-    return total_coverage, elapsed_real_s, ram_max_mbyte, adjusted_cpu_percent
+    stats = {
+        "region": get_archive_name(tar_path),
+        "total_coverage": total_coverage,
+        "sample_count": n_samples,
+        "elapsed_real_min": elapsed_real_s,
+        "ram_max_mbyte": ram_max_mbyte,
+        "cpu_percent": adjusted_cpu_percent,
+        "cpu_count": cpu_count,
+        "k": int(log_fields["k"]) if "k" in log_fields else None,
+        "cache_hit": int(log_fields.get("cache_hit", 0)),
+        "archive_mbyte": float(os.path.getsize(tar_path))/1e6
+    }
+
+    # Only present for results that were profiled with input size logging
+    for key in ["fasta_bytes", "read_count"]:
+        stats[key] = int(log_fields[key]) if key in log_fields else None
+
+    for key in ["node_count", "edge_count", "total_length", "n50"]:
+        stats[key] = int(graph_fields[key]) if key in graph_fields else None
+
+    # Only present for results that were pinned to a CPU set (profile.py --pin)
+    for key in ["cpu_set", "numa_nodes", "numa_policy"]:
+        stats[key] = log_fields.get(key)
+
+    # With repeated trials, the medians stand in for the single measurement and the MADs give its spread
+    stats["repeat_count"] = int(log_fields.get("repeat_count", 1))
+    stats["elapsed_real_min_mad"] = None
+    stats["ram_max_mbyte_mad"] = None
+
+    if "repeat_count" in log_fields:
+        stats["elapsed_real_min"] = float(log_fields["elapsed_real_min_median"])
+        stats["ram_max_mbyte"] = float(log_fields["ram_max_mbyte_median"])
+        stats["cpu_percent"] = float(log_fields["cpu_percent_median"]) / cpu_count
+        stats["elapsed_real_min_mad"] = float(log_fields["elapsed_real_min_mad"])
+        stats["ram_max_mbyte_mad"] = float(log_fields["ram_max_mbyte_mad"])
+
+    return stats
 
 
 def load_json(json_path):
@@ -159,7 +247,57 @@ def parse_config(json_path):
     return config
 
 
-def main(tsv_path, n_threads, required_substring, axes_x_max, limit, config_path, output_directory):
+def plot_scatter(axes, x, y_elapsed, y_ram, y_cpu, color, elapsed_error=None, ram_error=None):
+    axes[0][0].scatter(x=x, y=y_elapsed, s=0.7, color=color, alpha=0.2)
+    axes[0][1].scatter(x=x, y=y_ram, s=0.7, color=color, alpha=0.2)
+    axes[1][0].scatter(x=x, y=y_cpu, s=0.7, color=color, alpha=0.2)
+
+    # Spread (MAD) of repeated trials, where available
+    if elapsed_error is not None and any(e > 0 for e in elapsed_error):
+        axes[0][0].errorbar(x=x, y=y_elapsed, yerr=elapsed_error, fmt="none", ecolor=color, elinewidth=0.5, alpha=0.3)
+    if ram_error is not None and any(e > 0 for e in ram_error):
+        axes[0][1].errorbar(x=x, y=y_ram, yerr=ram_error, fmt="none", ecolor=color, elinewidth=0.5, alpha=0.3)
+
+
+def get_density_colormap(name, color):
+    # Fade from transparent to the tool color so that multiple tools can be overlaid on the same axes
+    r,g,b = colors.to_rgb(color)
+    return colors.LinearSegmentedColormap.from_list(name, [(r,g,b,0.15), (r,g,b,1.0)])
+
+
+"""
+Aggregate the points into hexagonal bins instead of drawing individual markers, so that rendering time and
+legibility don't depend on the number of regions
+"""
+def plot_density(axes, x, y_elapsed, y_ram, y_cpu, color, name, axes_x_max, gridsize):
+    colormap = get_density_colormap(name, color)
+
+    x = numpy.asarray(x, dtype=float)
+
+    for a,y in [(axes[0][0], y_elapsed), (axes[0][1], y_ram), (axes[1][0], y_cpu)]:
+        y = numpy.asarray(y, dtype=float)
+
+        # Only bin the points that are within the visible x range, otherwise the grid resolution is wasted
+        mask = (x <= axes_x_max) & numpy.isfinite(x) & numpy.isfinite(y)
+
+        if numpy.count_nonzero(mask) == 0:
+            continue
+
+        y_max = max(float(numpy.max(y[mask])), 1e-9)
+
+        a.hexbin(
+            x[mask],
+            y[mask],
+            gridsize=gridsize,
+            extent=(0, axes_x_max, 0, y_max),
+            bins="log",
+            mincnt=1,
+            cmap=colormap,
+            linewidths=0
+        )
+
+
+def main(tsv_path, n_threads, required_substring, axes_x_max, limit, config_path, output_directory, mode="scatter", gridsize=200, plot_path=None, results_path=None, show=False):
     config = parse_config(config_path)
 
     output_directory = os.path.abspath(output_directory)
@@ -167,6 +305,13 @@ def main(tsv_path, n_threads, required_substring, axes_x_max, limit, config_path
     if not os.path.exists(output_directory):
         os.makedirs(output_directory)
 
+    if plot_path is None:
+        plot_path = os.path.join(output_directory, "resource_usage.png")
+
+    # Don't require a display unless the plot is going to be shown interactively
+    if not show:
+        pyplot.switch_backend("Agg")
+
     fig,axes = pyplot.subplots(nrows=2,ncols=2)
 
     df = pandas.read_table(tsv_path, sep='\t', header=0)
@@ -178,19 +323,28 @@ def main(tsv_path, n_threads, required_substring, axes_x_max, limit, config_path
     coverage_colormap = pyplot.get_cmap("gist_heat")
     max_coverage = 0
 
+    # Points are collected for each tool across all rows, and then drawn once per tool
+    points_per_tool = dict()
+
+    # Every parsed region is also kept as a row of the consolidated results table, for downstream analysis
+    results = list()
+
     for n,item in enumerate(config):
         name = item["label"]
 
         print("---- %s ----" % name)
         # colormap = colormaps[name]
 
+        points = {"total_coverage": list(), "elapsed_real_s": list(), "ram_max_mbyte": list(), "cpu_percent": list(), "elapsed_mad": list(), "ram_mad": list()}
+        points_per_tool[name] = points
+
         for i in range(n_rows):
             total_coverage = list()
             elapsed_real_s = list()
             ram_max_mbyte = list()
             cpu_percent = list()
 
-            row_name = df.iloc[i][0]
+            row_name = df.iloc[i].iloc[0]
 
             print(row_name)
 
@@ -212,9 +366,6 @@ def main(tsv_path, n_threads, required_substring, axes_x_max, limit, config_path
 
             print(n_samples, len(tarballs))
 
-            # Just use the same color for all dots within a dbg tool
-            color = item["color"]
-
             # Each tool downloads its regions to its own subdirectory to prevent overwriting (filenames are by region)
             output_subdirectory = os.path.join(output_directory, name)
             output_subdirectory = os.path.join(output_subdirectory, row_name)
@@ -229,21 +380,27 @@ def main(tsv_path, n_threads, required_substring, axes_x_max, limit, config_path
             # Multithread the parsing of results
             args = [[str(x)] for x in download_results]
             with Pool(n_threads) as pool:
-                stats_results = pool.starmap(get_resource_stats_for_tarball, args)
+                stats_results = pool.starmap(get_region_stats_for_tarball, args)
 
             # Aggregate
             for stats in stats_results:
-                total_coverage.append(stats[0])
-                elapsed_real_s.append(stats[1])
-                ram_max_mbyte.append(stats[2])
-                cpu_percent.append(stats[3])
+                total_coverage.append(stats["total_coverage"])
+                elapsed_real_s.append(stats["elapsed_real_min"])
+                ram_max_mbyte.append(stats["ram_max_mbyte"])
+                cpu_percent.append(stats["cpu_percent"])
+
+                if stats["total_coverage"] > max_coverage:
+                    max_coverage = stats["total_coverage"]
 
-                if stats[0] > max_coverage:
-                    max_coverage = stats[0]
+                results.append(dict(tool=name, row=row_name, n=n_samples, **stats))
 
-            axes[0][0].scatter(x=total_coverage, y=elapsed_real_s, s=0.7, color=color, alpha=0.2)
-            axes[0][1].scatter(x=total_coverage, y=ram_max_mbyte, s=0.7, color=color, alpha=0.2)
-            axes[1][0].scatter(x=total_coverage, y=cpu_percent, s=0.7, color=color, alpha=0.2)
+                points["elapsed_mad"].append(stats["elapsed_real_min_mad"] or 0)
+                points["ram_mad"].append(stats["ram_max_mbyte_mad"] or 0)
+
+            points["total_coverage"].extend(total_coverage)
+            points["elapsed_real_s"].extend(elapsed_real_s)
+            points["ram_max_mbyte"].extend(ram_max_mbyte)
+            points["cpu_percent"].extend(cpu_percent)
 
             # Only plot coverage histogram once
             if n == 0:
@@ -268,6 +425,26 @@ def main(tsv_path, n_threads, required_substring, axes_x_max, limit, config_path
 
                 axes[1][1].text(x_max, y_max, str(n_samples), horizontalalignment='left', verticalalignment='bottom')
 
+    if results_path is None:
+        results_path = os.path.join(output_directory, "resource_usage.tsv")
+
+    sys.stderr.write("Writing consolidated results: %s\n" % results_path)
+    pandas.DataFrame(results, columns=RESULTS_COLUMNS).to_csv(results_path, sep='\t', index=False)
+
+    for item in config:
+        name = item["label"]
+        points = points_per_tool[name]
+
+        # Just use the same color for all dots within a dbg tool
+        color = item["color"]
+
+        if mode == "scatter":
+            plot_scatter(axes, points["total_coverage"], points["elapsed_real_s"], points["ram_max_mbyte"], points["cpu_percent"], color, points["elapsed_mad"], points["ram_mad"])
+        elif mode == "density":
+            plot_density(axes, points["total_coverage"], points["elapsed_real_s"], points["ram_max_mbyte"], points["cpu_percent"], color, name, axes_x_max, gridsize)
+        else:
+            exit("ERROR: unrecognized plotting mode: %s" % mode)
+
     fig.set_size_inches(12,9)
 
     axes[0][0].set_xlabel("Average depth")
@@ -297,8 +474,16 @@ def main(tsv_path, n_threads, required_substring, axes_x_max, limit, config_path
 
     fig.tight_layout()
 
-    pyplot.savefig("resource_usage.png",dpi=200)
-    pyplot.show()
+    plot_directory = os.path.dirname(os.path.abspath(plot_path))
+    if not os.path.exists(plot_directory):
+        os.makedirs(plot_directory)
+
+    sys.stderr.write("Writing plot: %s\n" % plot_path)
+    pyplot.savefig(plot_path,dpi=200)
+
+    if show:
+        pyplot.show()
+
     pyplot.close()
 
 
@@ -385,6 +570,47 @@ if __name__ == "__main__":
         help="Config file (use --template to generate a template config)"
     )
 
+    parser.add_argument(
+        "--mode",
+        required=False,
+        default="scatter",
+        choices=["scatter", "density"],
+        type=str,
+        help="How to draw the resource usage points. 'density' aggregates points into hexagonal bins per tool, which "
+             "stays fast and legible for millions of regions"
+    )
+
+    parser.add_argument(
+        "--gridsize",
+        required=False,
+        default=200,
+        type=int,
+        help="Number of hexagonal bins along the x axis when using --mode density"
+    )
+
+    parser.add_argument(
+        "--plot",
+        required=False,
+        default=None,
+        type=str,
+        help="Output path for the plot image (default: resource_usage.png in the output directory)"
+    )
+
+    parser.add_argument(
+        "--results",
+        required=False,
+        default=None,
+        type=str,
+        help="Output path for the consolidated results table, with one row per region per tool (default: "
+             "resource_usage.tsv in the output directory)"
+    )
+
+    parser.add_argument(
+        "--show",
+        action="store_true",
+        help="Open an interactive window after the plot is saved (by default the plot is rendered headless)"
+    )
+
     if "--template" in sys.argv:
         generate_template()
     else:
@@ -396,5 +622,10 @@ if __name__ == "__main__":
             axes_x_max=args.x,
             limit=args.limit,
             config_path=args.c,
-            output_directory=args.o
+            output_directory=args.o,
+            mode=args.mode,
+            gridsize=args.gridsize,
+            plot_path=args.plot,
+            results_path=args.results,
+            show=args.show
         )
@@ -0,0 +1,260 @@
+import argparse
+import numpy
+import pandas
+import json
+import sys
+import os
+
+
+# Metrics compared between campaigns, and whether an increase counts as a regression
+METRICS = {
+    "elapsed_real_min": True,
+    "ram_max_mbyte": True,
+    "cpu_percent": False,
+}
+
+
+"""
+Bootstrap the means of each column of `a` and `b` (paired rows, one column per metric) by resampling the pairs.
+The same resampled indexes are shared by all metrics, and replicates are generated in chunks so that the index
+matrix stays within `max_elements`, which keeps memory bounded for hundreds of thousands of pairs.
+"""
+def bootstrap_paired_means(a, b, n_bootstrap, rng, max_elements=10_000_000):
+    n, n_metrics = a.shape
+
+    means_a = numpy.empty((n_bootstrap, n_metrics))
+    means_b = numpy.empty((n_bootstrap, n_metrics))
+
+    # Contiguous columns make the gathers below much faster
+    columns_a = [numpy.ascontiguousarray(a[:,m]) for m in range(n_metrics)]
+    columns_b = [numpy.ascontiguousarray(b[:,m]) for m in range(n_metrics)]
+
+    chunk_size = max(1, max_elements // max(1, n))
+    index_type = numpy.int32 if n < 2**31 else numpy.int64
+
+    for start in range(0, n_bootstrap, chunk_size):
+        stop = min(n_bootstrap, start + chunk_size)
+        indexes = rng.integers(0, n, size=(stop - start, n), dtype=index_type)
+
+        for m in range(n_metrics):
+            means_a[start:stop,m] = columns_a[m][indexes].mean(axis=1)
+            means_b[start:stop,m] = columns_b[m][indexes].mean(axis=1)
+
+    return means_a, means_b
+
+
+def summarize_metric(a, b, means_a, means_b, confidence, min_effect, increase_is_regression):
+    mean_a = float(a.mean())
+    mean_b = float(b.mean())
+    relative_change = mean_b/mean_a - 1 if mean_a != 0 else float("nan")
+
+    diff_means = means_b - means_a
+    with numpy.errstate(divide="ignore", invalid="ignore"):
+        relative_changes = means_b/means_a - 1
+
+    alpha = (1 - confidence)/2
+    diff_lower, diff_upper = numpy.nanquantile(diff_means, [alpha, 1 - alpha])
+    relative_lower, relative_upper = numpy.nanquantile(relative_changes, [alpha, 1 - alpha])
+
+    # Significant if the interval excludes zero and the change is larger than the minimum effect size of interest
+    significant = bool((diff_lower > 0 or diff_upper < 0) and abs(relative_change) >= min_effect)
+
+    regression = False
+    if increase_is_regression:
+        regression = bool(significant and relative_lower > 0)
+
+    return {
+        "n": int(len(a)),
+        "mean_a": mean_a,
+        "mean_b": mean_b,
+        "median_diff": float(numpy.median(b - a)),
+        "mean_diff": mean_b - mean_a,
+        "mean_diff_ci": [float(diff_lower), float(diff_upper)],
+        "relative_change": relative_change,
+        "relative_change_ci": [float(relative_lower), float(relative_upper)],
+        "significant": significant,
+        "regression": regression
+    }
+
+
+def main(path_a, path_b, n_bootstrap, confidence, min_effect, seed, output_path, fail_on_regression):
+    a = pandas.read_table(path_a, sep='\t', header=0)
+    b = pandas.read_table(path_b, sep='\t', header=0)
+
+    rng = numpy.random.default_rng(seed)
+
+    # Runs are matched by tool, table row (sample count), and region. The region name alone is shared by every sample
+    # count of a region, so it would pair each run with all runs of the same region.
+    keys = ["tool", "row", "n", "region"]
+
+    for key in ["cpu_count", "k"]:
+        if key in a.columns and key in b.columns:
+            keys.append(key)
+
+    # Results from before a key column existed have NaN there, which merge pairs with NaN but set lookups do not
+    a[keys] = a[keys].fillna(-1)
+    b[keys] = b[keys].fillna(-1)
+
+    for name,df in [("a", a), ("b", b)]:
+        n_duplicates = int(df.duplicated(subset=keys).sum())
+
+        if n_duplicates > 0:
+            exit("ERROR: %d rows of table %s have duplicate keys (%s), runs cannot be paired" % (n_duplicates, name, ", ".join(keys)))
+
+    paired = a.merge(b, on=keys, how="inner", suffixes=("_a", "_b"))
+
+    report = {
+        "a": os.path.abspath(path_a),
+        "b": os.path.abspath(path_b),
+        "n_bootstrap": n_bootstrap,
+        "confidence": confidence,
+        "min_effect": min_effect,
+        "seed": seed,
+        "tools": dict()
+    }
+
+    any_regression = False
+
+    for tool in sorted(set(a["tool"]) | set(b["tool"])):
+        tool_paired = paired[paired["tool"] == tool]
+
+        runs_a = set(a.loc[a["tool"] == tool, keys].itertuples(index=False, name=None))
+        runs_b = set(b.loc[b["tool"] == tool, keys].itertuples(index=False, name=None))
+
+        tool_report = {
+            "n_paired": int(len(tool_paired)),
+            "n_unmatched_a": len(runs_a - runs_b),
+            "n_unmatched_b": len(runs_b - runs_a),
+            "metrics": dict()
+        }
+
+        metrics = list(METRICS.keys())
+        a_values = tool_paired[[m + "_a" for m in metrics]].to_numpy(dtype=float)
+        b_values = tool_paired[[m + "_b" for m in metrics]].to_numpy(dtype=float)
+
+        # Pairs with a missing value in any metric are not used
+        mask = numpy.isfinite(a_values).all(axis=1) & numpy.isfinite(b_values).all(axis=1)
+        a_values = a_values[mask]
+        b_values = b_values[mask]
+
+        tool_report["n_incomplete"] = int(numpy.count_nonzero(~mask))
+
+        if len(a_values) > 0:
+            means_a, means_b = bootstrap_paired_means(a_values, b_values, n_bootstrap, rng)
+
+            for m,metric in enumerate(metrics):
+                result = summarize_metric(
+                    a=a_values[:,m],
+                    b=b_values[:,m],
+                    means_a=means_a[:,m],
+                    means_b=means_b[:,m],
+                    confidence=confidence,
+                    min_effect=min_effect,
+                    increase_is_regression=METRICS[metric]
+                )
+
+                tool_report["metrics"][metric] = result
+
+                status = "REGRESSION" if result["regression"] else ("changed" if result["significant"] else "ok")
+                print("%s\t%s\t%+.2f%% [%+.2f%%, %+.2f%%]\t%s" % (
+                    tool,
+                    metric,
+                    100*result["relative_change"],
+                    100*result["relative_change_ci"][0],
+                    100*result["relative_change_ci"][1],
+                    status))
+
+                any_regression = any_regression or result["regression"]
+
+        report["tools"][tool] = tool_report
+
+    report["regression"] = any_regression
+
+    output_directory = os.path.dirname(os.path.abspath(output_path))
+    if not os.path.exists(output_directory):
+        os.makedirs(output_directory)
+
+    with open(output_path, 'w') as file:
+        json.dump(report, file, indent=2)
+
+    if any_regression:
+        sys.stderr.write("WARNING: significant regression detected, see report: %s\n" % output_path)
+
+        if fail_on_regression:
+            exit(1)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+
+    parser.add_argument(
+        "-a",
+        required=True,
+        type=str,
+        help="Consolidated results table (TSV) of the baseline campaign, written by compare_profile_results.py"
+    )
+
+    parser.add_argument(
+        "-b",
+        required=True,
+        type=str,
+        help="Consolidated results table (TSV) of the new campaign, written by compare_profile_results.py"
+    )
+
+    parser.add_argument(
+        "--bootstrap",
+        required=False,
+        default=1000,
+        type=int,
+        help="Number of bootstrap replicates"
+    )
+
+    parser.add_argument(
+        "--confidence",
+        required=False,
+        default=0.95,
+        type=float,
+        help="Confidence level of the bootstrap intervals"
+    )
+
+    parser.add_argument(
+        "--min_effect",
+        required=False,
+        default=0.02,
+        type=float,
+        help="Smallest relative change (e.g. 0.02 = 2%%) that is reported as significant"
+    )
+
+    parser.add_argument(
+        "--seed",
+        required=False,
+        default=0,
+        type=int,
+        help="Random seed for bootstrapping"
+    )
+
+    parser.add_argument(
+        "--fail_on_regression",
+        action="store_true",
+        help="Exit with nonzero status if any regression is detected"
+    )
+
+    parser.add_argument(
+        "-o",
+        required=True,
+        type=str,
+        help="Output path for the JSON report"
+    )
+
+    args = parser.parse_args()
+
+    main(
+        path_a=args.a,
+        path_b=args.b,
+        n_bootstrap=args.bootstrap,
+        confidence=args.confidence,
+        min_effect=args.min_effect,
+        seed=args.seed,
+        output_path=args.o,
+        fail_on_regression=args.fail_on_regression
+    )
@@ -0,0 +1,50 @@
+from module.GraphStats import GraphStats
+
+import argparse
+import sys
+import os
+
+
+def main(input_path, output_path):
+    if not os.path.exists(input_path):
+        exit("ERROR: input graph not found: %s" % input_path)
+
+    graph = GraphStats()
+    graph.parse(input_path)
+
+    stats = graph.get_stats()
+
+    if output_path is None:
+        for key,value in stats.items():
+            sys.stdout.write("%s,%s\n" % (key, str(value)))
+    else:
+        output_directory = os.path.dirname(output_path)
+
+        if not len(output_directory) == 0:
+            if not os.path.exists(output_directory):
+                os.makedirs(output_directory)
+
+        GraphStats.write_stats(stats, output_path)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+
+    parser.add_argument(
+        "-i",
+        required=True,
+        type=str,
+        help="Input graph: GFA (optionally gzipped), or unitig FASTA with optional BCALM link annotations (ggcat)"
+    )
+
+    parser.add_argument(
+        "-o",
+        required=False,
+        default=None,
+        type=str,
+        help="Output CSV path (default: print to stdout)"
+    )
+
+    args = parser.parse_args()
+
+    main(input_path=args.i, output_path=args.o)
@@ -1,6 +1,10 @@
 from module.Edge import Edge
+from module.Archive import open_archive, get_archive_name, EXTENSIONS
 from collections import defaultdict
+from multiprocessing import Pool
+from functools import partial
 import argparse
+import time
 import sys
 import os
 
@@ -13,6 +17,58 @@ import os
 >4 LN:i:35 L:+:35516:+ L:-:16:- L:-:58288:-
 >5 LN:i:33 L:+:15:- L:-:1:-
 """
+def convert(lines, output_file, no_sequence=False, source_name=""):
+    nodes = defaultdict(str)
+    edges = set()
+
+    id = None
+    sequence = None
+
+    for l,line in enumerate(lines):
+        if len(line) <= 1:
+            sys.stderr.write("WARNING: empty line detected at l=%d in file: %s" % (l, source_name))
+            continue
+
+        if line[0] == '>':
+            if l > 0:
+                nodes[id] = sequence
+
+            id, line_edges = Edge.parse_bcalm_string(line[1:])
+
+            for e in line_edges:
+                e.canonicalize()
+                edges.add(e.to_gfa_line())
+
+            sequence = ""
+
+        else:
+            sequence += line.strip()
+
+    # Final line
+    if sequence is not None and id is not None:
+        nodes[id] = sequence
+
+    output_file.write("H\tVN:Z:1.0\n")
+    for id,seq in nodes.items():
+        output_file.write("S\t")
+        output_file.write(id)
+        output_file.write('\t')
+
+        if no_sequence:
+            output_file.write("*\tLN:i:")
+            output_file.write(str(len(seq)))
+            output_file.write('\n')
+        else:
+            output_file.write(seq)
+            output_file.write('\n')
+
+    for item in edges:
+        output_file.write(item)
+        output_file.write('\n')
+
+    return len(nodes), len(edges)
+
+
 def main(fasta_path, output_path, no_sequence=False):
     output_directory = os.path.dirname(output_path)
 
@@ -26,59 +82,108 @@ def main(fasta_path, output_path, no_sequence=False):
     print(fasta_path)
     print(output_path)
 
-    nodes = defaultdict(str)
-    edges = set()
-
-    id = None
-    sequence = None
-
     if not os.path.exists(fasta_path):
         sys.stderr.write("WARNING: fasta file not found, terminating early: %s" % fasta_path)
         return
 
-    with open(fasta_path, 'r') as file:
-        for l,line in enumerate(file):
-            if len(line) <= 1:
-                sys.stderr.write("WARNING: empty line detected at l=%d in file: %s" % (l, fasta_path))
-                continue
+    with open(fasta_path, 'r') as file, open(output_path, 'w') as output_file:
+        convert(file, output_file, no_sequence=no_sequence, source_name=fasta_path)
 
-            if line[0] == '>':
-                if l > 0:
-                    nodes[id] = sequence
 
-                id, line_edges = Edge.parse_bcalm_string(line[1:])
+"""
+Convert the ggcat FASTA inside one profile.py result archive, streaming it out of the archive without extracting
+anything to disk. The GFA is written next to the other sidecar outputs as <region>.gfa (via a temporary name, so that
+partial outputs are never left behind). Returns one row of the conversion summary, with status "error" if the archive
+could not be read or converted.
+"""
+def convert_archive(tar_path, output_directory, no_sequence=False):
+    name = get_archive_name(tar_path)
+    output_path = os.path.join(output_directory, name + ".gfa")
+    tmp_path = output_path + ".tmp.%d" % os.getpid()
 
-                for e in line_edges:
-                    e.canonicalize()
-                    edges.add(e.to_gfa_line())
+    result = {"archive": name, "status": "missing", "fasta_bytes": 0, "gfa_bytes": 0, "nodes": 0, "edges": 0, "seconds": 0.0}
 
-                sequence = ""
+    t = time.perf_counter()
 
-            else:
-                sequence += line.strip()
+    # One bad archive (e.g. a malformed link string, which Edge exits on) is reported in the summary, rather than
+    # aborting the whole batch or killing the pool worker
+    try:
+        with open_archive(tar_path) as tar:
+            for item in tar:
+                if not item.isfile() or os.path.basename(item.name) != "ggcat.fasta":
+                    continue
 
-    # Final line
-    if sequence is not None and id is not None:
-        nodes[id] = sequence
+                # Members of a streamed archive are not seekable, which TextIOWrapper needs, so lines are decoded here
+                lines = (line.decode("utf8") for line in tar.extractfile(item))
 
-    with open(output_path, 'w') as file:
-        file.write("H\tVN:Z:1.0\n")
-        for id,seq in nodes.items():
-            file.write("S\t")
-            file.write(id)
-            file.write('\t')
+                with open(tmp_path, 'w') as output_file:
+                    result["nodes"], result["edges"] = convert(lines, output_file, no_sequence=no_sequence, source_name=tar_path + ":" + item.name)
 
-            if no_sequence:
-                file.write("*\tLN:i:")
-                file.write(str(len(seq)))
-                file.write('\n')
-            else:
-                file.write(seq)
-                file.write('\n')
+                os.rename(tmp_path, output_path)
 
-        for item in edges:
-            file.write(item)
-            file.write('\n')
+                result["status"] = "converted"
+                result["fasta_bytes"] = item.size
+                result["gfa_bytes"] = os.path.getsize(output_path)
+                break
+
+    except (Exception, SystemExit) as e:
+        sys.stderr.write("ERROR: failed to convert archive %s: %s\n" % (tar_path, str(e)))
+
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+        result["status"] = "error"
+
+    result["seconds"] = time.perf_counter() - t
+
+    if result["status"] == "missing":
+        sys.stderr.write("WARNING: no ggcat.fasta in archive: %s\n" % tar_path)
+
+    return result
+
+
+"""
+Convert the ggcat outputs of many result archives in a process pool, writing one GFA per archive to
+`output_directory` along with conversion_summary.tsv
+"""
+def main_batch(tar_paths, output_directory, n_processes, no_sequence=False):
+    output_directory = os.path.abspath(output_directory)
+
+    if not os.path.exists(output_directory):
+        os.makedirs(output_directory)
+
+    columns = ["archive", "status", "fasta_bytes", "gfa_bytes", "nodes", "edges", "seconds", "mb_per_s"]
+    summary_path = os.path.join(output_directory, "conversion_summary.tsv")
+
+    t = time.perf_counter()
+    n_converted = 0
+    fasta_bytes = 0
+
+    with Pool(processes=n_processes) as pool, open(summary_path, 'w') as summary_file:
+        summary_file.write("\t".join(columns) + '\n')
+
+        # Results are written as they finish, so large archives don't hold up the summary of small ones
+        for result in pool.imap_unordered(partial(convert_archive, output_directory=output_directory, no_sequence=no_sequence), tar_paths):
+            result["mb_per_s"] = result["fasta_bytes"]/1e6/result["seconds"] if result["seconds"] > 0 else 0.0
+
+            summary_file.write("\t".join(str(result[c]) for c in columns) + '\n')
+
+            if result["status"] == "converted":
+                n_converted += 1
+                fasta_bytes += result["fasta_bytes"]
+
+    seconds = time.perf_counter() - t
+
+    sys.stderr.write("Converted %d of %d archives, %.1fMB of FASTA in %.2fs (%.1fMB/s with %d processes)\n" % (
+        n_converted, len(tar_paths), fasta_bytes/1e6, seconds, fasta_bytes/1e6/seconds if seconds > 0 else 0.0, n_processes))
+    sys.stderr.write("Summary written to: %s\n" % summary_path)
+
+
+def parse_input_string(s):
+    if os.path.isdir(os.path.abspath(s)):
+        return sorted(os.path.join(s,x) for x in os.listdir(s) if x.endswith(tuple(EXTENSIONS.values())))
+    else:
+        return [x for x in s.split(',') if len(x) > 0]
 
 
 def str_as_bool(s):
@@ -95,16 +200,35 @@ if __name__ == "__main__":
 
     parser.add_argument(
         "-i",
-        required=True,
+        required=False,
+        default=None,
         type=str,
         help="Input fasta containing ggcat formatted sequences, with BCALM Link strings as annotation"
     )
 
+    parser.add_argument(
+        "--tars",
+        required=False,
+        default=None,
+        type=parse_input_string,
+        help="Batch mode: profile.py result archives (comma separated list OR a directory) to convert the ggcat.fasta "
+             "of, without extracting them. Use instead of -i"
+    )
+
     parser.add_argument(
         "-o",
         required=True,
         type=str,
-        help="Output path, any non-existent directories will be created"
+        help="Output path, any non-existent directories will be created. In batch mode, the output directory, which "
+             "gets one <region>.gfa per archive and a conversion_summary.tsv"
+    )
+
+    parser.add_argument(
+        "-c",
+        required=False,
+        default=1,
+        type=int,
+        help="Number of archives to convert in parallel (batch mode only)"
     )
 
     parser.add_argument(
@@ -116,4 +240,10 @@ if __name__ == "__main__":
 
     args = parser.parse_args()
 
-    main(fasta_path=args.i, output_path=args.o, no_sequence=args.no_sequence)
+    if (args.i is None) == (args.tars is None):
+        exit("ERROR: exactly one of -i or --tars must be given")
+
+    if args.tars is not None:
+        main_batch(tar_paths=args.tars, output_directory=args.o, n_processes=args.c, no_sequence=args.no_sequence)
+    else:
+        main(fasta_path=args.i, output_path=args.o, no_sequence=args.no_sequence)
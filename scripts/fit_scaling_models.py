@@ -0,0 +1,148 @@
+from module.ScalingModel import ScalingModel
+
+import argparse
+import pandas
+import json
+import sys
+import os
+
+
+RESPONSES = ["elapsed_real_min", "ram_max_mbyte"]
+
+
+def fit_models(df, features):
+    models = dict()
+
+    for tool,tool_df in df.groupby("tool"):
+        models[tool] = dict()
+
+        for response in RESPONSES:
+            model = ScalingModel(response=response, features=features)
+
+            try:
+                model.fit(tool_df)
+            except ValueError as e:
+                sys.stderr.write("WARNING: skipping %s model for %s: %s\n" % (response, tool, str(e)))
+                continue
+
+            print(tool, model)
+            models[tool][response] = model
+
+    return models
+
+
+def write_models(models, output_path):
+    data = {tool: {r: m.to_dict() for r,m in tool_models.items()} for tool,tool_models in models.items()}
+
+    with open(output_path, 'w') as file:
+        json.dump(data, file, indent=2)
+
+
+def write_coefficients(models, confidence, output_path):
+    with open(output_path, 'w') as file:
+        file.write("tool\tresponse\tterm\tcoefficient\tlower\tupper\tn_observations\tr_squared\n")
+
+        for tool,tool_models in models.items():
+            for response,model in tool_models.items():
+                for term,c,lower,upper in model.get_confidence_intervals(confidence):
+                    file.write("%s\t%s\t%s\t%.6g\t%.6g\t%.6g\t%d\t%.4f\n" % (tool, response, term, c, lower, upper, model.n_observations, model.r_squared))
+
+
+def write_predictions(models, target, confidence, output_path):
+    with open(output_path, 'w') as file:
+        file.write("tool\tresponse\tpredicted\tlower\tupper\n")
+
+        for tool,tool_models in models.items():
+            for response,model in tool_models.items():
+                y, lower, upper = model.predict(target, confidence)
+                file.write("%s\t%s\t%.6g\t%.6g\t%.6g\n" % (tool, response, y, lower, upper))
+
+                print("%s %s: %.3f (%.3f - %.3f)" % (tool, response, y, lower, upper))
+
+
+def main(results_path, features, target, confidence, output_directory):
+    output_directory = os.path.abspath(output_directory)
+
+    if not os.path.exists(output_directory):
+        os.makedirs(output_directory)
+
+    df = pandas.read_table(results_path, sep='\t', header=0)
+
+    for feature in features:
+        transform, name = ScalingModel.parse_feature(feature)
+        if name not in df.columns:
+            exit("ERROR: feature column not found in results table: %s" % name)
+
+    models = fit_models(df, features)
+
+    model_path = os.path.join(output_directory, "scaling_models.json")
+    write_models(models, model_path)
+
+    coefficients_path = os.path.join(output_directory, "scaling_coefficients.tsv")
+    write_coefficients(models, confidence, coefficients_path)
+
+    if target is not None:
+        predictions_path = os.path.join(output_directory, "scaling_predictions.tsv")
+        write_predictions(models, target, confidence, predictions_path)
+
+
+def parse_comma_separated_string(s):
+    return s.strip().split(',')
+
+
+def parse_target_string(s):
+    target = dict()
+
+    for token in parse_comma_separated_string(s):
+        name,value = token.split('=')
+        target[name] = float(value)
+
+    return target
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+
+    parser.add_argument(
+        "-i",
+        required=True,
+        type=str,
+        help="Consolidated results table (TSV) written by compare_profile_results.py"
+    )
+
+    parser.add_argument(
+        "--features",
+        required=False,
+        default="log:total_coverage,log:sample_count,k",
+        type=parse_comma_separated_string,
+        help="Comma separated list of explanatory columns. Prefix with 'log:' to use log(1 + x). Sequence content "
+             "features (e.g. gc_fraction, lowercase_fraction, distinct_kmer_fraction) can be added to the results table "
+             "with annotate_regions.py"
+    )
+
+    parser.add_argument(
+        "--target",
+        required=False,
+        default=None,
+        type=parse_target_string,
+        help="Input size to predict resources for, e.g. total_coverage=300,sample_count=32,k=31"
+    )
+
+    parser.add_argument(
+        "--confidence",
+        required=False,
+        default=0.95,
+        type=float,
+        help="Confidence level for coefficient and prediction intervals"
+    )
+
+    parser.add_argument(
+        "-o",
+        required=True,
+        type=str,
+        help="Output directory"
+    )
+
+    args = parser.parse_args()
+
+    main(results_path=args.i, features=args.features, target=args.target, confidence=args.confidence, output_directory=args.o)
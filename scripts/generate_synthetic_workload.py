@@ -0,0 +1,325 @@
+from collections import defaultdict
+import argparse
+import tarfile
+import shutil
+import numpy
+import json
+import sys
+import os
+
+
+BASES = numpy.frombuffer(b"ACGT", dtype=numpy.uint8)
+COMPLEMENT = numpy.frombuffer(b"TGCA", dtype=numpy.uint8)
+
+COVERAGE_HEADER = "sample\trname\tstartpos\tendpos\tnumreads\tcovbases\tcoverage\tmeandepth\tmeanbaseq\tmeanmapq\n"
+
+TOOLS = {
+    "ggcat": [35, 98, 103],
+    "cuttlefish": [54, 51, 119],
+    "bifrost": [92, 150, 50],
+}
+
+
+def write_fasta_record(file, name, sequence, line_width=None):
+    file.write(b">" + name.encode("utf8") + b"\n")
+
+    if line_width is None:
+        file.write(sequence.tobytes())
+        file.write(b"\n")
+    else:
+        for i in range(0, len(sequence), line_width):
+            file.write(sequence[i:i+line_width].tobytes())
+            file.write(b"\n")
+
+
+def mutate(sequence, rate, rng):
+    sequence = sequence.copy()
+    mask = rng.random(len(sequence)) < rate
+
+    # Shift each mutated base by 1-3 so that it always changes
+    sequence[mask] = (sequence[mask] + rng.integers(1, 4, size=numpy.count_nonzero(mask))) % 4
+
+    return sequence
+
+
+"""
+Sample reads uniformly from a haplotype (as base indexes 0-3), half of them reverse complemented, and return them as
+ASCII arrays along with the realized mean depth
+"""
+def simulate_reads(haplotype, depth, read_length, rng):
+    length = len(haplotype)
+    read_length = min(read_length, length)
+
+    n_reads = int(round(depth*length/read_length))
+
+    starts = rng.integers(0, length - read_length + 1, size=n_reads)
+    reads = haplotype[starts[:,None] + numpy.arange(read_length)[None,:]]
+
+    reverse = rng.random(n_reads) < 0.5
+    reads[reverse] = (3 - reads[reverse])[:,::-1]
+
+    mean_depth = float(n_reads*read_length)/length
+
+    return BASES[reads], mean_depth
+
+
+def write_tarball(directory):
+    tar_path = directory + ".tar.gz"
+
+    with tarfile.open(tar_path, "w:gz") as tar:
+        tar.add(directory, arcname=os.path.basename(directory))
+
+    shutil.rmtree(directory)
+
+    return tar_path
+
+
+def format_time(minutes):
+    seconds = minutes*60
+    return "%d:%05.2f" % (int(seconds // 60), seconds % 60)
+
+
+"""
+Write a fake ggcat output FASTA, with BCALM link annotations, for benchmarking the GFA conversion
+"""
+def write_fake_ggcat_fasta(path, n_unitigs, k, rng):
+    with open(path, 'wb') as file:
+        for i in range(n_unitigs):
+            length = int(rng.integers(k, k + 100))
+            sequence = BASES[rng.integers(0, 4, size=length)]
+
+            links = list()
+            for _ in range(int(rng.integers(0, 4))):
+                links.append("L:%s:%d:%s" % ("+-"[rng.integers(0,2)], rng.integers(0, n_unitigs), "+-"[rng.integers(0,2)]))
+
+            name = " ".join(["%d" % i, "LN:i:%d" % length] + links)
+            write_fasta_record(file, name, sequence)
+
+
+"""
+Write the region tarball exactly as merge_bams_by_interval.process_region does: a directory named after the region
+containing one FASTA per sample and the merged coverage.tsv
+"""
+def write_region_tarball(output_directory, contig, start, stop, reference, sample_names, depth, read_length, rng):
+    region_name = "%s_%d-%d" % (contig, start, stop)
+    region_directory = os.path.join(output_directory, region_name)
+    os.makedirs(region_directory)
+
+    coverage_lines = list()
+    n_bytes = 0
+
+    for sample_name in sample_names:
+        haplotype = mutate(reference[start:stop], rate=0.001, rng=rng)
+        reads, mean_depth = simulate_reads(haplotype, depth, read_length, rng)
+
+        fasta_path = os.path.join(region_directory, sample_name + ".fasta")
+        with open(fasta_path, 'wb') as file:
+            for r in range(len(reads)):
+                write_fasta_record(file, "%s_%d" % (sample_name, r), reads[r])
+
+        n_bytes += os.path.getsize(fasta_path)
+
+        coverage_lines.append("%s\t%s\t%d\t%d\t%d\t%d\t%.4f\t%.4f\t30\t60\n" % (sample_name, contig, start, stop, len(reads), stop - start, 100.0, mean_depth))
+
+    with open(os.path.join(region_directory, "coverage.tsv"), 'w') as file:
+        file.write(COVERAGE_HEADER)
+        for line in coverage_lines:
+            file.write(line)
+
+    return write_tarball(region_directory), coverage_lines, n_bytes
+
+
+"""
+Write a fake profile.py result tarball for one tool: coverage.tsv, a log.csv with plausible resource usage, and for
+ggcat, an output FASTA that can be converted to GFA
+"""
+def write_result_tarball(output_directory, region_name, coverage_lines, tool, k, rng):
+    region_directory = os.path.join(output_directory, region_name)
+    os.makedirs(region_directory)
+
+    total_depth = sum(float(l.split('\t')[7]) for l in coverage_lines)
+
+    with open(os.path.join(region_directory, "coverage.tsv"), 'w') as file:
+        file.write(COVERAGE_HEADER)
+        for line in coverage_lines:
+            file.write(line)
+
+    minutes = 0.001*total_depth*float(rng.lognormal(0, 0.2))
+    ram_kbyte = int(10000 + 100*total_depth*float(rng.lognormal(0, 0.2)))
+    cpu_count = 4
+
+    with open(os.path.join(region_directory, "log.csv"), 'w') as file:
+        file.write("elapsed_real_s,%s\n" % format_time(minutes))
+        file.write("elapsed_kernel_s,%.2f\n" % (minutes*6))
+        file.write("ram_max_kbyte,%d\n" % ram_kbyte)
+        file.write("ram_avg_kbyte,0\n")
+        file.write("cpu_percent,%d%%\n" % int(rng.integers(100, 100*cpu_count)))
+        file.write("cpu_count,%d\n" % cpu_count)
+        file.write("k,%d\n" % k)
+
+    if tool == "ggcat":
+        write_fake_ggcat_fasta(os.path.join(region_directory, "ggcat.fasta"), n_unitigs=max(1, int(total_depth*10)), k=k, rng=rng)
+
+    return write_tarball(region_directory)
+
+
+def main(output_directory, n_regions, region_length, n_samples, depth, read_length, k, seed):
+    output_directory = os.path.abspath(output_directory)
+
+    if not os.path.exists(output_directory):
+        os.makedirs(output_directory)
+
+    rng = numpy.random.default_rng(seed)
+
+    contig = "synthetic"
+    reference = rng.integers(0, 4, size=n_regions*region_length).astype(numpy.uint8)
+
+    reference_path = os.path.join(output_directory, "reference.fasta")
+    with open(reference_path, 'wb') as file:
+        write_fasta_record(file, contig, BASES[reference], line_width=60)
+
+    regions_directory = os.path.join(output_directory, "regions")
+    results_directory = os.path.join(output_directory, "results")
+
+    for d in [regions_directory, results_directory]:
+        if os.path.exists(d):
+            exit("ERROR: output directory already contains synthetic data: %s" % d)
+
+        os.makedirs(d)
+
+    sample_names = ["sample%d" % i for i in range(n_samples)]
+
+    bed_path = os.path.join(output_directory, "intervals.bed")
+    result_tarballs = defaultdict(list)
+    n_fasta_bytes = 0
+
+    with open(bed_path, 'w') as bed_file:
+        for r in range(n_regions):
+            start = r*region_length
+            stop = start + region_length
+            region_name = "%s_%d-%d" % (contig, start, stop)
+
+            bed_file.write("%s\t%d\t%d\n" % (contig, start, stop))
+
+            tar_path, coverage_lines, n_bytes = write_region_tarball(
+                output_directory=regions_directory,
+                contig=contig,
+                start=start,
+                stop=stop,
+                reference=reference,
+                sample_names=sample_names,
+                depth=depth,
+                read_length=read_length,
+                rng=rng)
+
+            n_fasta_bytes += n_bytes
+
+            for tool in TOOLS:
+                tool_directory = os.path.join(results_directory, tool)
+                if not os.path.exists(tool_directory):
+                    os.makedirs(tool_directory)
+
+                result_tarballs[tool].append(write_result_tarball(tool_directory, region_name, coverage_lines, tool, k, rng))
+
+    # Input table and config in the format that compare_profile_results.py expects, pointing at the local tarballs
+    results_tsv_path = os.path.join(output_directory, "results.tsv")
+    with open(results_tsv_path, 'w') as file:
+        file.write("\t".join(["name", "bams", "n"] + ["output_tarballs_" + t for t in TOOLS]) + '\n')
+        file.write("\t".join(["synthetic_n%d" % n_samples, ",".join(sample_names), str(n_samples)] + [",".join(result_tarballs[t]) for t in TOOLS]) + '\n')
+
+    config_path = os.path.join(output_directory, "config.json")
+    with open(config_path, 'w') as file:
+        config = [{"label": t, "column_name": "output_tarballs_" + t, "color": [float(c)/255.0 for c in color]} for t,color in TOOLS.items()]
+        json.dump(config, file, indent=2)
+
+    sys.stderr.write("Generated %d regions x %d samples (%.1f MB of reads) in: %s\n" % (n_regions, n_samples, float(n_fasta_bytes)/1e6, output_directory))
+
+    return {
+        "reference": reference_path,
+        "bed": bed_path,
+        "regions": regions_directory,
+        "results": results_directory,
+        "results_tsv": results_tsv_path,
+        "config": config_path,
+        "fasta_bytes": n_fasta_bytes
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+
+    parser.add_argument(
+        "--regions",
+        required=False,
+        default=10,
+        type=int,
+        help="Number of regions to generate"
+    )
+
+    parser.add_argument(
+        "--length",
+        required=False,
+        default=10000,
+        type=int,
+        help="Length of each region"
+    )
+
+    parser.add_argument(
+        "-n",
+        required=False,
+        default=4,
+        type=int,
+        help="Number of samples per region"
+    )
+
+    parser.add_argument(
+        "-d",
+        required=False,
+        default=10,
+        type=float,
+        help="Read depth per sample"
+    )
+
+    parser.add_argument(
+        "-r",
+        required=False,
+        default=150,
+        type=int,
+        help="Read length"
+    )
+
+    parser.add_argument(
+        "-k",
+        required=False,
+        default=31,
+        type=int,
+        help="K value recorded in the fake result logs"
+    )
+
+    parser.add_argument(
+        "--seed",
+        required=False,
+        default=0,
+        type=int,
+        help="Random seed"
+    )
+
+    parser.add_argument(
+        "-o",
+        required=True,
+        type=str,
+        help="Output directory"
+    )
+
+    args = parser.parse_args()
+
+    main(
+        output_directory=args.o,
+        n_regions=args.regions,
+        region_length=args.length,
+        n_samples=args.n,
+        depth=args.d,
+        read_length=args.r,
+        k=args.k,
+        seed=args.seed
+    )
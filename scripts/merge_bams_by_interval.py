@@ -1,5 +1,13 @@
 from module.Authenticator import GoogleToken
+from module.Archive import write_archive, get_archive_path, EXTENSIONS
+from module.Metrics import append_metric
+from module.Events import EventLog, MetricsReporter
+from module.WorkQueue import WorkQueue, run_worker
+from module.Uploader import BackgroundUploader
+from module.Scratch import make_scratch_directory, get_directory_size, move_to_output
+from module.HashSet import Uint64HashSet
 from multiprocessing import Pool
+from collections import deque
 
 import subprocess
 import argparse
@@ -12,11 +20,40 @@ import re
 import io
 
 
+"""
+Point htslib at a local reference for decoding CRAM. REF_CACHE/REF_PATH make CRAM slices whose reference is not given
+with -T get resolved from a shared local cache of sequences by MD5 (see samtools' seq_cache_populate.pl), instead of
+fetching each one over the network. The environment is inherited by every samtools subprocess and pool worker.
+"""
+def set_reference_environment(reference_path, ref_cache):
+    if ref_cache is not None:
+        cache_pattern = os.path.join(os.path.abspath(ref_cache), "%2s", "%2s", "%s")
+        os.environ["REF_CACHE"] = cache_pattern
+        os.environ["REF_PATH"] = cache_pattern
+
+    # Index the reference once up front, rather than letting concurrent samtools processes race to create it
+    if reference_path is not None and not os.path.exists(reference_path + ".fai"):
+        subprocess.run(["samtools", "faidx", reference_path], check=True)
+
+
+"""
+samtools view command that extracts one region to a local BAM. Input may be BAM or CRAM, with the CRAM reference given
+as `reference_path`, so that everything downstream of the extraction is the same for both formats.
+"""
+def get_region_view_args(bam_path, output_path, region_string, reference_path=None):
+    samtools_view_args = ["samtools", "view", "-b", "-h", "-F", "4", "-o", output_path]
+
+    if reference_path is not None:
+        samtools_view_args += ["-T", reference_path]
+
+    return samtools_view_args + [bam_path, region_string]
+
+
 # Requires samtools installed!
-def get_remote_region_as_bam(bam_path, output_path, contig, start, stop, token, index=True):
+def get_remote_region_as_bam(bam_path, output_path, contig, start, stop, token, index=True, reference_path=None):
     region_string = "%s:%d-%d" % (contig, start, stop)
 
-    samtools_view_args = ["samtools", "view", "-b", "-h", "-F", "4", "-o", output_path, bam_path, region_string]
+    samtools_view_args = get_region_view_args(bam_path, output_path, region_string, reference_path)
 
     sys.stderr.write(" ".join(samtools_view_args)+'\n')
 
@@ -50,25 +87,34 @@ def get_remote_region_as_bam(bam_path, output_path, contig, start, stop, token,
     return True
 
 
-def get_region_coverage(bam_path, output_path, contig, start, stop, token):
+"""
+Run samtools coverage on the region and capture its output directly, without an intermediate file.
+Returns the header and the value line, or None if samtools failed.
+"""
+def get_region_coverage(bam_path, contig, start, stop, token):
     region_string = "%s:%d-%d" % (contig, start, stop)
     samtools_args = ["samtools", "coverage", "-r", region_string, bam_path]
 
-    with open(output_path, 'w') as file:
-        sys.stderr.write(" ".join(samtools_args)+'\n')
+    sys.stderr.write(" ".join(samtools_args)+'\n')
 
-        token.update_environment()
-        try:
-            p1 = subprocess.run(samtools_args, stdout=file, check=True, stderr=subprocess.PIPE)
-        except subprocess.CalledProcessError as e:
-            sys.stderr.write("Status : FAIL " + '\n' + (e.stderr.decode("utf8") if e.stderr is not None else "") + '\n')
-            sys.stderr.flush()
-            return False
-        except Exception as e:
-            sys.stderr.write(str(e))
-            return False
+    token.update_environment()
+    try:
+        p1 = subprocess.run(samtools_args, stdout=subprocess.PIPE, check=True, stderr=subprocess.PIPE)
+    except subprocess.CalledProcessError as e:
+        sys.stderr.write("Status : FAIL " + '\n' + (e.stderr.decode("utf8") if e.stderr is not None else "") + '\n')
+        sys.stderr.flush()
+        return None
+    except Exception as e:
+        sys.stderr.write(str(e))
+        return None
 
-    return True
+    lines = p1.stdout.decode("utf8").splitlines(keepends=True)
+
+    if len(lines) < 2:
+        sys.stderr.write("ERROR: unexpected samtools coverage output for %s %s\n" % (bam_path, region_string))
+        return None
+
+    return lines[0], lines[1]
 
 
 def get_reads_from_bam(bam_path, output_path, token):
@@ -92,52 +138,155 @@ def get_reads_from_bam(bam_path, output_path, token):
     return True
 
 
-def merge_coverages(output_directory, expected_sample_count=None):
-    output_filename = "coverage.tsv"
-    output_path = os.path.join(output_directory, output_filename)
+"""
+64 bit hash of a read name. A region can hold millions of reads, so names are deduplicated by hash rather than
+storing the names themselves (collisions are negligible at this scale).
+"""
+def get_read_name_hash(name):
+    return int.from_bytes(hashlib.blake2b(name, digest_size=8).digest(), "little")
+
+
+# Secondary (0x100) and supplementary (0x800) alignments, which samtools fasta never exports
+SECONDARY_FLAGS = 0x900
+
+
+"""
+Number of primary alignments in a BAM, i.e. the records that samtools fasta would export, or None on failure
+"""
+def count_reads(bam_path):
+    args = ["samtools", "view", "-c", "-F", str(SECONDARY_FLAGS), bam_path]
+
+    try:
+        p1 = subprocess.run(args, check=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    except (subprocess.CalledProcessError, OSError) as e:
+        sys.stderr.write("Status : FAIL " + '\n' + (e.stderr.decode("utf8") if getattr(e, "stderr", None) is not None else str(e)) + '\n')
+        sys.stderr.flush()
+        return None
+
+    return int(p1.stdout)
+
+
+"""
+Write the records of a batch whose read names are new to `seen_names` (a Uint64HashSet), and count them
+"""
+def write_new_records(records, seen_names, file, counts):
+    if len(records) == 0:
+        return
+
+    is_new = seen_names.add([name_hash for name_hash,lines in records])
+
+    for (name_hash,lines),new in zip(records, is_new):
+        if new:
+            file.writelines(lines)
+
+    n_new = int(is_new.sum())
+    counts["reads_kept"] += n_new
+    counts["reads_duplicate"] += len(records) - n_new
 
-    with open(output_path, 'w') as out_file:
-        f = 0
-        for filename in os.listdir(output_directory):
-            if filename.endswith(".tsv") and filename != output_filename:
-                path = os.path.join(output_directory, filename)
-                sample = filename.replace("_coverage.tsv","")
 
-                with open(path, 'r') as file:
-                    for l,line in enumerate(file):
+"""
+Export reads like get_reads_from_bam, but drop alignments with any of the `exclude_flags` bits set or with MAPQ
+below `min_mapq`, and drop reads whose name was already exported for this region (tracked in `seen_names`, a
+Uint64HashSet of name hashes shared by all samples of the region). Secondary and supplementary alignments are excluded
+explicitly, as samtools fasta would, so reads_filtered counts only primary alignments removed by the filters. Returns
+the number of reads kept and dropped, or None on failure.
+"""
+def get_filtered_reads_from_bam(bam_path, output_path, token, exclude_flags, min_mapq, seen_names, batch_size=100_000):
+    samtools_view_args = ["samtools", "view", "-u", "-F", str(exclude_flags | SECONDARY_FLAGS), "-q", str(min_mapq), bam_path]
+    samtools_fasta_args = ["samtools", "fasta", "-"]
+
+    sys.stderr.write(" ".join(samtools_view_args) + " | " + " ".join(samtools_fasta_args) + '\n')
+
+    token.update_environment()
+
+    reads_total = count_reads(bam_path)
+    if reads_total is None:
+        return None
+
+    counts = {"reads_total": reads_total, "reads_kept": 0, "reads_duplicate": 0}
+
+    with open(output_path, 'ab') as file:
+        p1 = subprocess.Popen(samtools_view_args, stdout=subprocess.PIPE)
+        p2 = subprocess.Popen(samtools_fasta_args, stdin=p1.stdout, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+        p1.stdout.close()
+
+        # Records are deduplicated in batches, so that the hash set lookups are vectorized
+        records = list()
+
+        for line in p2.stdout:
+            if line.startswith(b'>'):
+                if len(records) == batch_size:
+                    write_new_records(records, seen_names, file, counts)
+                    records = list()
+
+                records.append((get_read_name_hash(line[1:].split()[0]), [line]))
+            elif len(records) > 0:
+                records[-1][1].append(line)
+
+        write_new_records(records, seen_names, file, counts)
 
-                        # Only write the header once
-                        if f == 0 and l == 0:
-                            out_file.write("sample\t" + line[1:])
+        p2.wait()
+        p1.wait()
 
-                        # Always write the values
-                        if l == 1:
-                            out_file.write(sample + '\t' + line)
+    if p1.returncode != 0 or p2.returncode != 0:
+        sys.stderr.write("Status : FAIL " + '\n' + "samtools exited with %d, %d\n" % (p1.returncode, p2.returncode))
+        sys.stderr.flush()
+        return None
+
+    counts["reads_filtered"] = counts["reads_total"] - counts["reads_kept"] - counts["reads_duplicate"]
+
+    return counts
 
-                os.remove(path)
-                f += 1
 
-    if f != expected_sample_count:
-        sys.stderr.write("ERROR: number of coverage TSV objects != number of samples: %d != %d\n" % (f, expected_sample_count))
+"""
+Write the coverage rows collected for each sample (as (sample, header, row) tuples) to a single coverage.tsv, in the
+order given
+"""
+def merge_coverages(coverage_rows, output_directory, expected_sample_count=None):
+    output_path = os.path.join(output_directory, "coverage.tsv")
+
+    with open(output_path, 'w') as out_file:
+        for f,(sample, header, row) in enumerate(coverage_rows):
+            # Only write the header once
+            if f == 0:
+                out_file.write("sample\t" + header[1:])
+
+            out_file.write(sample + '\t' + row)
+
+    if len(coverage_rows) != expected_sample_count:
+        sys.stderr.write("ERROR: number of coverage rows != number of samples: %d != %d\n" % (len(coverage_rows), expected_sample_count))
         return False
     else:
         return True
 
 
-def process_region(bam_paths, contig, start, stop, output_directory, token):
+def process_region(bam_paths, contig, start, stop, output_directory, token, codec="gz", archive_threads=1, scratch_directories=(), scratch_required_bytes=0, reference_path=None, exclude_flags=4, min_mapq=0, deduplicate=False, events=None):
     region_string = "%s:%d-%d" % (contig, start, stop)
     output_subdirectory = region_string.replace(":","_")
-    output_directory = os.path.join(output_directory, output_subdirectory)
+    metrics_path = os.path.join(output_directory, "metrics.csv")
+    final_directory = output_directory
 
-    if not os.path.exists(output_directory):
-        os.makedirs(output_directory)
-    else:
-        sys.stderr.write("WARNING: duplicate region in BED file, skipping %s:%d-%d\n" % (contig, start, stop))
-        return
+    if events is None:
+        events = EventLog(os.path.join(final_directory, "events.jsonl"))
+
+    events.emit("region_start", region=output_subdirectory)
+
+    # BAMs, indexes and FASTAs are written to scratch, and only the region archive is moved to the output directory
+    working_directory, tier = make_scratch_directory(scratch_directories, scratch_required_bytes, final_directory, output_subdirectory)
+    output_directory = os.path.join(working_directory, output_subdirectory)
+    os.makedirs(output_directory)
+
+    append_metric(metrics_path, output_subdirectory, "scratch_tier", tier)
 
     paths_to_validate = list()
+    coverage_rows = list()
     all_success = True
 
+    # Reads can be filtered beyond the unmapped reads excluded by get_remote_region_as_bam
+    filter_reads = deduplicate or exclude_flags != 4 or min_mapq > 0
+    seen_names = Uint64HashSet()
+    read_counts = {"reads_total": 0, "reads_kept": 0, "reads_filtered": 0, "reads_duplicate": 0}
+
     for bam_path in bam_paths:
         sample_name = os.path.basename(bam_path).split('.')[0]
 
@@ -145,39 +294,65 @@ def process_region(bam_paths, contig, start, stop, output_directory, token):
         local_bam_path = os.path.join(output_directory,local_bam_filename)
 
         fasta_path = os.path.join(output_directory, sample_name + ".fasta")
-        coverage_path = os.path.join(output_directory, sample_name + "_coverage.tsv")
 
         paths_to_validate.append(fasta_path)
-        paths_to_validate.append(coverage_path)
 
-        success = get_remote_region_as_bam(
-            bam_path=bam_path,
-            output_path=local_bam_path,
-            contig=contig,
-            start=start,
-            stop=stop,
-            token=token)
+        with events.stage(output_subdirectory, "fetch") as stage:
+            success = get_remote_region_as_bam(
+                bam_path=bam_path,
+                output_path=local_bam_path,
+                contig=contig,
+                start=start,
+                stop=stop,
+                token=token,
+                reference_path=reference_path)
+
+            stage["success"] = success
+            stage["bytes"] = os.path.getsize(local_bam_path) if os.path.exists(local_bam_path) else 0
 
         if not success:
             sys.stderr.write("ERROR: failed to fetch BAM: %s %s\n" % (bam_path, region_string))
             all_success = False
 
-        get_region_coverage(
-            bam_path=local_bam_path,
-            output_path=coverage_path,
-            contig=contig,
-            start=start,
-            stop=stop,
-            token=token)
+        with events.stage(output_subdirectory, "coverage") as stage:
+            coverage = get_region_coverage(
+                bam_path=local_bam_path,
+                contig=contig,
+                start=start,
+                stop=stop,
+                token=token)
 
-        if not success:
-            sys.stderr.write("ERROR: failed to get region coverage: %s %s\n" % (coverage_path, region_string))
-            all_success = False
+            stage["success"] = coverage is not None
 
-        get_reads_from_bam(
-            bam_path=local_bam_path,
-            output_path=fasta_path,
-            token=token)
+        # Rows are kept in the order of the input BAMs, so every region lists its samples in the same order
+        if coverage is None:
+            sys.stderr.write("ERROR: failed to get region coverage: %s %s\n" % (local_bam_path, region_string))
+            all_success = False
+        else:
+            coverage_rows.append((sample_name, coverage[0], coverage[1]))
+
+        with events.stage(output_subdirectory, "reads") as stage:
+            if filter_reads:
+                counts = get_filtered_reads_from_bam(
+                    bam_path=local_bam_path,
+                    output_path=fasta_path,
+                    token=token,
+                    exclude_flags=exclude_flags,
+                    min_mapq=min_mapq,
+                    seen_names=seen_names if deduplicate else Uint64HashSet())
+
+                success = counts is not None
+
+                if success:
+                    for key in read_counts:
+                        read_counts[key] += counts[key]
+            else:
+                success = get_reads_from_bam(
+                    bam_path=local_bam_path,
+                    output_path=fasta_path,
+                    token=token)
+
+            stage["success"] = success
 
         if not success:
             sys.stderr.write("ERROR: failed to get reads from BAM: %s %s\n" % (local_bam_path, region_string))
@@ -203,17 +378,74 @@ def process_region(bam_paths, contig, start, stop, output_directory, token):
             sys.stderr.write("ERROR: expected file path not found: %s\n" % path)
             all_success = False
 
-    merge_coverages(output_directory=output_directory, expected_sample_count=len(bam_paths))
+    if not merge_coverages(coverage_rows=coverage_rows, output_directory=output_directory, expected_sample_count=len(bam_paths)):
+        all_success = False
 
     if all_success:
-        with tarfile.open(output_directory + ".tar.gz", "w:gz") as tar:
-            tar.add(output_directory, arcname=os.path.basename(output_directory))
+        append_metric(metrics_path, output_subdirectory, "scratch_bytes", get_directory_size(output_directory))
+
+        if filter_reads:
+            for key,value in read_counts.items():
+                append_metric(metrics_path, output_subdirectory, key, value)
+
+        with events.stage(output_subdirectory, "archive"):
+            archive_path, seconds, size = write_archive(output_directory, output_directory, codec=codec, n_threads=archive_threads)
+
+            append_metric(metrics_path, output_subdirectory, "archive_s", seconds)
+            append_metric(metrics_path, output_subdirectory, "archive_bytes", size)
+
+            move_to_output(archive_path, final_directory)
+
+        events.emit("region_done", region=output_subdirectory)
     else:
         sys.stderr.write("ERROR: region %s skipped because one or more samples resulted in error\n" % (region_string))
+        events.emit("region_failed", region=output_subdirectory)
 
-    shutil.rmtree(output_directory)
+    shutil.rmtree(working_directory)
 
-    return
+    return all_success
+
+
+def get_region_archive_path(output_directory, contig, start, stop, codec):
+    return get_archive_path(os.path.join(output_directory, "%s_%d-%d" % (contig, start, stop)), codec)
+
+
+"""
+Process one region in a Pool worker, and return its archive path if it succeeded, so that the main process can upload it
+"""
+def process_region_for_upload(args):
+    bam_paths, contig, start, stop, output_directory, token, codec = args[:7]
+
+    if process_region(*args):
+        return get_region_archive_path(output_directory, contig, start, stop, codec)
+
+    return None
+
+
+"""
+One worker process of the distributed mode, which processes regions leased from a shared queue until none are left.
+Each worker uploads its own archives in the background, if an upload destination is given.
+"""
+def run_region_worker(queue, bam_paths, shared_args, upload_args=None):
+    output_directory, token, codec = shared_args[:3]
+
+    uploader = None
+    if upload_args is not None:
+        uploader = BackgroundUploader(**upload_args)
+
+    def process(contig, start, stop):
+        success = process_region(bam_paths, contig, start, stop, *shared_args)
+
+        if success and uploader is not None:
+            uploader.submit(get_region_archive_path(output_directory, contig, start, stop, codec))
+
+        return success
+
+    try:
+        return run_worker(queue, process)
+    finally:
+        if uploader is not None:
+            uploader.close()
 
 
 # Requires samtools installed!
@@ -246,29 +478,96 @@ def get_remote_region_as_fasta(bam_path, contig, start, stop, output_directory,
     return
 
 
-def main(bam_paths, bed_path, output_directory, n_cores):
+def main(bam_paths, bed_path, output_directory, n_cores, codec="gz", archive_threads=1, scratch_directories=(), scratch_required_bytes=0, reference_path=None, ref_cache=None, exclude_flags=4, min_mapq=0, deduplicate=False, metrics_textfile=None, metrics_port=None, queue_path=None, lease_seconds=300, max_attempts=3, upload_uri=None, upload_delete=False, upload_queue=2):
     output_directory = os.path.abspath(output_directory)
 
     if not os.path.exists(output_directory):
         os.makedirs(output_directory)
 
+    if any(p.endswith(".cram") for p in bam_paths) and reference_path is None and ref_cache is None:
+        sys.stderr.write("WARNING: CRAM inputs without --reference or --ref_cache, reference sequences may be fetched remotely\n")
+
+    set_reference_environment(reference_path, ref_cache)
+
     # Contains all the necessary args to fetch a region from the BAMs
     args = list()
 
     token = GoogleToken()
 
+    # Progress of all workers, see module/Events.py
+    events = EventLog(os.path.join(output_directory, "events.jsonl"))
+
+    # Everything but the BAMs and the region itself
+    shared_args = [output_directory, token, codec, archive_threads, scratch_directories, scratch_required_bytes, reference_path, exclude_flags, min_mapq, deduplicate, events]
+
+    regions = set()
+
     with open(bed_path, 'r') as file:
         for l,line in enumerate(file):
             contig,start,stop = line.strip().split()
             start = int(start)
             stop = int(stop)
 
-            args.append([bam_paths, contig, start, stop, output_directory, token])
+            if (contig,start,stop) in regions:
+                sys.stderr.write("WARNING: duplicate region in BED file, skipping %s:%d-%d\n" % (contig, start, stop))
+                continue
+
+            regions.add((contig,start,stop))
+
+            args.append([bam_paths, contig, start, stop] + shared_args)
+
+    n_regions = len(args)
+
+    if queue_path is not None:
+        # Every node enqueues the whole BED file, and only the first one to do so actually adds the regions. Counting
+        # only those keeps the campaign total right when nodes share an output directory.
+        queue = WorkQueue(queue_path, lease_seconds=lease_seconds, max_attempts=max_attempts)
+        n_regions = queue.add([("%s:%d-%d" % (a[1], a[2], a[3]), {"contig": a[1], "start": a[2], "stop": a[3]}) for a in args])
 
-    with Pool(processes=n_cores) as pool:
-        results = pool.starmap(process_region, args)
-        pool.close()
-        pool.join()
+        sys.stderr.write("Added %d of %d regions to queue: %s\n" % (n_regions, len(args), queue.path))
+
+    events.emit("campaign_start", n_regions=n_regions)
+
+    reporter = MetricsReporter(events.path, textfile_path=metrics_textfile, port=metrics_port).start()
+
+    upload_args = None
+    if upload_uri is not None:
+        upload_args = {"destination_uri": upload_uri, "max_queued": upload_queue, "delete": upload_delete, "events": events}
+
+    try:
+        with Pool(processes=n_cores) as pool:
+            if queue_path is not None:
+                results = pool.starmap(run_region_worker, [(queue, bam_paths, shared_args, upload_args)]*n_cores)
+            elif upload_args is not None:
+                # Archives are uploaded from this process while the pool works on the next regions. At most n_cores
+                # regions are started ahead of the upload queue, so a full queue also pauses the workers.
+                uploader = BackgroundUploader(**upload_args)
+                pending = deque()
+
+                try:
+                    for i,region_args in enumerate(args):
+                        pending.append(pool.apply_async(process_region_for_upload, (region_args,)))
+
+                        while len(pending) >= n_cores or (i == len(args) - 1 and len(pending) > 0):
+                            archive_path = pending.popleft().get()
+
+                            if archive_path is not None:
+                                uploader.submit(archive_path)
+                finally:
+                    uploader.close()
+            else:
+                results = pool.starmap(process_region, args)
+
+            pool.close()
+            pool.join()
+    finally:
+        reporter.stop()
+
+    if queue_path is not None:
+        sys.stderr.write("This node completed %d and failed %d regions, queue state: %s\n" % (
+            sum(r[0] for r in results),
+            sum(r[1] for r in results),
+            ", ".join("%s: %d" % item for item in sorted(queue.get_counts().items()))))
 
     sys.stderr.write("Files prepared:\n")
     for filename in os.listdir(output_directory):
@@ -287,7 +586,7 @@ if __name__ == "__main__":
         "--bams",
         required=True,
         type=parse_comma_separated_string,
-        help="Input BAMs to be chunked (comma separated list)"
+        help="Input BAMs or CRAMs to be chunked (comma separated list)"
     )
 
     parser.add_argument(
@@ -311,6 +610,172 @@ if __name__ == "__main__":
         help="Output directory"
     )
 
+    parser.add_argument(
+        "--archive",
+        required=False,
+        default="gz",
+        choices=list(EXTENSIONS),
+        help="Compression codec for the region archives. zstd and lz4 need the zstandard/lz4 python packages or executables"
+    )
+
+    parser.add_argument(
+        "--archive_threads",
+        required=False,
+        default=1,
+        type=int,
+        help="Number of compression threads per region archive (zstd and bgzf)"
+    )
+
+    parser.add_argument(
+        "--scratch",
+        required=False,
+        default=[],
+        type=parse_comma_separated_string,
+        help="Scratch directories for the per-region BAMs and FASTAs (comma separated, fastest first, e.g. "
+             "/dev/shm,/mnt/nvme). Each region uses the first one with enough free space, or the output directory"
+    )
+
+    parser.add_argument(
+        "--scratch_gb",
+        required=False,
+        default=1,
+        type=float,
+        help="Free space (GB) a scratch directory must have to be used for a region"
+    )
+
+    parser.add_argument(
+        "--reference",
+        required=False,
+        default=None,
+        type=str,
+        help="Local FASTA reference used to decode CRAM inputs (passed to samtools view -T)"
+    )
+
+    parser.add_argument(
+        "--ref_cache",
+        required=False,
+        default=None,
+        type=str,
+        help="Shared directory of reference sequences by MD5 (as built by seq_cache_populate.pl), used for REF_CACHE/REF_PATH"
+    )
+
+    parser.add_argument(
+        "--exclude_flags",
+        required=False,
+        default=4,
+        type=lambda x: int(x, 0),
+        help="Reads with any of these SAM flag bits are not exported (decimal or hex, default 4: unmapped). For example "
+             "0xF04 also drops secondary, QC fail, duplicate and supplementary alignments"
+    )
+
+    parser.add_argument(
+        "--min_mapq",
+        required=False,
+        default=0,
+        type=int,
+        help="Minimum mapping quality of exported reads"
+    )
+
+    parser.add_argument(
+        "--deduplicate",
+        required=False,
+        action="store_true",
+        help="Export each read name at most once per region. Counts of kept, filtered and duplicate reads are written "
+             "to metrics.csv whenever reads are filtered"
+    )
+
+    parser.add_argument(
+        "--metrics_textfile",
+        required=False,
+        default=None,
+        type=str,
+        help="Periodically write progress metrics (completed/failed/in-flight regions, bytes fetched, stage latencies, "
+             "ETA) to this Prometheus textfile (e.g. for the node_exporter textfile collector). Structured events are "
+             "always logged to events.jsonl in the output directory"
+    )
+
+    parser.add_argument(
+        "--metrics_port",
+        required=False,
+        default=None,
+        type=int,
+        help="Serve the same progress metrics at http://127.0.0.1:<port>/metrics"
+    )
+
+    parser.add_argument(
+        "--upload",
+        required=False,
+        default=None,
+        type=str,
+        help="gs:// prefix to upload each region archive to in the background, while the next regions are processed. "
+             "Uploads are verified by MD5. STORAGE_EMULATOR_HOST can be set to use a local fake GCS server"
+    )
+
+    parser.add_argument(
+        "--upload_delete",
+        required=False,
+        action="store_true",
+        help="Delete local archives once their upload is verified"
+    )
+
+    parser.add_argument(
+        "--upload_queue",
+        required=False,
+        default=2,
+        type=int,
+        help="Maximum number of finished archives waiting for upload (per uploader). Workers wait while the queue is "
+             "full, which bounds the local disk used by archives that are not yet uploaded"
+    )
+
+    parser.add_argument(
+        "--queue",
+        required=False,
+        default=None,
+        type=str,
+        help="Distributed mode: SQLite file on shared storage (with working POSIX locks) holding the regions as a work "
+             "queue. Every node runs the same command, the BED regions are enqueued once, and each of the -c worker "
+             "processes on each node leases regions until none are left. Regions of dead workers are leased again "
+             "once their lease expires"
+    )
+
+    parser.add_argument(
+        "--lease_seconds",
+        required=False,
+        default=300,
+        type=int,
+        help="How long a region stays leased without a heartbeat (heartbeats are sent every third of this)"
+    )
+
+    parser.add_argument(
+        "--max_attempts",
+        required=False,
+        default=3,
+        type=int,
+        help="Number of times a region is attempted before it is marked as failed in the queue"
+    )
+
     args = parser.parse_args()
 
-    main(bam_paths=args.bams, bed_path=args.bed, output_directory=args.o, n_cores=args.c)
+    main(
+        bam_paths=args.bams,
+        bed_path=args.bed,
+        output_directory=args.o,
+        n_cores=args.c,
+        codec=args.archive,
+        archive_threads=args.archive_threads,
+        scratch_directories=args.scratch,
+        scratch_required_bytes=int(args.scratch_gb*1e9),
+        reference_path=args.reference,
+        ref_cache=args.ref_cache,
+        exclude_flags=args.exclude_flags,
+        min_mapq=args.min_mapq,
+        deduplicate=args.deduplicate,
+        metrics_textfile=args.metrics_textfile,
+        metrics_port=args.metrics_port,
+        queue_path=args.queue,
+        lease_seconds=args.lease_seconds,
+        max_attempts=args.max_attempts,
+        upload_uri=args.upload,
+        upload_delete=args.upload_delete,
+        upload_queue=args.upload_queue
+    )
@@ -0,0 +1,217 @@
+from module.Bgzf import BgzfReader, BgzfWriter, is_bgzf
+
+from contextlib import contextmanager
+import subprocess
+import tarfile
+import shutil
+import gzip
+import time
+import os
+
+
+EXTENSIONS = {
+    "gz": ".tar.gz",
+    "bgzf": ".tar.gz",
+    "zstd": ".tar.zst",
+    "lz4": ".tar.lz4",
+    "none": ".tar",
+}
+
+# Leading bytes of each compressed format, used to detect the codec when reading
+MAGIC = {
+    b"\x1f\x8b": "gz",
+    b"\x28\xb5\x2f\xfd": "zstd",
+    b"\x04\x22\x4d\x18": "lz4",
+}
+
+
+def get_archive_path(prefix, codec):
+    if codec not in EXTENSIONS:
+        raise ValueError("ERROR: unrecognized archive codec: %s (choices: %s)" % (codec, ", ".join(EXTENSIONS)))
+
+    return prefix + EXTENSIONS[codec]
+
+
+"""
+Strip any known archive extension from a path, e.g. /a/region_0-100.tar.zst -> region_0-100
+"""
+def get_archive_name(path):
+    return os.path.basename(path).split('.')[0]
+
+
+def detect_codec(path):
+    with open(path, 'rb') as file:
+        head = file.read(4)
+
+    for magic,codec in MAGIC.items():
+        if head.startswith(magic):
+            return codec
+
+    return "none"
+
+
+"""
+Wrap a binary file object in a compressor for the given codec. zstd and lz4 use their python bindings if installed,
+and otherwise pipe through the command line tool. Returns the wrapped file object and a function that finalizes it.
+"""
+def open_compressor(file, codec, n_threads, level):
+    # BGZF is block-parallel gzip, and is readable as a regular .tar.gz
+    if codec == "bgzf":
+        writer = BgzfWriter(file, n_threads=n_threads, level=level if level is not None else 6)
+        return writer, writer.close
+
+    elif codec == "zstd":
+        try:
+            import zstandard
+            compressor = zstandard.ZstdCompressor(level=level if level is not None else 3, threads=n_threads)
+            writer = compressor.stream_writer(file, closefd=False)
+            return writer, writer.close
+        except ImportError:
+            args = ["zstd", "-q", "-c", "-T%d" % n_threads, "-%d" % (level if level is not None else 3)]
+
+    elif codec == "lz4":
+        try:
+            import lz4.frame
+            writer = lz4.frame.open(file, mode='wb', compression_level=level if level is not None else 0)
+            return writer, writer.close
+        except ImportError:
+            args = ["lz4", "-q", "-c", "-%d" % (level if level is not None else 1)]
+
+    else:
+        raise ValueError("ERROR: no external compressor for codec: %s" % codec)
+
+    if shutil.which(args[0]) is None:
+        raise RuntimeError("ERROR: %s archives require either the python package or the '%s' executable" % (codec, args[0]))
+
+    process = subprocess.Popen(args, stdin=subprocess.PIPE, stdout=file)
+
+    def close():
+        process.stdin.close()
+        if process.wait() != 0:
+            raise RuntimeError("ERROR: compression failed: %s" % " ".join(args))
+
+    return process.stdin, close
+
+
+"""
+Wrap a binary file object in a decompressor for the given codec. Returns the decompressed stream, the decompressor
+subprocess if one was used, and the name of the method. gzip is inflated block-parallel when the input is BGZF,
+with pigz when it is installed and threads are available, and with python's gzip module otherwise.
+"""
+def open_decompressor(file, codec, path, n_threads=1):
+    if codec == "none":
+        return file, None, "none"
+
+    if codec == "gz":
+        if is_bgzf(path):
+            return BgzfReader(file, n_threads=n_threads), None, "bgzf"
+
+        elif n_threads > 1 and shutil.which("pigz") is not None:
+            args = ["pigz", "-d", "-c", "-p", str(n_threads)]
+            codec = "pigz"
+
+        else:
+            return gzip.GzipFile(fileobj=file, mode='rb'), None, "gzip"
+
+    elif codec == "zstd":
+        try:
+            import zstandard
+            return zstandard.ZstdDecompressor().stream_reader(file), None, "zstd"
+        except ImportError:
+            args = ["zstd", "-q", "-d", "-c"]
+
+    elif codec == "lz4":
+        try:
+            import lz4.frame
+            return lz4.frame.open(file, mode='rb'), None, "lz4"
+        except ImportError:
+            args = ["lz4", "-q", "-d", "-c"]
+
+    else:
+        raise ValueError("ERROR: no external decompressor for codec: %s" % codec)
+
+    process = subprocess.Popen(args, stdin=file, stdout=subprocess.PIPE)
+
+    return process.stdout, process, args[0] if codec != "pigz" else "pigz"
+
+
+"""
+Pass-through reader that counts the decompressed bytes handed to tarfile
+"""
+class CountingReader:
+    def __init__(self, reader):
+        self.reader = reader
+        self.n_bytes = 0
+
+    def read(self, size=-1):
+        data = self.reader.read(size)
+        self.n_bytes += len(data)
+        return data
+
+
+"""
+Archive a directory as <prefix>.tar[.gz|.zst|.lz4], with the directory's name as the top level of the archive.
+Returns the archive path, the seconds spent archiving, and the archive size in bytes.
+"""
+def write_archive(directory, prefix, codec="gz", n_threads=1, level=None):
+    path = get_archive_path(prefix, codec)
+
+    t = time.perf_counter()
+
+    if codec in ("gz", "none"):
+        mode = "w:gz" if codec == "gz" else "w"
+        kwargs = {"compresslevel": level} if (codec == "gz" and level is not None) else {}
+
+        with tarfile.open(path, mode, **kwargs) as tar:
+            tar.add(directory, arcname=os.path.basename(directory))
+    else:
+        with open(path, 'wb') as file:
+            writer, close = open_compressor(file, codec, n_threads, level)
+
+            with tarfile.open(fileobj=writer, mode="w|") as tar:
+                tar.add(directory, arcname=os.path.basename(directory))
+
+            close()
+
+    seconds = time.perf_counter() - t
+
+    return path, seconds, os.path.getsize(path)
+
+
+"""
+Open an archive written by write_archive (or any plain/gzipped tar) for sequential reading, detecting the codec from
+its leading bytes and decompressing with up to `n_threads` threads. Members must be read in order, e.g.:
+
+    with open_archive(path) as tar:
+        for item in tar:
+            f = tar.extractfile(item)
+
+If `stats` is a dict, the decompression method, compressed and decompressed bytes, and seconds spent are stored in it
+when the archive is closed. Reading may stop early, in which case only the bytes read so far are counted.
+"""
+@contextmanager
+def open_archive(path, n_threads=1, stats=None):
+    codec = detect_codec(path)
+
+    t = time.perf_counter()
+
+    with open(path, 'rb') as file:
+        reader, process, method = open_decompressor(file, codec, path, n_threads)
+        counter = CountingReader(reader)
+
+        try:
+            with tarfile.open(fileobj=counter, mode="r|") as tar:
+                yield tar
+        finally:
+            if reader is not file:
+                reader.close()
+
+            # Reading may stop early, in which case the decompressor exits on a broken pipe
+            if process is not None:
+                process.wait()
+
+            if stats is not None:
+                stats["method"] = method
+                stats["compressed_bytes"] = file.tell() if process is None else os.path.getsize(path)
+                stats["decompressed_bytes"] = counter.n_bytes
+                stats["seconds"] = time.perf_counter() - t
@@ -0,0 +1,191 @@
+from concurrent.futures import ThreadPoolExecutor
+from collections import deque
+import struct
+import zlib
+import io
+
+
+# Uncompressed bytes per block, as used by htslib, so that a compressed block always fits in 64KB
+BLOCK_SIZE = 0xff00
+
+BLOCKS_PER_BATCH = 64
+
+EOF_BLOCK = bytes.fromhex("1f8b08040000000000ff0600424302001b0003000000000000000000")
+
+
+"""
+BGZF (as used by BAM, bgzip and tabix) is a series of independent gzip members of at most 64KB, each recording its own
+compressed size in a 'BC' extra field. Because blocks can be found without inflating anything, they can be inflated
+in parallel, and the result is still a valid gzip file for any other reader.
+"""
+def is_bgzf(path):
+    with open(path, 'rb') as file:
+        header = file.read(18)
+
+    if len(header) < 18 or header[:4] != b"\x1f\x8b\x08\x04":
+        return False
+
+    xlen = struct.unpack("<H", header[10:12])[0]
+
+    return xlen >= 6 and header[12:14] == b"BC"
+
+
+def read_block(file):
+    header = file.read(12)
+
+    if len(header) == 0:
+        return None
+
+    if len(header) < 12 or header[:4] != b"\x1f\x8b\x08\x04":
+        raise ValueError("ERROR: not a BGZF block at offset %d" % (file.tell() - len(header)))
+
+    xlen = struct.unpack("<H", header[10:12])[0]
+    extra = file.read(xlen)
+
+    # Find the BC subfield, which holds the total block size - 1
+    block_size = None
+    i = 0
+    while i + 4 <= len(extra):
+        slen = struct.unpack("<H", extra[i+2:i+4])[0]
+
+        if extra[i:i+2] == b"BC":
+            block_size = struct.unpack("<H", extra[i+4:i+6])[0] + 1
+
+        i += 4 + slen
+
+    if block_size is None:
+        raise ValueError("ERROR: gzip member without BGZF block size")
+
+    return file.read(block_size - 12 - xlen)
+
+
+def inflate_blocks(blocks):
+    output = list()
+
+    for block in blocks:
+        data = zlib.decompress(block[:-8], -15)
+        crc, size = struct.unpack("<II", block[-8:])
+
+        if len(data) != size or zlib.crc32(data) != crc:
+            raise ValueError("ERROR: BGZF block failed integrity check")
+
+        output.append(data)
+
+    return b"".join(output)
+
+
+def deflate_blocks(data, level):
+    output = list()
+
+    for start in range(0, len(data), BLOCK_SIZE):
+        chunk = data[start:start+BLOCK_SIZE]
+
+        compressor = zlib.compressobj(level, zlib.DEFLATED, -15)
+        compressed = compressor.compress(chunk) + compressor.flush()
+
+        output.append(struct.pack("<BBBBIBBHBBHH", 31, 139, 8, 4, 0, 0, 255, 6, 66, 67, 2, len(compressed) + 25))
+        output.append(compressed)
+        output.append(struct.pack("<II", zlib.crc32(chunk), len(chunk)))
+
+    return b"".join(output)
+
+
+"""
+Sequential reader of a BGZF file that inflates batches of blocks on a thread pool (zlib releases the GIL), keeping a
+bounded number of batches in flight and returning data in order
+"""
+class BgzfReader(io.RawIOBase):
+    def __init__(self, file, n_threads=1):
+        self.file = file
+        self.executor = ThreadPoolExecutor(max_workers=n_threads)
+        self.max_in_flight = 2*n_threads
+        self.in_flight = deque()
+        self.buffer = memoryview(b"")
+        self.end_of_file = False
+
+    def readable(self):
+        return True
+
+    def submit_batches(self):
+        while not self.end_of_file and len(self.in_flight) < self.max_in_flight:
+            blocks = list()
+
+            for i in range(BLOCKS_PER_BATCH):
+                block = read_block(self.file)
+
+                if block is None:
+                    self.end_of_file = True
+                    break
+
+                blocks.append(block)
+
+            if len(blocks) > 0:
+                self.in_flight.append(self.executor.submit(inflate_blocks, blocks))
+
+    def readinto(self, b):
+        while len(self.buffer) == 0:
+            self.submit_batches()
+
+            if len(self.in_flight) == 0:
+                return 0
+
+            self.buffer = memoryview(self.in_flight.popleft().result())
+
+        n = min(len(b), len(self.buffer))
+        b[:n] = self.buffer[:n]
+        self.buffer = self.buffer[n:]
+
+        return n
+
+    def close(self):
+        if not self.closed:
+            for future in self.in_flight:
+                future.cancel()
+
+            self.executor.shutdown(wait=True)
+
+        super().close()
+
+
+"""
+Writer that splits its input into BGZF blocks and deflates batches of them on a thread pool, writing them in order
+"""
+class BgzfWriter(io.RawIOBase):
+    def __init__(self, file, n_threads=1, level=6):
+        self.file = file
+        self.level = level
+        self.executor = ThreadPoolExecutor(max_workers=n_threads)
+        self.max_in_flight = 2*n_threads
+        self.in_flight = deque()
+        self.buffer = bytearray()
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self.buffer += data
+
+        batch_size = BLOCK_SIZE*BLOCKS_PER_BATCH
+
+        while len(self.buffer) >= batch_size:
+            self.in_flight.append(self.executor.submit(deflate_blocks, bytes(self.buffer[:batch_size]), self.level))
+            del self.buffer[:batch_size]
+
+            while len(self.in_flight) >= self.max_in_flight:
+                self.file.write(self.in_flight.popleft().result())
+
+        return len(data)
+
+    def close(self):
+        if not self.closed:
+            if len(self.buffer) > 0:
+                self.in_flight.append(self.executor.submit(deflate_blocks, bytes(self.buffer), self.level))
+                self.buffer = bytearray()
+
+            while len(self.in_flight) > 0:
+                self.file.write(self.in_flight.popleft().result())
+
+            self.file.write(EOF_BLOCK)
+            self.executor.shutdown(wait=True)
+
+        super().close()
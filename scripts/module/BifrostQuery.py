@@ -0,0 +1,68 @@
+from threading import Lock
+import subprocess
+import sys
+
+
+"""
+Handle to a long-lived `query_gfa_with_bifrost --batch` process. The graph is loaded once when the process starts,
+and each call to query() sends one batch of sequences over stdin and reads back one (name, n_kmers, n_found) tuple
+per sequence, in order.
+"""
+class BifrostQueryServer:
+    def __init__(self, gfa_path, n_threads=1, executable="query_gfa_with_bifrost"):
+        self.args = [executable, "-g", gfa_path, "-t", str(n_threads), "--batch"]
+
+        sys.stderr.write(" ".join(self.args)+'\n')
+
+        self.process = subprocess.Popen(self.args, stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+        self.lock = Lock()
+
+    def query(self, records):
+        with self.lock:
+            for name,sequence in records:
+                self.process.stdin.write(b">" + name.encode("utf8") + b"\n")
+                self.process.stdin.write(sequence + b"\n")
+
+            self.process.stdin.write(b"//\n")
+            self.process.stdin.flush()
+
+            results = list()
+            for line in self.process.stdout:
+                if line == b"//\n":
+                    break
+
+                name, n_kmers, n_found = line.decode("utf8").rstrip('\n').split('\t')
+                results.append((name, int(n_kmers), int(n_found)))
+            else:
+                raise RuntimeError("ERROR: query process exited unexpectedly: %s" % " ".join(self.args))
+
+        return results
+
+    def close(self):
+        self.process.stdin.close()
+        self.process.wait()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+def iterate_fasta_records(path):
+    with open(path, 'rb') as file:
+        name = None
+        sequence = list()
+
+        for line in file:
+            if line.startswith(b'>'):
+                if name is not None:
+                    yield name, b"".join(sequence)
+
+                name = line[1:].split()[0].decode("utf8")
+                sequence = list()
+            else:
+                sequence.append(line.strip())
+
+        if name is not None:
+            yield name, b"".join(sequence)
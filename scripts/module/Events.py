@@ -0,0 +1,283 @@
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from contextlib import contextmanager
+import threading
+import json
+import math
+import time
+import os
+
+
+"""
+Structured log of campaign progress, one JSON object per line. Like append_metric, each event is a single write() on
+a file opened with O_APPEND, so events from threads and from the processes of a multiprocessing Pool are never
+interleaved, and the log object itself (just a path) can be passed to Pool workers. Every event carries a wall clock
+timestamp, the writer's pid, and an event type:
+
+    campaign_start  total number of regions (or builds) that the campaign will attempt
+    campaign_extend number of regions (or builds) added to the total, e.g. as a queue worker leases them
+    region_start    a worker started on a region
+    stage           one stage of a region finished: stage name, seconds, success, and optionally bytes
+    region_done     a region finished successfully
+    region_failed   a region finished with an error
+    region_skipped  a region was not attempted (e.g. by admission control)
+"""
+class EventLog:
+    def __init__(self, path):
+        self.path = path
+
+    def emit(self, event, region=None, **fields):
+        record = {"time": round(time.time(), 6), "pid": os.getpid(), "event": event}
+
+        if region is not None:
+            record["region"] = region
+
+        record.update(fields)
+
+        line = json.dumps(record, separators=(',', ':')) + '\n'
+
+        fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+
+        try:
+            os.write(fd, line.encode("utf8"))
+        finally:
+            os.close(fd)
+
+    """
+    Time the body of a with-block as one stage of a region. The yielded dict can be updated with extra fields, e.g.
+    `success` or `bytes`, before the stage event is written. An exception in the body is recorded as a failed stage.
+    """
+    @contextmanager
+    def stage(self, region, stage):
+        fields = {"success": True}
+        t = time.perf_counter()
+
+        try:
+            yield fields
+        except BaseException:
+            fields["success"] = False
+            raise
+        finally:
+            self.emit("stage", region=region, stage=stage, seconds=round(time.perf_counter() - t, 6), **fields)
+
+
+def get_percentile(sorted_values, fraction):
+    if len(sorted_values) == 0:
+        return 0.0
+
+    # Nearest rank
+    return sorted_values[max(0, math.ceil(fraction*len(sorted_values)) - 1)]
+
+
+"""
+Running totals over an event log, updated incrementally by reading only the lines appended since the last update.
+Safe to share between the threads of one process.
+"""
+class EventSummary:
+    def __init__(self, path):
+        self.path = path
+        self.offset = 0
+        self.lock = threading.Lock()
+
+        self.n_total = 0
+        self.started = set()
+        self.n_done = 0
+        self.n_failed = 0
+        self.n_skipped = 0
+        self.bytes_fetched = 0
+        self.builder_seconds = 0.0
+        self.first_time = None
+        self.last_time = None
+        self.stage_seconds = dict()
+
+    def add_event(self, record):
+        event = record["event"]
+
+        if self.first_time is None:
+            self.first_time = record["time"]
+
+        self.last_time = record["time"]
+
+        if event == "campaign_start" or event == "campaign_extend":
+            self.n_total += record.get("n_regions", 0)
+        elif event == "region_start":
+            self.started.add(record["region"])
+        elif event == "region_done":
+            self.n_done += 1
+            self.started.discard(record["region"])
+        elif event == "region_failed":
+            self.n_failed += 1
+            self.started.discard(record["region"])
+        elif event == "region_skipped":
+            self.n_skipped += 1
+        elif event == "stage":
+            self.stage_seconds.setdefault(record["stage"], list()).append(record["seconds"])
+            self.bytes_fetched += record.get("bytes", 0)
+
+            if record["stage"] == "build":
+                self.builder_seconds += record["seconds"]
+
+    def update(self):
+        with self.lock:
+            if not os.path.exists(self.path):
+                return
+
+            with open(self.path, 'rb') as file:
+                file.seek(self.offset)
+                data = file.read()
+
+            # A line that is still being written is left for the next update
+            end = data.rfind(b'\n') + 1
+            self.offset += end
+
+            for line in data[:end].splitlines():
+                if len(line) > 0:
+                    self.add_event(json.loads(line))
+
+    """
+    Current values of all metrics, as a list of (name, labels, value, help)
+    """
+    def get_metrics(self):
+        with self.lock:
+            n_finished = self.n_done + self.n_failed + self.n_skipped
+            n_remaining = max(0, self.n_total - n_finished)
+
+            # The clock stops at the last event once every region is finished
+            if self.first_time is None:
+                elapsed = 0.0
+            elif n_remaining == 0 and len(self.started) == 0:
+                elapsed = self.last_time - self.first_time
+            else:
+                elapsed = time.time() - self.first_time
+
+            # Throughput and ETA are from regions that actually ran, since skipped regions take no time
+            rate = (self.n_done + self.n_failed)/elapsed if elapsed > 0 else 0.0
+            eta = n_remaining/rate if rate > 0 else float("nan")
+
+            metrics = [
+                ("campaign_regions_total", {}, self.n_total, "Regions the campaign will attempt"),
+                ("campaign_regions_completed", {}, self.n_done, "Regions finished successfully"),
+                ("campaign_regions_failed", {}, self.n_failed, "Regions finished with an error"),
+                ("campaign_regions_skipped", {}, self.n_skipped, "Regions not attempted"),
+                ("campaign_regions_in_flight", {}, len(self.started), "Regions started but not finished"),
+                ("campaign_bytes_fetched", {}, self.bytes_fetched, "Bytes fetched or decompressed by all stages"),
+                ("campaign_builder_seconds", {}, self.builder_seconds, "Wall seconds spent in graph builders"),
+                ("campaign_elapsed_seconds", {}, elapsed, "Seconds since the first event"),
+                ("campaign_regions_per_hour", {}, rate*3600, "Finished regions per hour"),
+                ("campaign_eta_seconds", {}, eta, "Estimated seconds until all regions are finished"),
+            ]
+
+            for stage,values in sorted(self.stage_seconds.items()):
+                values = sorted(values)
+                labels = {"stage": stage}
+
+                metrics.append(("campaign_stage_count", labels, len(values), "Finished stages"))
+                metrics.append(("campaign_stage_seconds_avg", labels, sum(values)/len(values), "Mean stage latency"))
+                metrics.append(("campaign_stage_seconds_p95", labels, get_percentile(values, 0.95), "95th percentile stage latency"))
+
+            return metrics
+
+    """
+    Metrics in the Prometheus text exposition format
+    """
+    def to_prometheus(self):
+        lines = list()
+
+        # All samples of one metric must be listed together, under a single HELP and TYPE
+        families = dict()
+        for name,labels,value,description in self.get_metrics():
+            families.setdefault((name, description), list()).append((labels, value))
+
+        for (name,description),samples in families.items():
+            lines.append("# HELP %s %s" % (name, description))
+            lines.append("# TYPE %s gauge" % name)
+
+            for labels,value in samples:
+                lines.append(self.format_sample(name, labels, value))
+
+        return "\n".join(lines) + "\n"
+
+    @staticmethod
+    def format_sample(name, labels, value):
+        label_string = ",".join('%s="%s"' % (k, v) for k,v in labels.items())
+
+        if len(label_string) > 0:
+            name = "%s{%s}" % (name, label_string)
+
+        return "%s %s" % (name, "NaN" if math.isnan(value) else repr(float(value)))
+
+
+"""
+Background reporter for an event log, run in the main process of a campaign. It periodically rewrites a Prometheus
+textfile (for the node_exporter textfile collector, written to a temporary name and renamed so it is never read
+partially), and/or serves the same metrics over HTTP at http://<host>:<port>/metrics. Either can be None.
+"""
+class MetricsReporter:
+    def __init__(self, events_path, textfile_path=None, port=None, host="127.0.0.1", interval=15):
+        self.summary = EventSummary(events_path)
+        self.textfile_path = textfile_path
+        self.port = port
+        self.host = host
+        self.interval = interval
+
+        self.stop_event = threading.Event()
+        self.thread = None
+        self.server = None
+
+    def write_textfile(self):
+        tmp_path = self.textfile_path + ".tmp.%d" % os.getpid()
+
+        with open(tmp_path, 'w') as file:
+            file.write(self.summary.to_prometheus())
+
+        os.rename(tmp_path, self.textfile_path)
+
+    def run(self):
+        while not self.stop_event.wait(self.interval):
+            self.summary.update()
+            self.write_textfile()
+
+    def start(self):
+        if self.textfile_path is not None:
+            self.thread = threading.Thread(target=self.run, daemon=True)
+            self.thread.start()
+
+        if self.port is not None:
+            summary = self.summary
+
+            class Handler(BaseHTTPRequestHandler):
+                def do_GET(self):
+                    if self.path.split('?')[0] not in ("/", "/metrics"):
+                        self.send_error(404)
+                        return
+
+                    summary.update()
+                    body = summary.to_prometheus().encode("utf8")
+
+                    self.send_response(200)
+                    self.send_header("Content-Type", "text/plain; version=0.0.4")
+                    self.send_header("Content-Length", str(len(body)))
+                    self.end_headers()
+                    self.wfile.write(body)
+
+                def log_message(self, format, *args):
+                    return
+
+            self.server = ThreadingHTTPServer((self.host, self.port), Handler)
+            threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+        return self
+
+    def stop(self):
+        self.stop_event.set()
+
+        if self.thread is not None:
+            self.thread.join()
+
+        # Final state, so that the textfile reflects the finished campaign
+        if self.textfile_path is not None:
+            self.summary.update()
+            self.write_textfile()
+
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
@@ -0,0 +1,232 @@
+from module.Edge import Edge
+
+from array import array
+import gzip
+
+
+LEFT = 0
+RIGHT = 1
+
+
+"""
+Streaming statistics of a bidirected graph (GFA, or ggcat/BCALM formatted FASTA), computed in one pass with memory
+proportional to the number of nodes. Sequences are never stored: each node name is mapped to an integer ID, and only
+per-node integer arrays are kept (length, degree of each side, one neighbor per side, and a union-find parent).
+"""
+class GraphStats:
+    def __init__(self):
+        self.ids = dict()
+        self.lengths = array('Q')
+        self.degrees = [array('I'), array('I')]
+
+        # One neighbor (encoded as 2*id + side) per side, used to find simple bubbles, -1 if none
+        self.neighbors = [array('q'), array('q')]
+
+        self.parents = array('q')
+
+        self.n_edges = 0
+
+    def get_id(self, name):
+        id = self.ids.get(name)
+
+        if id is None:
+            id = len(self.ids)
+            self.ids[name] = id
+            self.lengths.append(0)
+            self.degrees[LEFT].append(0)
+            self.degrees[RIGHT].append(0)
+            self.neighbors[LEFT].append(-1)
+            self.neighbors[RIGHT].append(-1)
+            self.parents.append(id)
+
+        return id
+
+    def add_node(self, name, length):
+        id = self.get_id(name)
+        self.lengths[id] = length
+
+    def find(self, id):
+        # Path halving
+        while self.parents[id] != id:
+            self.parents[id] = self.parents[self.parents[id]]
+            id = self.parents[id]
+
+        return id
+
+    def union(self, a, b):
+        a = self.find(a)
+        b = self.find(b)
+
+        if a != b:
+            if a < b:
+                self.parents[b] = a
+            else:
+                self.parents[a] = b
+
+    """
+    Add an edge from one side of node a to one side of node b (GFA semantics: 'a + b +' connects the right side of
+    a to the left side of b)
+    """
+    def add_edge(self, name_a, reversal_a, name_b, reversal_b):
+        a = self.get_id(name_a)
+        b = self.get_id(name_b)
+
+        side_a = LEFT if reversal_a else RIGHT
+        side_b = RIGHT if reversal_b else LEFT
+
+        self.degrees[side_a][a] += 1
+        self.neighbors[side_a][a] = 2*b + side_b
+
+        # A self loop on the same side only counts once toward the degree
+        if not (a == b and side_a == side_b):
+            self.degrees[side_b][b] += 1
+            self.neighbors[side_b][b] = 2*a + side_a
+
+        self.union(a, b)
+        self.n_edges += 1
+
+    def parse_gfa(self, file):
+        for line in file:
+            if line.startswith('S'):
+                tokens = line.rstrip('\n').split('\t')
+                length = len(tokens[2])
+
+                # Sequence may be omitted ('*'), in which case the length is given as a tag
+                if tokens[2] == '*':
+                    length = 0
+                    for t in tokens[3:]:
+                        if t.startswith("LN:i:"):
+                            length = int(t[5:])
+
+                self.add_node(tokens[1], length)
+
+            elif line.startswith('L'):
+                tokens = line.split('\t')
+                self.add_edge(tokens[1], tokens[2] == '-', tokens[3], tokens[4] == '-')
+
+    """
+    Parse a FASTA of unitigs. If the headers have BCALM link annotations (as in ggcat output) then each edge is listed
+    from both of its nodes, so only one of the two equivalent representations is counted. Plain unitig FASTAs
+    (e.g. cuttlefish output) contribute only nodes.
+    """
+    def parse_fasta(self, file):
+        name = None
+        length = 0
+
+        for line in file:
+            if line.startswith('>'):
+                if name is not None:
+                    self.add_node(name, length)
+
+                name, edges = Edge.parse_bcalm_string(line[1:])
+                length = 0
+
+                for e in edges:
+                    if e.id_a < e.id_b or (e.id_a == e.id_b and not (e.reversal_a and e.reversal_b)):
+                        self.add_edge(e.id_a, e.reversal_a, e.id_b, e.reversal_b)
+            else:
+                length += len(line.strip())
+
+        if name is not None:
+            self.add_node(name, length)
+
+    def parse(self, path):
+        opener = gzip.open if path.endswith(".gz") else open
+
+        with opener(path, 'rt') as file:
+            if ".gfa" in path:
+                self.parse_gfa(file)
+            else:
+                self.parse_fasta(file)
+
+    def get_n50(self):
+        lengths = sorted(self.lengths, reverse=True)
+        half = sum(lengths)/2
+
+        total = 0
+        for l in lengths:
+            total += l
+            if total >= half:
+                return l
+
+        return 0
+
+    def get_stats(self, max_degree=8):
+        n_nodes = len(self.ids)
+
+        n_tips = 0
+        n_isolated = 0
+        degree_histogram = [0]*(max_degree + 1)
+        bubble_ends = dict()
+
+        for id in range(n_nodes):
+            left = self.degrees[LEFT][id]
+            right = self.degrees[RIGHT][id]
+
+            degree_histogram[min(max_degree, left)] += 1
+            degree_histogram[min(max_degree, right)] += 1
+
+            if left == 0 and right == 0:
+                n_isolated += 1
+            elif left == 0 or right == 0:
+                n_tips += 1
+
+            # Simple bubbles: two or more nodes with exactly one neighbor on each side, and the same two neighbors
+            if left == 1 and right == 1:
+                ends = (self.neighbors[LEFT][id], self.neighbors[RIGHT][id])
+                ends = min(ends, ends[::-1])
+                bubble_ends[ends] = bubble_ends.get(ends, 0) + 1
+
+        n_bubbles = sum(1 for c in bubble_ends.values() if c > 1)
+        n_components = sum(1 for id in range(n_nodes) if self.find(id) == id)
+
+        stats = {
+            "node_count": n_nodes,
+            "edge_count": self.n_edges,
+            "total_length": sum(self.lengths),
+            "n50": self.get_n50(),
+            "tip_count": n_tips,
+            "isolated_count": n_isolated,
+            "bubble_count": n_bubbles,
+            "component_count": n_components,
+        }
+
+        for d,count in enumerate(degree_histogram):
+            label = ("degree_%d" % d) if d < max_degree else ("degree_%d+" % d)
+            stats[label] = count
+
+        return stats
+
+    """
+    Write the stats as key,value lines, in the same format as the profiling log.csv
+    """
+    @staticmethod
+    def write_stats(stats, output_path):
+        with open(output_path, 'w') as file:
+            for key,value in stats.items():
+                file.write("%s,%s\n" % (key, str(value)))
+
+
+def test_graph_stats():
+    gfa_lines = [
+        "H\tVN:Z:1.0\n",
+        "S\t0\tACGTACGTAC\n",
+        "S\t1\tCGTAC\n",
+        "S\t2\tCGTTC\n",
+        "S\t3\tACGTAA\n",
+        "S\t4\t*\tLN:i:100\n",
+        "L\t0\t+\t1\t+\t*\n",
+        "L\t0\t+\t2\t+\t*\n",
+        "L\t1\t+\t3\t+\t*\n",
+        "L\t2\t+\t3\t+\t*\n",
+    ]
+
+    graph = GraphStats()
+    graph.parse_gfa(gfa_lines)
+
+    for key,value in graph.get_stats(max_degree=3).items():
+        print(key, value)
+
+
+if __name__ == "__main__":
+    test_graph_stats()
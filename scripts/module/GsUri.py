@@ -1,4 +1,3 @@
-from google.cloud import storage
 import sys
 import os
 
@@ -17,6 +16,13 @@ def decode_gs_uri(uri):
 
 
 def download_gs_uri(uri, output_directory, cache=True):
+    # Local paths are used in place, which allows running offline (e.g. on synthetic benchmark data)
+    if not uri.startswith("gs://"):
+        return uri
+
+    # Only required when actually downloading
+    from google.cloud import storage
+
     bucket, file_path = decode_gs_uri(uri)
     output_path = os.path.join(output_directory,os.path.basename(file_path))
 
@@ -0,0 +1,90 @@
+import numpy
+
+
+"""
+Set of 64 bit hashes in a preallocated open addressing table (linear probing) of numpy.uint64, for deduplicating
+millions of read names in 16-32 bytes each, rather than the ~70 bytes per entry of a Python set of ints. Keys are
+added in batches, and all probing is vectorized over the batch. 0 marks an empty slot, so a key of 0 is stored as 1.
+The table doubles whenever it would become more than half full.
+"""
+class Uint64HashSet:
+    def __init__(self, capacity=1 << 16):
+        size = 1
+
+        while size < 2*capacity:
+            size *= 2
+
+        self.table = numpy.zeros(size, dtype=numpy.uint64)
+        self.n = 0
+
+    def __len__(self):
+        return self.n
+
+    """
+    Insert distinct keys that are not yet in the table. Returns a mask of which keys were inserted (the others were
+    already present).
+    """
+    def insert_distinct(self, keys):
+        mask = numpy.uint64(len(self.table) - 1)
+        inserted = numpy.zeros(len(keys), dtype=bool)
+
+        pending = numpy.arange(len(keys))
+        slots = keys & mask
+
+        while len(pending) > 0:
+            values = self.table[slots]
+
+            is_present = values == keys[pending]
+            is_empty = values == 0
+
+            # Keys that hash to the same empty slot race for it, the one that was written wins and the others probe on
+            candidates = pending[is_empty]
+            self.table[slots[is_empty]] = keys[candidates]
+            is_won = is_empty.copy()
+            is_won[is_empty] = self.table[slots[is_empty]] == keys[candidates]
+
+            inserted[pending[is_won]] = True
+
+            is_next = ~(is_present | is_won)
+            pending = pending[is_next]
+            slots = (slots[is_next] + numpy.uint64(1)) & mask
+
+        self.n += int(numpy.count_nonzero(inserted))
+
+        return inserted
+
+    def grow(self, capacity):
+        if 2*capacity <= len(self.table):
+            return
+
+        old = self.table[self.table != 0]
+
+        size = len(self.table)
+        while size < 2*capacity:
+            size *= 2
+
+        self.table = numpy.zeros(size, dtype=numpy.uint64)
+        self.n = 0
+        self.insert_distinct(old)
+
+    """
+    Add a batch of keys. Returns a mask of the keys that are new: not in the set before, and the first occurrence
+    within the batch.
+    """
+    def add(self, keys):
+        keys = numpy.asarray(keys, dtype=numpy.uint64)
+        keys = numpy.where(keys == 0, numpy.uint64(1), keys)
+
+        # First occurrence of each key within the batch
+        order = numpy.argsort(keys, kind="stable")
+        sorted_keys = keys[order]
+        is_first = numpy.ones(len(keys), dtype=bool)
+        is_first[order[1:]] = sorted_keys[1:] != sorted_keys[:-1]
+
+        self.grow(self.n + int(numpy.count_nonzero(is_first)))
+
+        is_new = numpy.zeros(len(keys), dtype=bool)
+        first = numpy.flatnonzero(is_first)
+        is_new[first] = self.insert_distinct(keys[first])
+
+        return is_new
@@ -0,0 +1,233 @@
+import numpy
+import gzip
+import sys
+import os
+
+
+# A,C,G,T (either case) map to 0-3, anything else is 4 and breaks k-mers
+ENCODING = numpy.full(256, 4, dtype=numpy.uint8)
+for i,c in enumerate(b"ACGT"):
+    ENCODING[c] = i
+    ENCODING[ord(chr(c).lower())] = i
+
+DECODING = numpy.frombuffer(b"ACGT", dtype=numpy.uint8)
+
+MAX_K = 32
+
+
+def encode_sequence(sequence):
+    if isinstance(sequence, str):
+        sequence = sequence.encode("ascii")
+
+    return ENCODING[numpy.frombuffer(sequence, dtype=numpy.uint8)]
+
+
+"""
+Return a mask of which k-length windows of `codes` contain only valid bases
+"""
+def get_valid_windows(codes, k):
+    invalid = numpy.concatenate([[0], numpy.cumsum(codes > 3)])
+    return (invalid[k:] - invalid[:-k]) == 0
+
+
+"""
+Compute the 2-bit encoded forward and reverse complement k-mers at every position of an encoded sequence, with k
+vectorized shifts over the whole sequence. Windows containing non-ACGT characters are dropped.
+"""
+def get_kmers(codes, k):
+    if k > MAX_K:
+        raise ValueError("ERROR: k must be <= %d for 2-bit uint64 encoding: %d" % (MAX_K, k))
+
+    n = len(codes) - k + 1
+
+    if n <= 0:
+        empty = numpy.zeros(0, dtype=numpy.uint64)
+        return empty, empty
+
+    values = numpy.where(codes > 3, 0, codes).astype(numpy.uint64)
+
+    forward = numpy.zeros(n, dtype=numpy.uint64)
+    reverse = numpy.zeros(n, dtype=numpy.uint64)
+
+    for i in range(k):
+        window = values[i:i+n]
+        forward = (forward << numpy.uint64(2)) | window
+        reverse |= (numpy.uint64(3) - window) << numpy.uint64(2*i)
+
+    valid = get_valid_windows(codes, k)
+
+    return forward[valid], reverse[valid]
+
+
+def get_canonical_kmers(codes, k):
+    forward, reverse = get_kmers(codes, k)
+    return numpy.minimum(forward, reverse)
+
+
+"""
+Canonical k-mers of many sequences in one vectorized pass. Joined with an invalid base between them, so that no k-mer
+spans two sequences, which is much faster than one pass per sequence for short reads.
+"""
+def get_canonical_kmers_of_sequences(sequences, k):
+    sequences = [s.encode("ascii") if isinstance(s, str) else s for s in sequences]
+
+    return get_canonical_kmers(encode_sequence(b"N".join(sequences)), k)
+
+
+"""
+Sorted distinct values. Sorting and keeping the positions where the value changes is several times faster than
+numpy.unique for large uint64 arrays.
+"""
+def get_distinct_kmers(values):
+    values = numpy.sort(values)
+
+    if len(values) == 0:
+        return values
+
+    return values[numpy.concatenate([[True], values[1:] != values[:-1]])]
+
+
+"""
+Reverse complement of 2-bit encoded k-mers, vectorized: complement every base, reverse the order of the 2-bit groups
+within the 64-bit word, and shift out the (complemented) unused high bits, which end up at the bottom
+"""
+def reverse_complement_kmers(values, k):
+    x = ~values.astype(numpy.uint64)
+    x = ((x >> numpy.uint64(2)) & numpy.uint64(0x3333333333333333)) | ((x & numpy.uint64(0x3333333333333333)) << numpy.uint64(2))
+    x = ((x >> numpy.uint64(4)) & numpy.uint64(0x0F0F0F0F0F0F0F0F)) | ((x & numpy.uint64(0x0F0F0F0F0F0F0F0F)) << numpy.uint64(4))
+    x = x.byteswap()
+
+    return x >> numpy.uint64(64 - 2*k)
+
+
+def decode_kmer(value, k):
+    value = int(value)
+    codes = [(value >> (2*(k - 1 - i))) & 3 for i in range(k)]
+
+    return DECODING[codes].tobytes().decode("ascii")
+
+
+"""
+splitmix64 finalizer, used to spread k-mers uniformly (for partitioning and MinHash)
+"""
+def hash_kmers(values):
+    with numpy.errstate(over="ignore"):
+        x = values.astype(numpy.uint64)
+        x = x ^ (x >> numpy.uint64(30))
+        x = x * numpy.uint64(0xbf58476d1ce4e5b9)
+        x = x ^ (x >> numpy.uint64(27))
+        x = x * numpy.uint64(0x94d049bb133111eb)
+        x = x ^ (x >> numpy.uint64(31))
+
+    return x
+
+
+"""
+Stream the sequences of a graph or sequence file, as bytes: 'S' lines of a GFA (optionally gzipped), or records of a
+FASTA. Sequences are yielded one at a time, so memory is bounded by the longest sequence.
+"""
+def iterate_sequences(path):
+    opener = gzip.open if path.endswith(".gz") else open
+
+    with opener(path, 'rb') as file:
+        if ".gfa" in path:
+            for line in file:
+                if line.startswith(b'S'):
+                    sequence = line.split(b'\t')[2].strip()
+
+                    if sequence == b'*':
+                        raise ValueError("ERROR: GFA has no sequences (was it written with --no_sequence?): %s" % path)
+
+                    yield sequence
+        else:
+            sequence = list()
+            for line in file:
+                if line.startswith(b'>'):
+                    if len(sequence) > 0:
+                        yield b"".join(sequence)
+                    sequence = list()
+                else:
+                    sequence.append(line.strip())
+
+            if len(sequence) > 0:
+                yield b"".join(sequence)
+
+
+"""
+Extract the canonical k-mers of a batch of sequences, deduplicate them, and split them into partitions by hash, so that
+each partition can later be processed independently in memory
+"""
+def partition_batch(sequences, k, n_partitions):
+    kmers = get_distinct_kmers(get_canonical_kmers_of_sequences(sequences, k))
+    partitions = hash_kmers(kmers) % numpy.uint64(n_partitions)
+
+    order = numpy.argsort(partitions, kind="stable")
+    kmers = kmers[order]
+    boundaries = numpy.searchsorted(partitions[order], numpy.arange(n_partitions + 1, dtype=numpy.uint64))
+
+    return [kmers[boundaries[p]:boundaries[p+1]] for p in range(n_partitions)]
+
+
+def partition_batch_star(args):
+    return partition_batch(*args)
+
+
+"""
+Stream a file's sequences in batches, extract k-mers in parallel, and append each partition to its own file on disk
+(external partitioning). Memory is bounded by the batches in flight rather than by the total number of k-mers.
+Returns the partition file paths.
+"""
+def write_partitions(path, k, n_partitions, batch_size, pool, output_directory):
+    os.makedirs(output_directory)
+
+    partition_paths = [os.path.join(output_directory, "%d.bin" % p) for p in range(n_partitions)]
+    files = [open(p, 'wb') for p in partition_paths]
+
+    args = ((batch, k, n_partitions) for batch in iterate_sequence_batches(path, batch_size))
+
+    n_batches = 0
+    for partitions in pool.imap(partition_batch_star, args):
+        for p,kmers in enumerate(partitions):
+            kmers.tofile(files[p])
+
+        n_batches += 1
+
+    for f in files:
+        f.close()
+
+    sys.stderr.write("Partitioned %d batches of sequences from: %s\n" % (n_batches, path))
+
+    return partition_paths
+
+
+"""
+Group a stream of sequences into batches of roughly `batch_size` bases, for parallel processing
+"""
+def iterate_sequence_batches(path, batch_size):
+    batch = list()
+    n = 0
+
+    for sequence in iterate_sequences(path):
+        batch.append(sequence)
+        n += len(sequence)
+
+        if n >= batch_size:
+            yield batch
+            batch = list()
+            n = 0
+
+    if len(batch) > 0:
+        yield batch
+
+
+def test_kmer():
+    k = 5
+    sequence = "ACGTTNGGCATT"
+    kmers = get_canonical_kmers(encode_sequence(sequence), k)
+
+    for kmer in kmers:
+        print(decode_kmer(kmer, k))
+
+
+if __name__ == "__main__":
+    test_kmer()
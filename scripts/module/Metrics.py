@@ -0,0 +1,34 @@
+import os
+
+
+"""
+Append one `region,metric,value` line to a shared CSV. The line is written with a single write() on a file opened with
+O_APPEND, so that lines from concurrent processes (e.g. a multiprocessing Pool working on different regions) are not
+interleaved.
+"""
+def append_metric(path, region, metric, value):
+    if isinstance(value, float):
+        line = "%s,%s,%.6f\n" % (region, metric, value)
+    else:
+        line = "%s,%s,%s\n" % (region, metric, value)
+
+    fd = os.open(path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+
+    try:
+        os.write(fd, line.encode("utf8"))
+    finally:
+        os.close(fd)
+
+
+"""
+Read a metrics CSV into {region: {metric: value}}. Later lines for the same region and metric take precedence.
+"""
+def load_metrics(path):
+    metrics = dict()
+
+    with open(path, 'r') as file:
+        for line in file:
+            region, metric, value = line.rstrip('\n').split(',')
+            metrics.setdefault(region, dict())[metric] = value
+
+    return metrics
@@ -0,0 +1,209 @@
+from concurrent.futures import ThreadPoolExecutor
+import concurrent.futures
+import shutil
+import queue
+import sys
+import os
+
+
+NUMA_POLICIES = ["none", "bind", "interleave"]
+
+
+"""
+Parse a kernel CPU list, e.g. "0-3,8,10-11" -> [0, 1, 2, 3, 8, 10, 11]
+"""
+def parse_cpu_list(s):
+    cpus = list()
+
+    for token in s.strip().split(','):
+        if len(token) == 0:
+            continue
+
+        if '-' in token:
+            start, stop = token.split('-')
+            cpus.extend(range(int(start), int(stop) + 1))
+        else:
+            cpus.append(int(token))
+
+    return cpus
+
+
+"""
+Format CPUs as ranges, e.g. [0, 1, 2, 3, 8] -> "0-3;8". Ranges are separated by ';' so that the result can be a value
+in the key,value logs.
+"""
+def format_cpu_list(cpus, separator=';'):
+    ranges = list()
+
+    for cpu in sorted(cpus):
+        if len(ranges) > 0 and cpu == ranges[-1][1] + 1:
+            ranges[-1][1] = cpu
+        else:
+            ranges.append([cpu, cpu])
+
+    return separator.join(("%d-%d" % (a, b)) if a != b else str(a) for a,b in ranges)
+
+
+"""
+CPUs of each NUMA node, from /sys/devices/system/node, restricted to the CPUs this process may run on. Without NUMA
+information (e.g. in some containers), all allowed CPUs are treated as one node.
+"""
+def get_numa_nodes(sys_path="/sys/devices/system/node"):
+    allowed = os.sched_getaffinity(0)
+    nodes = dict()
+
+    if os.path.isdir(sys_path):
+        for name in sorted(os.listdir(sys_path)):
+            if not (name.startswith("node") and name[4:].isdigit()):
+                continue
+
+            with open(os.path.join(sys_path, name, "cpulist"), 'r') as file:
+                cpus = [c for c in parse_cpu_list(file.read()) if c in allowed]
+
+            # Memory-only nodes have no CPUs
+            if len(cpus) > 0:
+                nodes[int(name[4:])] = cpus
+
+    if len(nodes) == 0:
+        nodes[0] = sorted(allowed)
+
+    return nodes
+
+
+"""
+Split the CPUs into `n_slots` disjoint sets of `n_threads` CPUs. Each slot is placed within a single NUMA node if any
+node has enough free CPUs, choosing the node with the most free CPUs so that slots are spread across sockets (and
+their memory bandwidth). Slots that don't fit in one node take CPUs from the fewest nodes possible.
+Returns a list of {"cpus": [...], "nodes": [...]}.
+"""
+def allocate_cpu_slots(n_slots, n_threads, nodes):
+    free = {node: list(cpus) for node,cpus in nodes.items()}
+
+    n_available = sum(len(cpus) for cpus in free.values())
+    if n_slots*n_threads > n_available:
+        raise ValueError("ERROR: %d jobs of %d threads need %d CPUs, but only %d are available" % (n_slots, n_threads, n_slots*n_threads, n_available))
+
+    slots = list()
+
+    for i in range(n_slots):
+        fitting = [node for node,cpus in free.items() if len(cpus) >= n_threads]
+
+        if len(fitting) > 0:
+            node = max(fitting, key=lambda n: (len(free[n]), -n))
+            cpus = free[node][:n_threads]
+            free[node] = free[node][n_threads:]
+            slot_nodes = [node]
+        else:
+            cpus = list()
+            slot_nodes = list()
+
+            for node in sorted(free, key=lambda n: -len(free[n])):
+                n_needed = n_threads - len(cpus)
+
+                if n_needed == 0:
+                    break
+
+                if len(free[node]) > 0:
+                    cpus.extend(free[node][:n_needed])
+                    free[node] = free[node][n_needed:]
+                    slot_nodes.append(node)
+
+        slots.append({"cpus": cpus, "nodes": sorted(slot_nodes)})
+
+    return slots
+
+
+"""
+Prefix a command with numactl to set its memory policy: "bind" allocates only from the NUMA nodes of its CPU slot,
+"interleave" spreads pages over all nodes. CPU placement itself is done with sched_setaffinity (see JobRunner).
+"""
+def get_numa_args(args, placement):
+    if placement is None or placement["numa_policy"] == "none":
+        return args
+
+    if shutil.which("numactl") is None:
+        sys.stderr.write("WARNING: numactl not found, running without a NUMA memory policy\n")
+        return args
+
+    if placement["numa_policy"] == "bind":
+        return ["numactl", "--membind=%s" % ",".join(map(str, placement["nodes"]))] + args
+
+    elif placement["numa_policy"] == "interleave":
+        return ["numactl", "--interleave=all"] + args
+
+    else:
+        exit("ERROR: unrecognized NUMA policy: %s" % placement["numa_policy"])
+
+
+"""
+Runs jobs on `n_jobs` threads. If `slots` are given, each job first takes a free slot and pins its thread to the slot's
+CPUs with sched_setaffinity (only the first `n_threads` of them, if given). On Linux this only affects the calling
+thread, and processes started from it inherit the mask, so each builder runs on its own CPUs while the main thread
+keeps all of them. The CPUs and nodes used are passed to the job as its `placement`, along with the NUMA memory policy.
+A single unpinned job at a time runs directly on the calling thread, so that no extra thread exists in that case.
+"""
+class JobRunner:
+    def __init__(self, n_jobs, slots=None, numa_policy="none"):
+        self.executor = None
+        if n_jobs > 1 or slots is not None:
+            self.executor = ThreadPoolExecutor(max_workers=n_jobs)
+
+        self.numa_policy = numa_policy
+        self.slots = None
+        self.pending = list()
+
+        if slots is not None:
+            self.slots = queue.Queue()
+            for slot in slots:
+                self.slots.put(slot)
+
+    def run(self, function, kwargs, n_threads):
+        if self.slots is None:
+            return function(**kwargs)
+
+        slot = self.slots.get()
+
+        try:
+            cpus = slot["cpus"][:n_threads] if n_threads is not None else slot["cpus"]
+            os.sched_setaffinity(0, cpus)
+
+            placement = {"cpus": cpus, "nodes": slot["nodes"], "numa_policy": self.numa_policy}
+            return function(placement=placement, **kwargs)
+        finally:
+            self.slots.put(slot)
+
+    def submit(self, function, kwargs, n_threads=None):
+        if self.executor is None:
+            future = concurrent.futures.Future()
+            future.set_result(self.run(function, kwargs, n_threads))
+            return future
+
+        future = self.executor.submit(self.run, function, kwargs, n_threads)
+        self.pending.append(future)
+
+        return future
+
+    """
+    Wait until at most `n` submitted jobs are unfinished, re-raising any error from the finished ones
+    """
+    def wait(self, n=0):
+        while True:
+            for future in [f for f in self.pending if f.done()]:
+                self.pending.remove(future)
+                future.result()
+
+            if len(self.pending) <= n:
+                return
+
+            concurrent.futures.wait(self.pending, return_when=concurrent.futures.FIRST_COMPLETED)
+
+    """
+    Wait for all submitted jobs. After an error elsewhere, `raise_errors=False` cancels the jobs that haven't started,
+    waits for the running ones, and ignores their errors.
+    """
+    def shutdown(self, raise_errors=True):
+        if raise_errors:
+            self.wait()
+
+        if self.executor is not None:
+            self.executor.shutdown(cancel_futures=not raise_errors)
@@ -0,0 +1,114 @@
+import threading
+import hashlib
+import shutil
+import time
+import sys
+import os
+
+
+"""
+Content-addressed cache of graph builder outputs. Each entry is a directory named by the hash of everything that
+determines the build (input FASTA content, tool, image digest, k, thread count, repeated trial settings). Entries are written to a temporary
+directory and renamed into place, so concurrent writers never see partial entries. When the cache grows past
+`max_bytes`, the least recently used entries (by directory mtime, which is refreshed on every hit) are deleted.
+"""
+class ResultCache:
+    def __init__(self, directory, max_bytes):
+        self.directory = os.path.abspath(directory)
+        self.max_bytes = max_bytes
+
+        if not os.path.exists(self.directory):
+            os.makedirs(self.directory)
+
+    @staticmethod
+    def get_key(fasta_digest, graph_builder, image_digest, k, n_threads, n_repeats=1, drop_cache=False):
+        fields = [fasta_digest, graph_builder, image_digest, str(k), str(n_threads)]
+
+        # Repeated (or cold) trials produce a different log, but single-trial keys stay as they were
+        if n_repeats > 1 or drop_cache:
+            fields += [str(n_repeats), str(int(drop_cache))]
+
+        key = "\t".join(fields)
+        return hashlib.sha256(key.encode("utf8")).hexdigest()
+
+    def get_entry_path(self, key):
+        return os.path.join(self.directory, key)
+
+    """
+    Copy the cached outputs into `output_directory`. Returns False if there is no entry for this key.
+    """
+    def get(self, key, output_directory):
+        entry_path = self.get_entry_path(key)
+
+        if not os.path.isdir(entry_path):
+            return False
+
+        for filename in os.listdir(entry_path):
+            path = os.path.join(entry_path, filename)
+
+            if os.path.isdir(path):
+                shutil.copytree(path, os.path.join(output_directory, filename), dirs_exist_ok=True)
+            else:
+                shutil.copy2(path, os.path.join(output_directory, filename))
+
+        # Mark as recently used
+        now = time.time()
+        os.utime(entry_path, (now, now))
+
+        return True
+
+    """
+    Store the contents of `source_directory`, except for the filenames in `exclude`
+    """
+    def put(self, key, source_directory, exclude=()):
+        entry_path = self.get_entry_path(key)
+
+        if os.path.exists(entry_path):
+            return
+
+        # Unique per thread too, since concurrent jobs of one process can store the same entry
+        tmp_path = entry_path + ".tmp.%d.%d" % (os.getpid(), threading.get_ident())
+
+        shutil.copytree(source_directory, tmp_path, ignore=lambda d,names: [n for n in names if n in exclude])
+
+        try:
+            os.rename(tmp_path, entry_path)
+        except OSError:
+            # Another process stored the same entry first
+            shutil.rmtree(tmp_path)
+
+        self.evict()
+
+    @staticmethod
+    def get_size(path):
+        size = 0
+        for root,dirs,files in os.walk(path):
+            for f in files:
+                size += os.path.getsize(os.path.join(root, f))
+
+        return size
+
+    def evict(self):
+        entries = list()
+        total_size = 0
+
+        for name in os.listdir(self.directory):
+            path = os.path.join(self.directory, name)
+
+            if ".tmp." in name or not os.path.isdir(path):
+                continue
+
+            size = ResultCache.get_size(path)
+            entries.append((os.path.getmtime(path), size, path))
+            total_size += size
+
+        # Oldest first
+        entries.sort()
+
+        for mtime,size,path in entries:
+            if total_size <= self.max_bytes:
+                break
+
+            sys.stderr.write("Evicting cache entry: %s\n" % path)
+            shutil.rmtree(path, ignore_errors=True)
+            total_size -= size
@@ -0,0 +1,173 @@
+from statistics import NormalDist
+import json
+import math
+
+
+"""
+Power-law style scaling model for one resource of one tool, fit by least squares in log space:
+
+    log(y) = b0 + b1*f1(x1) + b2*f2(x2) + ...
+
+Each feature is named with an optional transform prefix, e.g. "log:total_coverage" uses log(1 + total_coverage) and
+"k" uses k as-is. Prediction only needs the coefficients and covariance, so it works without numpy (e.g. inside the
+builder docker images).
+"""
+class ScalingModel:
+    def __init__(self, response, features, coefficients=None, covariance=None, residual_variance=None, n_observations=0, r_squared=None, dropped_features=None):
+        self.response = response
+        self.features = list(features)
+        self.coefficients = coefficients
+        self.covariance = covariance
+        self.residual_variance = residual_variance
+        self.n_observations = n_observations
+        self.r_squared = r_squared
+
+        # Features that were constant in the training data, and can't be estimated
+        self.dropped_features = list() if dropped_features is None else list(dropped_features)
+
+    def get_terms(self):
+        return ["intercept"] + [f for f in self.features if f not in self.dropped_features]
+
+    @staticmethod
+    def parse_feature(feature):
+        if feature.startswith("log:"):
+            return "log", feature[4:]
+        else:
+            return None, feature
+
+    @staticmethod
+    def transform(transform, x):
+        if transform == "log":
+            return math.log1p(x)
+        else:
+            return x
+
+    """
+    Fit from a table (dict of column name -> 1D array, or a pandas DataFrame) with vectorized least squares.
+    Rows with missing values or a non-positive response are ignored.
+    """
+    def fit(self, table):
+        # numpy is only needed for fitting, not for predicting
+        import numpy
+
+        y = numpy.asarray(table[self.response], dtype=float)
+        mask = numpy.isfinite(y) & (y > 0)
+
+        columns = list()
+        names = list()
+        for feature in self.features:
+            transform, name = ScalingModel.parse_feature(feature)
+            x = numpy.asarray(table[name], dtype=float)
+
+            if transform == "log":
+                x = numpy.log1p(x)
+
+            columns.append(x)
+            names.append(feature)
+            mask &= numpy.isfinite(x)
+
+        self.dropped_features = list()
+        kept = list()
+        for feature,x in zip(names, columns):
+            if numpy.count_nonzero(mask) > 0 and numpy.ptp(x[mask]) > 0:
+                kept.append(x[mask])
+            else:
+                self.dropped_features.append(feature)
+
+        y = numpy.log(y[mask])
+        n = len(y)
+        p = len(kept) + 1
+
+        if n <= p:
+            raise ValueError("ERROR: not enough observations to fit %s: %d (need > %d)" % (self.response, n, p))
+
+        x = numpy.column_stack([numpy.ones(n)] + kept)
+
+        coefficients, _, _, _ = numpy.linalg.lstsq(x, y, rcond=None)
+
+        residuals = y - x @ coefficients
+        rss = float(residuals @ residuals)
+        tss = float(((y - y.mean()) ** 2).sum())
+
+        self.residual_variance = rss / (n - p)
+        self.covariance = (self.residual_variance * numpy.linalg.pinv(x.T @ x)).tolist()
+        self.coefficients = coefficients.tolist()
+        self.n_observations = n
+        self.r_squared = 1.0 - rss/tss if tss > 0 else 0.0
+
+        return self
+
+    def get_confidence_intervals(self, confidence=0.95):
+        z = NormalDist().inv_cdf(0.5 + confidence/2)
+
+        intervals = list()
+        for i,term in enumerate(self.get_terms()):
+            se = math.sqrt(max(0.0, self.covariance[i][i]))
+            intervals.append((term, self.coefficients[i], self.coefficients[i] - z*se, self.coefficients[i] + z*se))
+
+        return intervals
+
+    """
+    Predict the resource for one input, given as a dict of feature name -> value (without transform prefixes).
+    Returns the estimate and a prediction interval, in the original (non-log) units.
+    """
+    def predict(self, values, confidence=0.95):
+        x = [1.0]
+        for feature in self.features:
+            if feature in self.dropped_features:
+                continue
+
+            transform, name = ScalingModel.parse_feature(feature)
+            x.append(ScalingModel.transform(transform, float(values[name])))
+
+        y = sum(c*v for c,v in zip(self.coefficients, x))
+
+        # Variance of the mean prediction plus the residual variance
+        variance = self.residual_variance
+        for i in range(len(x)):
+            for j in range(len(x)):
+                variance += x[i]*self.covariance[i][j]*x[j]
+
+        z = NormalDist().inv_cdf(0.5 + confidence/2)
+        se = math.sqrt(max(0.0, variance))
+
+        return math.exp(y), math.exp(y - z*se), math.exp(y + z*se)
+
+    def to_dict(self):
+        return {
+            "response": self.response,
+            "features": self.features,
+            "dropped_features": self.dropped_features,
+            "coefficients": self.coefficients,
+            "covariance": self.covariance,
+            "residual_variance": self.residual_variance,
+            "n_observations": self.n_observations,
+            "r_squared": self.r_squared
+        }
+
+    @staticmethod
+    def from_dict(d):
+        return ScalingModel(
+            response=d["response"],
+            features=d["features"],
+            coefficients=d["coefficients"],
+            covariance=d["covariance"],
+            residual_variance=d["residual_variance"],
+            n_observations=d["n_observations"],
+            r_squared=d["r_squared"],
+            dropped_features=d["dropped_features"]
+        )
+
+    def __str__(self):
+        terms = ["%s=%.4g" % (t,c) for t,c in zip(self.get_terms(), self.coefficients)]
+        return "log(%s) ~ %s (n=%d, r2=%.3f)" % (self.response, " + ".join(terms), self.n_observations, self.r_squared)
+
+
+"""
+Load the models written by fit_scaling_models.py, as {tool: {response: ScalingModel}}
+"""
+def load_models(json_path):
+    with open(json_path, 'r') as file:
+        data = json.load(file)
+
+    return {tool: {r: ScalingModel.from_dict(m) for r,m in tool_models.items()} for tool,tool_models in data.items()}
@@ -0,0 +1,59 @@
+import tempfile
+import shutil
+import sys
+import os
+
+
+"""
+Pick where to write the intermediates of one region: the first of `tiers` (ordered fastest first, e.g. /dev/shm, then
+local NVMe) with at least `required_bytes` free, falling back to `fallback` (the output directory) if none of them
+fit. A fresh uniquely named directory is created on the chosen tier so that concurrent workers never collide.
+Returns the new directory and the tier it was created on.
+"""
+def make_scratch_directory(tiers, required_bytes, fallback, prefix):
+    if not os.path.exists(fallback):
+        os.makedirs(fallback)
+
+    for tier in list(tiers) + [fallback]:
+        # Scratch tiers are mount points, which should never be created here
+        if not os.path.isdir(tier):
+            sys.stderr.write("WARNING: scratch directory not found: %s\n" % tier)
+            continue
+
+        free_bytes = shutil.disk_usage(tier).free
+
+        if free_bytes >= required_bytes or tier == fallback:
+            if free_bytes < required_bytes:
+                sys.stderr.write("WARNING: no scratch tier has %.2fGB free for %s, using %s\n" % (required_bytes/1e9, prefix, tier))
+
+            return tempfile.mkdtemp(prefix=prefix + ".", dir=tier), tier
+
+        sys.stderr.write("Scratch tier %s has %.2fGB free, %.2fGB needed for %s\n" % (tier, free_bytes/1e9, required_bytes/1e9, prefix))
+
+
+def get_directory_size(path):
+    size = 0
+    for root,dirs,files in os.walk(path):
+        for f in files:
+            size += os.path.getsize(os.path.join(root, f))
+
+    return size
+
+
+"""
+Move a finished file from scratch into the output directory. Within one filesystem this is a rename, otherwise the
+file is copied to a temporary name first and then renamed, so that readers of the output directory never see a
+partial file.
+"""
+def move_to_output(path, output_directory):
+    output_path = os.path.join(output_directory, os.path.basename(path))
+
+    try:
+        os.rename(path, output_path)
+    except OSError:
+        tmp_path = output_path + ".tmp.%d" % os.getpid()
+        shutil.copyfile(path, tmp_path)
+        os.rename(tmp_path, output_path)
+        os.remove(path)
+
+    return output_path
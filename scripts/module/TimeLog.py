@@ -0,0 +1,57 @@
+from statistics import median
+import sys
+
+
+def parse_time_as_minutes(time):
+    if time.strip() == '0':
+        return 0
+
+    tokens = time.split(":")
+
+    minutes = None
+
+    if len(tokens) == 3:
+        minutes = 60*float(tokens[0]) + float(tokens[1]) + float(tokens[2])/60
+    elif len(tokens) == 2:
+        minutes = float(tokens[0]) + float(tokens[1])/60
+    else:
+        sys.stderr.write("ERROR: unparsable time string: %s\n" % time)
+        exit()
+
+    return minutes
+
+
+"""
+Parse the resource usage written by /usr/bin/time for one run into minutes, MB and percent
+"""
+def parse_time_log(path):
+    fields = dict()
+
+    with open(path, 'r') as file:
+        for line in file:
+            data = line.strip().split(',')
+
+            if len(data) == 2:
+                fields[data[0]] = data[1]
+
+    return {
+        "elapsed_real_min": parse_time_as_minutes(fields["elapsed_real_s"]),
+        "ram_max_mbyte": float(fields["ram_max_kbyte"])/1000,
+        "cpu_percent": float(fields["cpu_percent"].replace('%',''))
+    }
+
+
+"""
+Median and median absolute deviation of each metric over repeated trials (dicts from parse_time_log)
+"""
+def summarize_trials(trials):
+    summary = dict()
+
+    for key in trials[0]:
+        values = [t[key] for t in trials]
+        m = median(values)
+
+        summary[key + "_median"] = m
+        summary[key + "_mad"] = median([abs(v - m) for v in values])
+
+    return summary
@@ -0,0 +1,145 @@
+from module.GsUri import decode_gs_uri
+from module.Archive import get_archive_name
+
+import threading
+import hashlib
+import base64
+import queue
+import time
+import sys
+import os
+
+
+def get_md5_base64(path):
+    digest = hashlib.md5()
+
+    with open(path, 'rb') as file:
+        for chunk in iter(lambda: file.read(8*1024*1024), b''):
+            digest.update(chunk)
+
+    return base64.b64encode(digest.digest()).decode("ascii")
+
+
+"""
+Uploads finished files to a gs:// prefix from background threads, so that uploading the archive of one region overlaps
+with processing the next. At most `max_queued` files wait for upload, and submit() blocks while the queue is full,
+which bounds the local disk taken by archives that are finished but not yet uploaded.
+
+Every upload is verified by comparing the MD5 that GCS reports for the object with the MD5 of the local file, and is
+retried on a mismatch or an error. Local copies are only deleted (if `delete`) once verified. As for any
+google.cloud.storage client, STORAGE_EMULATOR_HOST can point the uploads at a local fake GCS server for testing.
+"""
+class BackgroundUploader:
+    def __init__(self, destination_uri, max_queued=2, n_threads=1, delete=False, max_attempts=3, events=None):
+        if not destination_uri.startswith("gs://"):
+            raise ValueError("ERROR: upload destination is not a gs:// URI: %s" % destination_uri)
+
+        self.bucket_name, self.prefix = decode_gs_uri(destination_uri.rstrip('/') + '/')
+        self.delete = delete
+        self.max_attempts = max_attempts
+        self.events = events
+
+        # Only required when actually uploading. The client is created here so that missing credentials fail early,
+        # rather than in an upload thread while submit() waits on it.
+        from google.cloud import storage
+        self.bucket = storage.Client().bucket(self.bucket_name)
+
+        self.queue = queue.Queue(maxsize=max_queued)
+        self.failed = list()
+        self.n_uploaded = 0
+        self.lock = threading.Lock()
+
+        self.threads = [threading.Thread(target=self.run, daemon=True) for i in range(n_threads)]
+
+        for thread in self.threads:
+            thread.start()
+
+    def submit(self, path):
+        self.queue.put(path)
+
+    """
+    Upload one file and check its MD5. Returns True if the object in GCS matches the local file.
+    """
+    def upload(self, path):
+        blob = self.bucket.blob(self.prefix + os.path.basename(path))
+        md5 = get_md5_base64(path)
+
+        blob.upload_from_filename(path)
+        blob.reload()
+
+        if blob.md5_hash != md5:
+            sys.stderr.write("ERROR: MD5 mismatch after upload of %s: local %s, remote %s\n" % (path, md5, blob.md5_hash))
+            return False
+
+        return True
+
+    """
+    Upload one file with retries, and record the result
+    """
+    def upload_with_retries(self, path):
+        t = time.perf_counter()
+        size = os.path.getsize(path)
+        success = False
+
+        for attempt in range(self.max_attempts):
+            try:
+                success = self.upload(path)
+            except Exception as e:
+                sys.stderr.write("ERROR: upload attempt %d of %s failed: %s\n" % (attempt + 1, path, str(e)))
+
+            if success:
+                break
+
+        seconds = time.perf_counter() - t
+
+        if self.events is not None:
+            self.events.emit("stage", region=get_archive_name(path), stage="upload", seconds=round(seconds, 6), success=success, upload_bytes=size)
+
+        if success:
+            sys.stderr.write("Uploaded %s to gs://%s/%s (%.1fMB/s)\n" % (path, self.bucket_name, self.prefix, size/1e6/max(seconds, 1e-9)))
+
+            if self.delete:
+                os.remove(path)
+
+            with self.lock:
+                self.n_uploaded += 1
+        else:
+            with self.lock:
+                self.failed.append(path)
+
+    def run(self):
+        while True:
+            path = self.queue.get()
+
+            if path is None:
+                self.queue.task_done()
+                return
+
+            # Any other error (e.g. a missing file) only fails this path, so the thread lives on and close() can't hang
+            try:
+                self.upload_with_retries(path)
+            except Exception as e:
+                sys.stderr.write("ERROR: upload of %s failed: %s\n" % (path, str(e)))
+
+                with self.lock:
+                    self.failed.append(path)
+            finally:
+                self.queue.task_done()
+
+    """
+    Wait for every submitted file to be uploaded, and stop the upload threads. Returns the paths that failed to upload,
+    which are never deleted.
+    """
+    def close(self):
+        for thread in self.threads:
+            self.queue.put(None)
+
+        for thread in self.threads:
+            thread.join()
+
+        sys.stderr.write("Uploaded %d files, %d failed\n" % (self.n_uploaded, len(self.failed)))
+
+        for path in self.failed:
+            sys.stderr.write("ERROR: not uploaded: %s\n" % path)
+
+        return self.failed
@@ -0,0 +1,219 @@
+from contextlib import contextmanager
+import threading
+import traceback
+import sqlite3
+import socket
+import json
+import time
+import sys
+import os
+
+
+"""
+Task queue shared by workers on any number of nodes, stored in a SQLite file on shared storage. The filesystem must
+support POSIX locks (e.g. NFS with locking enabled, but not a gcsfuse mount), since every state change is one locked
+transaction.
+
+A worker leases one task at a time for `lease_seconds`, and renews the lease with heartbeats while it works. If the
+worker dies, its lease expires and the task is leased again by another worker, up to `max_attempts` times in total.
+Expiry uses each node's wall clock, so node clocks should be synchronized well within the lease time. A worker that
+loses its lease (e.g. after a long pause) may finish a task that was already re-leased, so task outputs should be
+written atomically and be identical across attempts.
+"""
+class WorkQueue:
+    def __init__(self, path, lease_seconds=300, max_attempts=3):
+        self.path = os.path.abspath(path)
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+
+        with self.transaction() as connection:
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS tasks ("
+                "id INTEGER PRIMARY KEY, "
+                "key TEXT UNIQUE NOT NULL, "
+                "payload TEXT NOT NULL, "
+                "state TEXT NOT NULL DEFAULT 'pending', "
+                "attempts INTEGER NOT NULL DEFAULT 0, "
+                "worker TEXT, "
+                "lease_expires REAL, "
+                "updated REAL, "
+                "error TEXT)")
+
+            connection.execute("CREATE INDEX IF NOT EXISTS tasks_state ON tasks (state, id)")
+
+    """
+    One connection per transaction, so that queues can be used from threads and forked processes. The default rollback
+    journal is used rather than WAL, which needs shared memory and does not work across nodes.
+    """
+    @contextmanager
+    def transaction(self):
+        connection = sqlite3.connect(self.path, timeout=600, isolation_level=None)
+
+        try:
+            connection.execute("BEGIN IMMEDIATE")
+
+            try:
+                yield connection
+            except BaseException:
+                connection.execute("ROLLBACK")
+                raise
+
+            connection.execute("COMMIT")
+        finally:
+            connection.close()
+
+    """
+    Add tasks given as (key, payload) pairs, where payload is JSON serializable. Keys that are already queued are
+    ignored, so every node can enqueue the same full task list. Returns the number of tasks added.
+    """
+    def add(self, tasks):
+        now = time.time()
+
+        with self.transaction() as connection:
+            n_before = connection.total_changes
+
+            connection.executemany(
+                "INSERT OR IGNORE INTO tasks (key, payload, updated) VALUES (?, ?, ?)",
+                [(key, json.dumps(payload), now) for key,payload in tasks])
+
+            return connection.total_changes - n_before
+
+    """
+    Lease the oldest pending task, or a task whose lease has expired. Returns (task_id, key, payload, attempt), or None
+    if there is nothing left to lease.
+    """
+    def lease(self, worker_id):
+        now = time.time()
+
+        with self.transaction() as connection:
+            # Tasks whose workers died on their last attempt are not retried again
+            connection.execute(
+                "UPDATE tasks SET state = 'failed', error = 'lease expired', updated = ? "
+                "WHERE state = 'leased' AND lease_expires < ? AND attempts >= ?",
+                (now, now, self.max_attempts))
+
+            row = connection.execute(
+                "SELECT id, key, payload, attempts FROM tasks "
+                "WHERE state = 'pending' OR (state = 'leased' AND lease_expires < ?) "
+                "ORDER BY id LIMIT 1",
+                (now,)).fetchone()
+
+            if row is None:
+                return None
+
+            task_id, key, payload, attempts = row
+
+            connection.execute(
+                "UPDATE tasks SET state = 'leased', worker = ?, lease_expires = ?, attempts = ?, updated = ? WHERE id = ?",
+                (worker_id, now + self.lease_seconds, attempts + 1, now, task_id))
+
+        return task_id, key, json.loads(payload), attempts + 1
+
+    """
+    Extend the lease of a task. Returns False if the lease was lost to another worker.
+    """
+    def heartbeat(self, task_id, worker_id):
+        now = time.time()
+
+        with self.transaction() as connection:
+            cursor = connection.execute(
+                "UPDATE tasks SET lease_expires = ?, updated = ? WHERE id = ? AND worker = ? AND state = 'leased'",
+                (now + self.lease_seconds, now, task_id, worker_id))
+
+            return cursor.rowcount == 1
+
+    def complete(self, task_id, worker_id):
+        with self.transaction() as connection:
+            cursor = connection.execute(
+                "UPDATE tasks SET state = 'done', lease_expires = NULL, error = NULL, updated = ? WHERE id = ? AND worker = ?",
+                (time.time(), task_id, worker_id))
+
+            return cursor.rowcount == 1
+
+    """
+    Release a task after an error, to be retried by any worker unless it has used up its attempts
+    """
+    def fail(self, task_id, worker_id, error):
+        with self.transaction() as connection:
+            cursor = connection.execute(
+                "UPDATE tasks SET state = CASE WHEN attempts >= ? THEN 'failed' ELSE 'pending' END, "
+                "lease_expires = NULL, error = ?, updated = ? WHERE id = ? AND worker = ?",
+                (self.max_attempts, error, time.time(), task_id, worker_id))
+
+            return cursor.rowcount == 1
+
+    """
+    Number of tasks in each state, e.g. {"pending": 10, "leased": 2, "done": 5}
+    """
+    def get_counts(self):
+        with self.transaction() as connection:
+            return dict(connection.execute("SELECT state, COUNT(*) FROM tasks GROUP BY state").fetchall())
+
+
+def get_worker_id():
+    return "%s:%d" % (socket.gethostname(), os.getpid())
+
+
+"""
+Renew the lease of a task from a background thread for as long as the with-block runs
+"""
+@contextmanager
+def keep_leased(queue, task_id, worker_id):
+    stop = threading.Event()
+
+    def renew():
+        while not stop.wait(queue.lease_seconds/3):
+            if not queue.heartbeat(task_id, worker_id):
+                sys.stderr.write("WARNING: %s lost the lease of task %d\n" % (worker_id, task_id))
+                return
+
+    thread = threading.Thread(target=renew, daemon=True)
+    thread.start()
+
+    try:
+        yield
+    finally:
+        stop.set()
+        thread.join()
+
+
+"""
+Lease and run tasks until the queue is empty. `function` is called with the payload of each task as keyword arguments,
+and the task is failed (and retried) if it raises or returns False. SystemExit (from exit() on an error path) also only
+fails the task, so that it is released at once rather than staying leased until its lease expires. Returns the number of
+tasks completed and failed by this worker.
+"""
+def run_worker(queue, function, worker_id=None):
+    if worker_id is None:
+        worker_id = get_worker_id()
+
+    n_done = 0
+    n_failed = 0
+
+    while True:
+        task = queue.lease(worker_id)
+
+        if task is None:
+            break
+
+        task_id, key, payload, attempt = task
+        sys.stderr.write("%s leased task %s (attempt %d)\n" % (worker_id, key, attempt))
+
+        error = None
+
+        with keep_leased(queue, task_id, worker_id):
+            try:
+                if function(**payload) is False:
+                    error = "task returned failure"
+            except (Exception, SystemExit):
+                error = traceback.format_exc()
+
+        if error is None:
+            queue.complete(task_id, worker_id)
+            n_done += 1
+        else:
+            sys.stderr.write("ERROR: task %s failed on %s: %s\n" % (key, worker_id, error))
+            queue.fail(task_id, worker_id, error)
+            n_failed += 1
+
+    return n_done, n_failed
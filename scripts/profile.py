@@ -1,6 +1,21 @@
+from module.GraphStats import GraphStats
+from module.ResultCache import ResultCache
+from module.Archive import open_archive, write_archive, get_archive_name, EXTENSIONS
+from module.Metrics import append_metric
+from module.Events import EventLog, MetricsReporter
+from module.WorkQueue import WorkQueue, run_worker
+from module.Uploader import BackgroundUploader
+from module.ScalingModel import load_models
+from module.TimeLog import parse_time_log, summarize_trials
+from module.Scratch import make_scratch_directory, get_directory_size, move_to_output
+from module.Placement import get_numa_nodes, allocate_cpu_slots, get_numa_args, format_cpu_list, JobRunner, NUMA_POLICIES
+
 import subprocess
+import threading
 import argparse
-import tarfile
+import resource
+import hashlib
+import heapq
 import random
 import shutil
 import sys
@@ -17,7 +32,54 @@ def dry_run(output_directory):
     return log_path
 
 
-def run_cuttlefish(fasta_path, k, output_directory, n_threads, timeout=60*60*24):
+"""
+Exit if builds can't be capped with `mode`: without prlimit, an rlimit is set in a preexec_fn, which is not safe once
+the process has other threads (see get_memory_cap). Campaigns check this before staging anything, with `has_threads`
+telling whether any of their options will start threads, rather than failing every build.
+"""
+def check_memory_cap(memory_cap_mb, mode, has_threads):
+    if memory_cap_mb is None or mode != "rlimit" or not has_threads:
+        return
+
+    if shutil.which("prlimit") is None:
+        exit("ERROR: --memory_cap_mode rlimit needs prlimit (util-linux) when other threads are running (--jobs > 1, --pin, --queue, --metrics_textfile, --metrics_port or --upload), or use --memory_cap_mode cgroup")
+
+
+"""
+Wrap the builder command so that it fails as soon as it exceeds `memory_cap_mb`, instead of pushing the node into swap
+or the system OOM killer. "cgroup" runs it in a transient systemd scope with MemoryMax (which covers the whole process
+tree), and "rlimit" caps the address space of each process with setrlimit. Returns the args and a preexec_fn for
+subprocess.
+
+A preexec_fn is not safe once the process has other threads (JobRunner jobs, uploads, metrics), since it runs in the
+forked child and can deadlock, so the rlimit is set by prefixing the command with prlimit instead whenever it exists.
+"""
+def get_memory_cap(args, memory_cap_mb, mode):
+    if memory_cap_mb is None:
+        return args, None
+
+    if mode == "cgroup":
+        cgroup_args = ["systemd-run", "--scope", "--quiet", "-p", "MemoryMax=%dM" % memory_cap_mb, "-p", "MemorySwapMax=0"]
+        return cgroup_args + args, None
+
+    elif mode == "rlimit":
+        limit = int(memory_cap_mb*1024*1024)
+
+        if shutil.which("prlimit") is not None:
+            return ["prlimit", "--as=%d" % limit, "--"] + args, None
+
+        check_memory_cap(memory_cap_mb, mode, has_threads=threading.active_count() > 1)
+
+        def set_limit():
+            resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+
+        return args, set_limit
+
+    else:
+        exit("ERROR: unrecognized memory cap mode: %s" % mode)
+
+
+def run_cuttlefish(fasta_path, k, output_directory, n_threads, timeout=60*60*24, memory_cap_mb=None, memory_cap_mode="rlimit", placement=None):
     log_path = os.path.join(output_directory, "log.csv")
     cuttlefish_prefix = os.path.join(output_directory, "cuttlefish")
 
@@ -26,10 +88,13 @@ def run_cuttlefish(fasta_path, k, output_directory, n_threads, timeout=60*60*24)
     # cuttlefish build -s refs1.fa -k 3 -t 4 -o cdbg -w temp/ --ref
     args = time_args + ["cuttlefish", "build", "-k", str(k), "-t", str(n_threads), "--ref", "-s", fasta_path, "-o", os.path.join(output_directory, cuttlefish_prefix)]
 
+    args = get_numa_args(args, placement)
+    args, preexec_fn = get_memory_cap(args, memory_cap_mb, memory_cap_mode)
+
     sys.stderr.write(" ".join(args)+'\n')
 
     try:
-        p1 = subprocess.run(args, check=True, stderr=subprocess.PIPE, timeout=timeout)
+        p1 = subprocess.run(args, check=True, stderr=subprocess.PIPE, timeout=timeout, preexec_fn=preexec_fn)
 
     except subprocess.CalledProcessError as e:
         sys.stderr.write("Status: FAIL " + '\n' + (e.stderr.decode("utf8") if e.stderr is not None else "") + '\n')
@@ -44,7 +109,7 @@ def run_cuttlefish(fasta_path, k, output_directory, n_threads, timeout=60*60*24)
     return log_path
 
 
-def run_ggcat(fasta_path, k, output_directory, n_threads, timeout=60*60*24):
+def run_ggcat(fasta_path, k, output_directory, n_threads, timeout=60*60*24, memory_cap_mb=None, memory_cap_mode="rlimit", placement=None):
     log_path = os.path.join(output_directory, "log.csv")
     ggcat_prefix = os.path.join(output_directory, "ggcat")
 
@@ -53,10 +118,13 @@ def run_ggcat(fasta_path, k, output_directory, n_threads, timeout=60*60*24):
     # ggcat build -e --min-multiplicity 1 -k <k_value> -j <threads_count> <input_files> -o <output_file>
     args = time_args + ["ggcat", "build", "-e", "--min-multiplicity", "1", "-k", str(k), "-j", str(n_threads), fasta_path, "-o", os.path.join(output_directory, ggcat_prefix + ".fasta")]
 
+    args = get_numa_args(args, placement)
+    args, preexec_fn = get_memory_cap(args, memory_cap_mb, memory_cap_mode)
+
     sys.stderr.write(" ".join(args)+'\n')
 
     try:
-        p1 = subprocess.run(args, check=True, stderr=subprocess.PIPE, timeout=timeout)
+        p1 = subprocess.run(args, check=True, stderr=subprocess.PIPE, timeout=timeout, preexec_fn=preexec_fn)
 
     except subprocess.CalledProcessError as e:
         sys.stderr.write("Status: FAIL " + '\n' + (e.stderr.decode("utf8") if e.stderr is not None else "") + '\n')
@@ -71,17 +139,20 @@ def run_ggcat(fasta_path, k, output_directory, n_threads, timeout=60*60*24):
     return log_path
 
 
-def run_bifrost(fasta_path, k, output_directory, n_threads, timeout=60*60*24):
+def run_bifrost(fasta_path, k, output_directory, n_threads, timeout=60*60*24, memory_cap_mb=None, memory_cap_mode="rlimit", placement=None):
     log_path = os.path.join(output_directory, "log.csv")
     bifrost_prefix = os.path.join(output_directory, "bifrost")
 
     time_args = ["/usr/bin/time","-f","elapsed_real_s,%E\\nelapsed_kernel_s,%S\\nram_max_kbyte,%M\\nram_avg_kbyte,%t\\ncpu_percent,%P","-o",log_path]
     args = time_args + ["Bifrost", "build", "-n", "-k", str(k), "-t", str(n_threads), "-r", fasta_path, "-o", os.path.join(output_directory, bifrost_prefix)]
 
+    args = get_numa_args(args, placement)
+    args, preexec_fn = get_memory_cap(args, memory_cap_mb, memory_cap_mode)
+
     sys.stderr.write(" ".join(args)+'\n')
 
     try:
-        p1 = subprocess.run(args, check=True, stderr=subprocess.PIPE, timeout=timeout)
+        p1 = subprocess.run(args, check=True, stderr=subprocess.PIPE, timeout=timeout, preexec_fn=preexec_fn)
 
         # Bifrost doesn't have a proper error signal smh
         if b'Error' in p1.stderr:
@@ -100,99 +171,746 @@ def run_bifrost(fasta_path, k, output_directory, n_threads, timeout=60*60*24):
     return log_path
 
 
-def main(tar_paths, k, graph_builder, n_cores, timeout, n_samples, output_directory):
+"""
+Reference builder in NumPy (build_numpy_graph.py), run as its own process under /usr/bin/time like the external tools
+"""
+def run_numpy(fasta_path, k, output_directory, n_threads, timeout=60*60*24, memory_cap_mb=None, memory_cap_mode="rlimit", placement=None):
+    log_path = os.path.join(output_directory, "log.csv")
+    numpy_prefix = os.path.join(output_directory, "numpy")
+    script_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "build_numpy_graph.py")
+
+    time_args = ["/usr/bin/time","-f","elapsed_real_s,%E\\nelapsed_kernel_s,%S\\nram_max_kbyte,%M\\nram_avg_kbyte,%t\\ncpu_percent,%P","-o",log_path]
+    args = time_args + [sys.executable, script_path, "-k", str(k), "-c", str(n_threads), "-i", fasta_path, "-o", numpy_prefix + ".gfa"]
+
+    args = get_numa_args(args, placement)
+    args, preexec_fn = get_memory_cap(args, memory_cap_mb, memory_cap_mode)
+
+    sys.stderr.write(" ".join(args)+'\n')
+
+    try:
+        p1 = subprocess.run(args, check=True, stderr=subprocess.PIPE, timeout=timeout, preexec_fn=preexec_fn)
+
+    except subprocess.CalledProcessError as e:
+        sys.stderr.write("Status: FAIL " + '\n' + (e.stderr.decode("utf8") if e.stderr is not None else "") + '\n')
+        sys.stderr.flush()
+        return None
+
+    except subprocess.TimeoutExpired as e:
+        sys.stderr.write("Status: FAIL due to timeout " + '\n' + (e.stderr.decode("utf8") if e.stderr is not None else "") + '\n')
+        sys.stderr.flush()
+        return None
+
+    return log_path
+
+
+"""
+Find the graph written by the builder in its output directory (Bifrost or numpy GFA, ggcat FASTA with links, or
+cuttlefish FASTA) and write its statistics to graph_stats.csv, next to the log
+"""
+def write_graph_stats(output_directory, graph_builder):
+    suffixes = (".gfa", ".gfa.gz", ".fasta", ".fa")
+
+    graph_path = None
+    for filename in sorted(os.listdir(output_directory)):
+        if filename.startswith(graph_builder) and filename.endswith(suffixes):
+            graph_path = os.path.join(output_directory, filename)
+            break
+
+    if graph_path is None:
+        sys.stderr.write("WARNING: no graph output found for %s in %s\n" % (graph_builder, output_directory))
+        return None
+
+    graph = GraphStats()
+    graph.parse(graph_path)
+
+    stats_path = os.path.join(output_directory, "graph_stats.csv")
+    GraphStats.write_stats(graph.get_stats(), stats_path)
+
+    return stats_path
+
+
+def run_graph_builder(graph_builder, fasta_path, k, output_directory, n_cores, timeout, memory_cap_mb=None, memory_cap_mode="rlimit", placement=None):
+    log_path = None
+
+    if graph_builder == "bifrost":
+        log_path = run_bifrost(fasta_path, k, output_directory, n_cores, timeout=timeout, memory_cap_mb=memory_cap_mb, memory_cap_mode=memory_cap_mode, placement=placement)
+    elif graph_builder == "ggcat":
+        log_path = run_ggcat(fasta_path, k, output_directory, n_cores, timeout=timeout, memory_cap_mb=memory_cap_mb, memory_cap_mode=memory_cap_mode, placement=placement)
+    elif graph_builder == "cuttlefish":
+        log_path = run_cuttlefish(fasta_path, k, output_directory, n_cores, timeout=timeout, memory_cap_mb=memory_cap_mb, memory_cap_mode=memory_cap_mode, placement=placement)
+    elif graph_builder == "numpy":
+        log_path = run_numpy(fasta_path, k, output_directory, n_cores, timeout=timeout, memory_cap_mb=memory_cap_mb, memory_cap_mode=memory_cap_mode, placement=placement)
+    elif graph_builder == "test":
+        log_path = dry_run(output_directory)
+    else:
+        exit("ERROR: unrecognized choice for graph builder")
+
+    return log_path
+
+
+"""
+Deterministic pseudo-random priority of a sample, which depends only on its name and the seed (not on the order of
+members in the tarball). Selecting the n lowest priorities gives a seeded random subsample, and subsamples of
+different sizes are nested.
+"""
+def get_sample_priority(sample_name, seed):
+    digest = hashlib.sha256(("%d\t%s" % (seed, sample_name)).encode("utf8")).digest()
+    return int.from_bytes(digest[:8], "big")
+
+
+"""
+Stream the region tarball once and stage the FASTAs of the `n_max` samples with the lowest priority (all samples if
+n_max is None) in `staging_directory`, as a bottom-k reservoir. If the coverage TSV is read before the FASTAs, the
+selection is known up front, and iteration stops as soon as all selected FASTAs have been extracted.
+
+Returns the staged (sample_name, fasta_path) pairs in priority order, and the coverage TSV lines indexed by sample.
+"""
+def extract_samples(tar_path, n_max, seed, staging_directory, n_threads=1, stats=None):
+    # Max-heap (by negated priority) of the staged samples
+    reservoir = list()
+    tsv_lines_per_sample = dict()
+    selected = None
+
+    with open_archive(tar_path, n_threads=n_threads, stats=stats) as tar:
+        for item in tar:
+            if item.name.endswith(".tsv"):
+                f = tar.extractfile(item)
+
+                for l,line in enumerate(f.readlines()):
+                    line = line.decode('utf8')
+                    name = "header" if l == 0 else line.split('\t')[0]
+                    tsv_lines_per_sample[name] = line
+
+                samples = sorted([x for x in tsv_lines_per_sample if x != "header"], key=lambda x: get_sample_priority(x, seed))
+                selected = set(samples[:n_max])
+
+                # Samples staged before the coverage was read may not be in the final selection
+                for _,name,path in reservoir:
+                    if name not in selected:
+                        os.remove(path)
+
+                reservoir = [entry for entry in reservoir if entry[1] in selected]
+                heapq.heapify(reservoir)
+
+            elif item.name.endswith(".fasta"):
+                name = os.path.basename(item.name).split('.')[0]
+                priority = get_sample_priority(name, seed)
+
+                if selected is not None and name not in selected:
+                    continue
+
+                if selected is None and n_max is not None and len(reservoir) == n_max and priority >= -reservoir[0][0]:
+                    continue
+
+                path = os.path.join(staging_directory, name + ".fasta")
+                with open(path, 'wb') as file:
+                    shutil.copyfileobj(tar.extractfile(item), file)
+
+                heapq.heappush(reservoir, (-priority, name, path))
+
+                if n_max is not None and len(reservoir) > n_max:
+                    _, _, evicted_path = heapq.heappop(reservoir)
+                    os.remove(evicted_path)
+
+            # Everything needed has been read, skip decompressing the rest of the tarball
+            if selected is not None and {name for _,name,_ in reservoir} == selected:
+                break
+
+    samples = sorted(reservoir, reverse=True)
+
+    return [(name, path) for _,name,path in samples], tsv_lines_per_sample
+
+
+"""
+Concatenate the staged sample FASTAs, returning whether they were all empty and the content hash of the result
+"""
+def combine_fastas(fasta_paths, combined_fasta_path):
+    all_empty = True
+    fasta_hash = hashlib.sha256()
+
+    with open(combined_fasta_path, 'wb') as combined_fasta:
+        for path in fasta_paths:
+            with open(path, 'rb') as file:
+                while True:
+                    data = file.read(1024*1024)
+
+                    if len(data) == 0:
+                        break
+
+                    combined_fasta.write(data)
+                    fasta_hash.update(data)
+                    all_empty = False
+
+    return all_empty, fasta_hash.hexdigest()
+
+
+"""
+Describe the input of one build before running it: combined FASTA size, read count and total coverage (from the
+samtools coverage numreads and meandepth columns), plus the build parameters. These are the features available to the
+scaling models. A column that is missing from the coverage header counts as 0.
+"""
+def get_input_features(samples, tsv_lines_per_sample, k, n_cores):
+    header = tsv_lines_per_sample["header"].rstrip('\n').split('\t')
+
+    indexes = dict()
+    for column in ["meandepth", "numreads"]:
+        if column in header:
+            indexes[column] = header.index(column)
+        else:
+            sys.stderr.write("WARNING: no %s column in coverage header, using 0\n" % column)
+
+    features = {
+        "fasta_bytes": 0,
+        "read_count": 0,
+        "total_coverage": 0.0,
+        "sample_count": len(samples),
+        "k": k,
+        "cpu_count": n_cores
+    }
+
+    for name,path in samples:
+        data = tsv_lines_per_sample[name].rstrip('\n').split('\t')
+
+        features["fasta_bytes"] += os.path.getsize(path)
+
+        if "numreads" in indexes:
+            features["read_count"] += int(data[indexes["numreads"]])
+
+        if "meandepth" in indexes:
+            features["total_coverage"] += float(data[indexes["meandepth"]])
+
+    return features
+
+
+"""
+Predict runtime and peak RAM of the build with the scaling models fit on past results, and decide whether to run it.
+Builds predicted to exceed either limit are skipped, or deferred until every other build is done.
+Returns the decision ("admit", "skip" or "defer") and the predictions as {response: (estimate, lower, upper)}.
+"""
+def get_admission(models, features, max_runtime_min, max_ram_mb, over_limit):
+    limits = {"elapsed_real_min": max_runtime_min, "ram_max_mbyte": max_ram_mb}
+
+    decision = "admit"
+    predictions = dict()
+
+    for response,model in models.items():
+        try:
+            predictions[response] = model.predict(features)
+        except KeyError as e:
+            sys.stderr.write("WARNING: can't predict %s, feature %s is unknown before the build\n" % (response, str(e)))
+            continue
+
+        limit = limits.get(response)
+
+        if limit is not None and predictions[response][0] > limit:
+            decision = over_limit
+
+    return decision, predictions
+
+
+def log_admission(output_directory, output_prefix, decision, predictions):
+    admission_path = os.path.join(output_directory, "admission.csv")
+
+    for response,(estimate, lower, upper) in sorted(predictions.items()):
+        append_metric(admission_path, output_prefix, "predicted_" + response, estimate)
+        append_metric(admission_path, output_prefix, "predicted_" + response + "_upper", upper)
+
+    append_metric(admission_path, output_prefix, "admission", decision)
+
+    prediction_string = ", ".join(["%s=%.3g" % (r,p[0]) for r,p in sorted(predictions.items())])
+    sys.stderr.write("Admission for %s: %s (%s)\n" % (output_prefix, decision, prediction_string))
+
+
+"""
+Evict a file from the page cache, so that the next read of it comes from disk (a cold start)
+"""
+def drop_from_page_cache(path):
+    fd = os.open(path, os.O_RDONLY)
+
+    try:
+        # Dirty pages can't be dropped, so make sure everything is written first
+        os.fdatasync(fd)
+        os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_DONTNEED)
+    finally:
+        os.close(fd)
+
+
+"""
+Run the builder `n_repeats` times on the same input. Only the outputs of the last trial are kept, but the log of every
+trial is saved as log_trial_<i>.csv, and the median and MAD of each metric are appended to the final log.csv.
+Returns the final log path, or None if any trial failed.
+"""
+def run_trials(n_repeats, drop_cache, graph_builder, fasta_path, k, output_subdirectory, n_cores, timeout, memory_cap_mb, memory_cap_mode, placement=None):
+    trials = list()
+    log_path = None
+
+    for i in range(n_repeats):
+        if drop_cache:
+            drop_from_page_cache(fasta_path)
+
+        # Earlier trials are built next to the output, and only their logs are kept
+        if i < n_repeats - 1:
+            trial_directory = output_subdirectory + "_trial%d" % i
+            os.makedirs(trial_directory)
+        else:
+            trial_directory = output_subdirectory
+
+        log_path = run_graph_builder(graph_builder, fasta_path, k, trial_directory, n_cores, timeout, memory_cap_mb, memory_cap_mode, placement)
+
+        if log_path is None:
+            sys.stderr.write("ERROR: trial %d of %d failed: %s\n" % (i + 1, n_repeats, output_subdirectory))
+
+            if trial_directory != output_subdirectory:
+                shutil.rmtree(trial_directory)
+
+            return None
+
+        shutil.copyfile(log_path, os.path.join(output_subdirectory, "log_trial_%d.csv" % i))
+        trials.append(parse_time_log(log_path))
+
+        if trial_directory != output_subdirectory:
+            shutil.rmtree(trial_directory)
+
+    with open(log_path, 'a') as file:
+        file.write("repeat_count,%d\n" % n_repeats)
+
+        for key,value in summarize_trials(trials).items():
+            file.write("%s,%.6f\n" % (key, value))
+
+    return log_path
+
+
+PLACEMENT_ROWS = {"cpu_set", "numa_nodes", "numa_policy"}
+
+
+"""
+Remove the rows with the given keys from a key,value log
+"""
+def remove_log_rows(log_path, keys):
+    with open(log_path, 'r') as file:
+        lines = [line for line in file if line.split(',', 1)[0] not in keys]
+
+    with open(log_path, 'w') as file:
+        file.writelines(lines)
+
+
+"""
+Build the graph for one subsample of a region, and archive the log, coverage and outputs as <output_prefix>.tar.gz.
+If the job was pinned by a JobRunner, `placement` holds its CPUs, NUMA nodes and memory policy. Returns whether the
+build succeeded.
+"""
+def profile_samples(samples, tsv_lines_per_sample, output_prefix, k, graph_builder, n_cores, timeout, output_directory, working_directory, cache, image_digest, codec, input_features, memory_cap_mb=None, memory_cap_mode="rlimit", n_repeats=1, drop_cache=False, events=None, uploader=None, placement=None):
+    if events is None:
+        events = EventLog(os.path.join(output_directory, "events.jsonl"))
+
+    events.emit("region_start", region=output_prefix)
+
+    # Everything except the final archive is written to the (scratch) working directory
+    output_subdirectory = os.path.join(working_directory, output_prefix)
+
+    if not os.path.exists(output_subdirectory):
+        os.makedirs(output_subdirectory)
+
+    combined_fasta_path = os.path.join(working_directory, output_prefix + ".fasta")
+    output_tsv_path = os.path.join(output_subdirectory, "coverage.tsv")
+
+    # FASTAs for this region need to be combined
+    all_empty, fasta_digest = combine_fastas([path for name,path in samples], combined_fasta_path)
+
+    # Write the coverage data for the samples that were used
+    with open(output_tsv_path, 'w') as out_tsv:
+        out_tsv.write(tsv_lines_per_sample["header"])
+        for name,path in samples:
+            out_tsv.write(tsv_lines_per_sample[name])
+
+    cache_key = None
+    cache_hit = False
+
+    if cache is not None and not all_empty:
+        cache_key = ResultCache.get_key(fasta_digest, graph_builder, image_digest, k, n_cores, n_repeats, drop_cache)
+        cache_hit = cache.get(cache_key, output_subdirectory)
+
+    # Add specified graph outputs to subdirectory
+    if all_empty:
+        # Don't bother trying to run the graph tool, it may crash on empty FASTA
+        # Use dryrun function to generate 0 for all log stats
+        log_path = dry_run(output_subdirectory)
+        sys.stderr.write("WARNING: no coverage for region %s\n" % output_prefix)
+    elif cache_hit:
+        # The cached log already contains the resource usage of the original build, but not where it ran
+        log_path = os.path.join(output_subdirectory, "log.csv")
+        remove_log_rows(log_path, PLACEMENT_ROWS)
+        sys.stderr.write("Using cached result for region %s: %s\n" % (output_prefix, cache_key))
+    else:
+        with events.stage(output_prefix, "build") as stage:
+            if n_repeats > 1 or drop_cache:
+                log_path = run_trials(n_repeats, drop_cache, graph_builder, combined_fasta_path, k, output_subdirectory, n_cores, timeout, memory_cap_mb, memory_cap_mode, placement)
+            else:
+                log_path = run_graph_builder(graph_builder, combined_fasta_path, k, output_subdirectory, n_cores, timeout, memory_cap_mb, memory_cap_mode, placement)
+
+            stage["success"] = log_path is not None
+
+    if log_path is not None and not cache_hit:
+        # Update the log to contain the number of processors used and the k value, for fitting scaling models
+        with open(log_path, 'a') as file:
+            file.write("cpu_count,%d\n" % n_cores)
+            file.write("k,%d\n" % k)
+            file.write("fasta_bytes,%d\n" % input_features["fasta_bytes"])
+            file.write("read_count,%d\n" % input_features["read_count"])
+
+        # Measure what the builder produced, if anything was built
+        if (not all_empty) and graph_builder != "test":
+            write_graph_stats(output_subdirectory, graph_builder)
+
+        # The coverage TSV is specific to this input, everything else is a function of the FASTA content
+        if cache_key is not None:
+            cache.put(cache_key, output_subdirectory, exclude={"coverage.tsv"})
+
+    metrics_path = os.path.join(output_directory, "metrics.csv")
+
+    if log_path is not None:
+        with open(log_path, 'a') as file:
+            # Record whether the timing in this log was measured for this run, or copied from an earlier one
+            if cache is not None:
+                file.write("cache_hit,%d\n" % int(cache_hit))
+
+            # The placement of this run, which is kept out of the cache since a hit may run anywhere
+            if placement is not None:
+                file.write("cpu_set,%s\n" % format_cpu_list(placement["cpus"]))
+                file.write("numa_nodes,%s\n" % "+".join(map(str, placement["nodes"])))
+                file.write("numa_policy,%s\n" % placement["numa_policy"])
+
+        with events.stage(output_prefix, "archive"):
+            # Tar the outputs: coverage TSV, log CSV, graph stats CSV, and bifrost gfa/index
+            archive_path, seconds, size = write_archive(output_subdirectory, output_subdirectory, codec=codec, n_threads=n_cores)
+
+            # Archiving happens after the log is sealed, so its cost is recorded alongside the archives instead
+            append_metric(metrics_path, output_prefix, "archive_s", seconds)
+            append_metric(metrics_path, output_prefix, "archive_bytes", size)
+
+            scratch_bytes = input_features["fasta_bytes"] + os.path.getsize(combined_fasta_path) + get_directory_size(output_subdirectory) + size
+            append_metric(metrics_path, output_prefix, "scratch_bytes", scratch_bytes)
+
+            output_path = move_to_output(archive_path, output_directory)
+
+        # Uploaded in the background while the next region is built
+        if uploader is not None:
+            uploader.submit(output_path)
+
+        events.emit("region_done", region=output_prefix)
+    else:
+        events.emit("region_failed", region=output_prefix)
+
+    # Remove intermediates
+    os.remove(combined_fasta_path)
+    shutil.rmtree(output_subdirectory)
+
+    return log_path is not None
+
+
+def log_decompression(output_directory, region_prefix, stats, events):
+    events.emit("stage", region=region_prefix, stage="decompress", seconds=round(stats["seconds"], 6), success=True, bytes=stats["compressed_bytes"])
+
+    mb_per_s = stats["decompressed_bytes"]/1e6/max(stats["seconds"], 1e-9)
+
+    sys.stderr.write("Decompressed %.1fMB from %s in %.2fs (%.1fMB/s, %s)\n" % (stats["decompressed_bytes"]/1e6, region_prefix, stats["seconds"], mb_per_s, stats["method"]))
+
+    metrics_path = os.path.join(output_directory, "metrics.csv")
+    append_metric(metrics_path, region_prefix, "decompress_method", stats["method"])
+    append_metric(metrics_path, region_prefix, "decompressed_bytes", stats["decompressed_bytes"])
+    append_metric(metrics_path, region_prefix, "decompress_s", stats["seconds"])
+
+
+"""
+Geometric series of thread counts up to n_cores, e.g. 12 -> [1, 2, 4, 8, 12]
+"""
+def get_thread_sweep(n_cores):
+    thread_counts = list()
+
+    t = 1
+    while t < n_cores:
+        thread_counts.append(t)
+        t *= 2
+
+    thread_counts.append(n_cores)
+
+    return thread_counts
+
+
+"""
+Remove the working directories (given with the futures of their jobs) whose jobs have all finished, and return the rest
+"""
+def remove_finished_directories(working_directories):
+    remaining = list()
+
+    for working_directory,futures in working_directories:
+        if all(f.done() for f in futures):
+            shutil.rmtree(working_directory)
+        else:
+            remaining.append((working_directory, futures))
+
+    return remaining
+
+
+"""
+The subsample sizes (one or more nested sizes, or None to use all samples) and thread counts that each region is built
+with. Each (region, subsample size, thread count) is one build.
+"""
+def get_build_grid(n_samples, n_cores, thread_sweep):
+    if n_samples is None or isinstance(n_samples, int):
+        sample_counts = [n_samples]
+    else:
+        sample_counts = sorted(n_samples)
+
+    thread_counts = get_thread_sweep(n_cores) if thread_sweep else [n_cores]
+
+    return sample_counts, thread_counts
+
+
+"""
+Start the progress log of a campaign of n_builds builds (see module/Events.py), its metrics reporter and, if an upload
+URI is given, the background uploader of its results. Stop them with stop_campaign.
+"""
+def start_campaign(output_directory, n_builds, metrics_textfile=None, metrics_port=None, upload_uri=None, upload_delete=False, upload_queue=2):
+    if not os.path.exists(output_directory):
+        os.makedirs(output_directory)
+
+    events = EventLog(os.path.join(output_directory, "events.jsonl"))
+    events.emit("campaign_start", n_regions=n_builds)
+
+    reporter = MetricsReporter(events.path, textfile_path=metrics_textfile, port=metrics_port).start()
+
+    uploader = None
+    if upload_uri is not None:
+        uploader = BackgroundUploader(upload_uri, max_queued=upload_queue, delete=upload_delete, events=events)
+
+    return events, reporter, uploader
+
+
+def stop_campaign(reporter, uploader):
+    try:
+        if uploader is not None:
+            uploader.close()
+    finally:
+        reporter.stop()
+
+
+def main(tar_paths, k, graph_builder, n_cores, timeout, n_samples, output_directory, cache_directory=None, cache_max_bytes=None, image_digest="", seed=0, codec="gz", model_path=None, max_runtime_min=None, max_ram_mb=None, over_limit="skip", memory_cap_mb=None, memory_cap_mode="rlimit", scratch_directories=(), scratch_factor=10, thread_sweep=False, n_repeats=1, drop_cache=False, metrics_textfile=None, metrics_port=None, upload_uri=None, upload_delete=False, upload_queue=2, n_jobs=1, pin=False, numa_policy="none", events=None, reporter=None, uploader=None):
+    # Job threads, metrics, uploads, and the lease renewal of a queue worker (which passes in its own event log)
+    has_threads = n_jobs > 1 or pin or metrics_textfile is not None or metrics_port is not None or upload_uri is not None or events is not None
+    check_memory_cap(memory_cap_mb, memory_cap_mode, has_threads)
+
     output_directory = os.path.abspath(output_directory)
 
     if not os.path.exists(output_directory):
         os.makedirs(output_directory)
 
-    for tar_path in tar_paths:
-        output_prefix = os.path.basename(tar_path).split('.')[0]
-        output_subdirectory = os.path.join(output_directory, output_prefix)
+    cache = None
+    if cache_directory is not None:
+        cache = ResultCache(cache_directory, max_bytes=cache_max_bytes)
+
+        if len(image_digest) == 0:
+            sys.stderr.write("WARNING: no image digest given, cached results will be reused across builder versions\n")
+
+    models = None
+    if model_path is not None:
+        models = load_models(model_path).get(graph_builder)
+
+        if models is None:
+            sys.stderr.write("WARNING: no scaling models for %s in %s, all regions will be admitted\n" % (graph_builder, model_path))
 
-        if not os.path.exists(output_subdirectory):
-            os.makedirs(output_subdirectory)
+    sample_counts, thread_counts = get_build_grid(n_samples, n_cores, thread_sweep)
 
-        combined_fasta_path = os.path.join(output_directory, output_prefix + ".fasta")
-        output_tsv_path = os.path.join(output_subdirectory, "coverage.tsv")
+    n_max = None if None in sample_counts else max(sample_counts)
 
-        n = 0
-        samples_visited = set()
-        tsv_lines_per_sample = dict()
-        all_empty = True
+    # Unless the caller runs a longer campaign (see run_queue) and passes in its event log, reporter and uploader
+    is_campaign_owner = events is None
+    if is_campaign_owner:
+        n_builds = len(tar_paths)*len(sample_counts)*len(thread_counts)
+        events, reporter, uploader = start_campaign(output_directory, n_builds, metrics_textfile, metrics_port, upload_uri, upload_delete, upload_queue)
 
-        # FASTAs for this region need to be combined
-        with tarfile.open(tar_path, "r:gz") as tar, open(combined_fasta_path, 'wb') as combined_fasta:
-            for item in tar.getmembers():
-                if item.name.endswith(".fasta"):
+    runner = None
+    staged_directories = list()
 
-                    # Arbitrarily sample the top n in the list
-                    n += 1
-                    if n > n_samples:
+    try:
+        # Concurrent builds, each optionally pinned to its own set of n_cores CPUs, see module/Placement.py
+        slots = None
+        if pin:
+            try:
+                slots = allocate_cpu_slots(n_jobs, n_cores, get_numa_nodes())
+            except ValueError as e:
+                exit(str(e))
+
+            for i,slot in enumerate(slots):
+                sys.stderr.write("Job slot %d: CPUs %s, NUMA nodes %s\n" % (i, format_cpu_list(slot["cpus"], separator=','), ",".join(map(str, slot["nodes"]))))
+
+        elif numa_policy != "none":
+            exit("ERROR: a NUMA policy requires --pin")
+
+        elif n_jobs > 1:
+            sys.stderr.write("WARNING: running %d jobs without --pin, their measurements may interfere\n" % n_jobs)
+
+        runner = JobRunner(n_jobs, slots=slots, numa_policy=numa_policy)
+
+        deferred = list()
+        deferred_directories = list()
+        working_directories = list()
+        all_futures = list()
+
+        for tar_path in tar_paths:
+            region_prefix = get_archive_name(tar_path)
+
+            # Only stage the next region once a job slot is free, so that at most n_jobs regions take up scratch space
+            runner.wait(n_jobs - 1)
+            working_directories = remove_finished_directories(working_directories)
+
+            # Staged samples, the combined FASTA and the builder outputs take some multiple of the compressed region size
+            required_bytes = scratch_factor*os.path.getsize(tar_path)
+            working_directory, tier = make_scratch_directory(scratch_directories, required_bytes, output_directory, region_prefix)
+            staged_directories.append(working_directory)
+
+            append_metric(os.path.join(output_directory, "metrics.csv"), region_prefix, "scratch_tier", tier)
+
+            staging_directory = os.path.join(working_directory, "samples")
+            os.makedirs(staging_directory)
+
+            decompression = dict()
+            samples, tsv_lines_per_sample = extract_samples(tar_path, n_max, seed, staging_directory, n_cores, decompression)
+
+            log_decompression(output_directory, region_prefix, decompression, events)
+
+            n_deferred = 0
+            futures = list()
+
+            for n,n_threads in [(n,t) for n in sample_counts for t in thread_counts]:
+                output_prefix = region_prefix
+
+                # Subsamples of the same region are distinguished by their size, and sweep points by their thread count
+                if len(sample_counts) > 1:
+                    output_prefix += "_n%d" % n
+
+                if len(thread_counts) > 1:
+                    output_prefix += "_t%d" % n_threads
+
+                input_features = get_input_features(samples[:n], tsv_lines_per_sample, k, n_threads)
+
+                job = {
+                    "samples": samples[:n],
+                    "tsv_lines_per_sample": tsv_lines_per_sample,
+                    "output_prefix": output_prefix,
+                    "k": k,
+                    "graph_builder": graph_builder,
+                    "n_cores": n_threads,
+                    "timeout": timeout,
+                    "output_directory": output_directory,
+                    "working_directory": working_directory,
+                    "cache": cache,
+                    "image_digest": image_digest,
+                    "codec": codec,
+                    "input_features": input_features,
+                    "memory_cap_mb": memory_cap_mb,
+                    "memory_cap_mode": memory_cap_mode,
+                    "n_repeats": n_repeats,
+                    "drop_cache": drop_cache,
+                    "events": events,
+                    "uploader": uploader
+                }
+
+                if models is not None:
+                    decision, predictions = get_admission(models, input_features, max_runtime_min, max_ram_mb, over_limit)
+                    log_admission(output_directory, output_prefix, decision, predictions)
+
+                    if decision == "skip":
+                        events.emit("region_skipped", region=output_prefix)
                         continue
 
-                    samples_visited.add(os.path.basename(item.name).split('.')[0])
+                    if decision == "defer":
+                        runtime = predictions["elapsed_real_min"][0] if "elapsed_real_min" in predictions else 0
+                        deferred.append((runtime, len(deferred), job))
+                        n_deferred += 1
+                        continue
 
-                    f = tar.extractfile(item)
-                    for l,line in enumerate(f.readlines()):
-                        combined_fasta.write(line)
+                # A thread sweep point is pinned to as many CPUs of its slot as it has threads
+                futures.append(runner.submit(profile_samples, job, n_threads=n_threads))
 
-                        if l > 0:
-                            all_empty = False
+            all_futures.extend(futures)
 
-                # Also untar the coverage file
-                if item.name.endswith(".tsv"):
-                    f = tar.extractfile(item)
+            # Removed once its jobs are done, except that deferred builds still need their staged FASTAs
+            if n_deferred > 0:
+                deferred_directories.append(working_directory)
+            else:
+                working_directories.append((working_directory, futures))
 
-                    # If we are subsampling, need to index the lines by sample so only relevant ones can be copied later
-                    for l,line in enumerate(f.readlines()):
-                        line = line.decode('utf8')
-                        tokens = line.split('\t')
+        # Builds that are predicted to exceed the limits run last (shortest first), once they can't hold up anything else
+        runner.wait()
 
-                        name = None
-                        if l == 0:
-                            name = "header"
-                        else:
-                            name = tokens[0]
+        for runtime,_,job in sorted(deferred, key=lambda x: x[:2]):
+            all_futures.append(runner.submit(profile_samples, job, n_threads=job["n_cores"]))
 
-                        tsv_lines_per_sample[name] = line
+        runner.shutdown()
 
-        # Write the coverage data for the samples that were visited
-        with open(output_tsv_path, 'w') as out_tsv:
-            out_tsv.write(tsv_lines_per_sample["header"])
-            for s in samples_visited:
-                out_tsv.write(tsv_lines_per_sample[s])
+        remove_finished_directories(working_directories)
 
-        # Add specified graph outputs to subdirectory
-        if all_empty:
-            # Don't bother trying to run the graph tool, it may crash on empty FASTA
-            # Use dryrun function to generate 0 for all log stats
-            log_path = dry_run(output_subdirectory)
-            sys.stderr.write("WARNING: no coverage for region %s\n" % output_prefix)
-        else:
-            if graph_builder == "bifrost":
-                log_path = run_bifrost(combined_fasta_path, k, output_subdirectory, n_cores, timeout=timeout)
-            elif graph_builder == "ggcat":
-                log_path = run_ggcat(combined_fasta_path, k, output_subdirectory, n_cores, timeout=timeout)
-            elif graph_builder == "cuttlefish":
-                log_path = run_cuttlefish(combined_fasta_path, k, output_subdirectory, n_cores, timeout=timeout)
-            elif graph_builder == "test":
-                log_path = dry_run(output_subdirectory)
-            else:
-                exit("ERROR: unrecognized choice for graph builder")
+        for working_directory in deferred_directories:
+            shutil.rmtree(working_directory)
 
-        if log_path is not None:
-            # Update the log to contain the number of processors used
-            with open(log_path, 'a') as file:
-                file.write("cpu_count,%d\n" % n_cores)
+        return all(f.result() for f in all_futures)
+    finally:
+        # If a build raised or called exit(), wait for the other running jobs and remove whatever is still staged
+        if runner is not None:
+            runner.shutdown(raise_errors=False)
 
-            # Tar the outputs: coverage TSV, log CSV, and bifrost gfa/index
-            with tarfile.open(output_subdirectory + ".tar.gz", "w:gz") as tar:
-                tar.add(output_subdirectory, arcname=os.path.basename(output_subdirectory))
+        for working_directory in staged_directories:
+            if os.path.exists(working_directory):
+                shutil.rmtree(working_directory)
 
-        # Remove intermediates
-        os.remove(combined_fasta_path)
-        shutil.rmtree(output_subdirectory)
+        if is_campaign_owner:
+            stop_campaign(reporter, uploader)
+
+
+"""
+Distributed mode: every node enqueues the same tarballs (each is only added once) and then profiles the regions that it
+leases, one tarball at a time, until none are left. Builds that admission control defers run at the end of their own
+region rather than at the end of the campaign, so that a region is complete when its task is.
+"""
+def run_queue(queue_path, tar_paths, lease_seconds, max_attempts, main_kwargs):
+    # Leases are renewed from a thread while each region is profiled
+    check_memory_cap(main_kwargs["memory_cap_mb"], main_kwargs["memory_cap_mode"], has_threads=True)
+
+    queue = WorkQueue(queue_path, lease_seconds=lease_seconds, max_attempts=max_attempts)
+
+    tar_paths = [os.path.abspath(p) for p in tar_paths]
+    n_added = queue.add([(p, {"tar_path": p}) for p in tar_paths])
+
+    sys.stderr.write("Added %d of %d regions to queue: %s\n" % (n_added, len(tar_paths), queue.path))
+
+    # One campaign for all the regions this node leases, rather than one per region. Which regions those are is only
+    # known as they are leased, so each lease adds its builds to the total.
+    output_directory = os.path.abspath(main_kwargs["output_directory"])
+    sample_counts, thread_counts = get_build_grid(main_kwargs["n_samples"], main_kwargs["n_cores"], main_kwargs["thread_sweep"])
+
+    events, reporter, uploader = start_campaign(
+        output_directory,
+        0,
+        metrics_textfile=main_kwargs["metrics_textfile"],
+        metrics_port=main_kwargs["metrics_port"],
+        upload_uri=main_kwargs["upload_uri"],
+        upload_delete=main_kwargs["upload_delete"],
+        upload_queue=main_kwargs["upload_queue"])
+
+    def profile_leased_region(tar_path):
+        events.emit("campaign_extend", n_regions=len(sample_counts)*len(thread_counts))
+        return main(tar_paths=[tar_path], events=events, reporter=reporter, uploader=uploader, **main_kwargs)
+
+    try:
+        n_done, n_failed = run_worker(queue, profile_leased_region)
+    finally:
+        stop_campaign(reporter, uploader)
+
+    sys.stderr.write("This node completed %d and failed %d regions, queue state: %s\n" % (
+        n_done,
+        n_failed,
+        ", ".join("%s: %d" % item for item in sorted(queue.get_counts().items()))))
 
 
 def parse_comma_separated_string(s):
@@ -211,10 +929,19 @@ def parse_input_string(s):
     return paths
 
 
+def parse_sample_counts(s):
+    counts = [int(x) for x in parse_comma_separated_string(s)]
+
+    if len(counts) == 1:
+        return counts[0]
+
+    return sorted(set(counts))
+
+
 def parse_choice(s):
     s = s.lower()
 
-    choices = {"bifrost", "cuttlefish", "ggcat", "test"}
+    choices = {"bifrost", "cuttlefish", "ggcat", "numpy", "test"}
     if s not in choices:
         exit("ERROR: must select one of the following tools to profile: " + str(choices))
 
@@ -242,8 +969,17 @@ if __name__ == "__main__":
         "-n",
         required=False,
         default=None,
+        type=parse_sample_counts,
+        help="How many samples to use for profiling. Samples are chosen by seeded random subsampling. A comma separated "
+             "list (e.g. 2,4,8) profiles nested subsamples of each size from a single extraction, with outputs suffixed by _n<size>"
+    )
+
+    parser.add_argument(
+        "--seed",
+        required=False,
+        default=0,
         type=int,
-        help="How many samples to use for profiling"
+        help="Random seed for choosing which samples to use"
     )
 
     parser.add_argument(
@@ -273,9 +1009,268 @@ if __name__ == "__main__":
         "-g",
         required=True,
         type=parse_choice,
-        help="Graph building tool to use. Must be one of the following: bifrost, cuttlefish, ggcat"
+        help="Graph building tool to use. Must be one of the following: bifrost, cuttlefish, ggcat, numpy (reference builder "
+             "in build_numpy_graph.py, which needs no external binaries)"
+    )
+
+    parser.add_argument(
+        "--cache",
+        required=False,
+        default=None,
+        type=str,
+        help="Directory for caching builder outputs by input content, tool, image digest, k and core count. "
+             "Cached results are reused instead of rebuilding, and marked with cache_hit,1 in the log"
+    )
+
+    parser.add_argument(
+        "--cache_size",
+        required=False,
+        default=100,
+        type=float,
+        help="Maximum size of the cache in GB, least recently used entries are evicted beyond this"
+    )
+
+    parser.add_argument(
+        "--image_digest",
+        required=False,
+        default=os.environ.get("IMAGE_DIGEST", ""),
+        type=str,
+        help="Digest of the builder image, used as part of the cache key (default: $IMAGE_DIGEST)"
+    )
+
+    parser.add_argument(
+        "--archive",
+        required=False,
+        default="gz",
+        choices=list(EXTENSIONS),
+        help="Compression codec for the output archives. bgzf is gzip compatible and is compressed and decompressed "
+             "in parallel (using -c threads), as is zstd. zstd and lz4 need the zstandard/lz4 python packages or "
+             "executables. Inputs of any of these formats are detected automatically"
+    )
+
+    parser.add_argument(
+        "--model",
+        required=False,
+        default=None,
+        type=str,
+        help="Scaling models JSON from fit_scaling_models.py. If given, runtime and RAM are predicted for each region "
+             "before building, and regions predicted to exceed --max_runtime_min or --max_ram_mb are skipped or deferred. "
+             "Decisions are logged in admission.csv in the output directory"
+    )
+
+    parser.add_argument(
+        "--max_runtime_min",
+        required=False,
+        default=None,
+        type=float,
+        help="Maximum predicted runtime (minutes) for a region to be admitted"
+    )
+
+    parser.add_argument(
+        "--max_ram_mb",
+        required=False,
+        default=None,
+        type=float,
+        help="Maximum predicted peak RAM (MB) for a region to be admitted"
+    )
+
+    parser.add_argument(
+        "--over_limit",
+        required=False,
+        default="skip",
+        choices=["skip", "defer"],
+        help="What to do with regions predicted to exceed the limits: skip them, or run them after all other regions"
+    )
+
+    parser.add_argument(
+        "--memory_cap_mb",
+        required=False,
+        default=None,
+        type=float,
+        help="Hard memory limit (MB) for the builder process, so that it fails fast instead of running the node out of memory"
+    )
+
+    parser.add_argument(
+        "--memory_cap_mode",
+        required=False,
+        default="rlimit",
+        choices=["rlimit", "cgroup"],
+        help="How to enforce --memory_cap_mb: an address space rlimit, or a systemd-run scope with MemoryMax (cgroup v2)"
+    )
+
+    parser.add_argument(
+        "--scratch",
+        required=False,
+        default=[],
+        type=parse_comma_separated_string,
+        help="Scratch directories for intermediates (comma separated, fastest first, e.g. /dev/shm,/mnt/nvme). "
+             "Each region uses the first one with enough free space, or the output directory if none fit. Only the "
+             "final archives are written to the output directory"
+    )
+
+    parser.add_argument(
+        "--scratch_factor",
+        required=False,
+        default=10,
+        type=float,
+        help="Free space needed on a scratch tier, as a multiple of the compressed region tarball size"
+    )
+
+    parser.add_argument(
+        "--thread_sweep",
+        required=False,
+        action="store_true",
+        help="Build each region at 1, 2, 4, ... up to -c threads, with outputs suffixed by _t<threads>, to measure "
+             "parallel scaling (see analyze_thread_scaling.py)"
+    )
+
+    parser.add_argument(
+        "--repeats",
+        required=False,
+        default=1,
+        type=int,
+        help="Number of times to run the builder on each region. Every trial's log is kept, and the median and MAD "
+             "of each metric are added to log.csv"
+    )
+
+    parser.add_argument(
+        "--drop_cache",
+        required=False,
+        action="store_true",
+        help="Drop the input FASTA from the page cache before each trial, to measure cold reads"
+    )
+
+    parser.add_argument(
+        "--metrics_textfile",
+        required=False,
+        default=None,
+        type=str,
+        help="Periodically write progress metrics (completed/failed/in-flight builds, bytes decompressed, builder "
+             "seconds, stage latencies, ETA) to this Prometheus textfile. Structured events are always logged to "
+             "events.jsonl in the output directory"
+    )
+
+    parser.add_argument(
+        "--metrics_port",
+        required=False,
+        default=None,
+        type=int,
+        help="Serve the same progress metrics at http://127.0.0.1:<port>/metrics"
+    )
+
+    parser.add_argument(
+        "--upload",
+        required=False,
+        default=None,
+        type=str,
+        help="gs:// prefix to upload each result archive to in the background, while the next region is built. "
+             "Uploads are verified by MD5. STORAGE_EMULATOR_HOST can be set to use a local fake GCS server"
+    )
+
+    parser.add_argument(
+        "--upload_delete",
+        required=False,
+        action="store_true",
+        help="Delete local archives once their upload is verified"
+    )
+
+    parser.add_argument(
+        "--upload_queue",
+        required=False,
+        default=2,
+        type=int,
+        help="Maximum number of finished archives waiting for upload. Building waits while the queue is full, which "
+             "bounds the local disk used by archives that are not yet uploaded"
+    )
+
+    parser.add_argument(
+        "--jobs",
+        required=False,
+        default=1,
+        type=int,
+        help="Number of builds to run concurrently, each with -c threads. Regions are staged as job slots free up"
+    )
+
+    parser.add_argument(
+        "--pin",
+        required=False,
+        action="store_true",
+        help="Pin each concurrent build to its own set of -c CPUs with sched_setaffinity, keeping each set within one "
+             "NUMA node where possible (nodes are read from /sys/devices/system/node). The CPU set and NUMA nodes are "
+             "recorded in each log.csv. Requires --jobs x -c available CPUs"
+    )
+
+    parser.add_argument(
+        "--numa_policy",
+        required=False,
+        default="none",
+        choices=NUMA_POLICIES,
+        help="Memory policy of pinned builds, applied with numactl: 'bind' allocates only from the NUMA nodes of the "
+             "build's CPUs, 'interleave' spreads pages over all nodes. Requires --pin"
+    )
+
+    parser.add_argument(
+        "--queue",
+        required=False,
+        default=None,
+        type=str,
+        help="Distributed mode: SQLite file on shared storage (with working POSIX locks) holding the tarballs as a work "
+             "queue. Every node runs the same command and leases regions until none are left. Regions of dead workers "
+             "are leased again once their lease expires"
+    )
+
+    parser.add_argument(
+        "--lease_seconds",
+        required=False,
+        default=300,
+        type=int,
+        help="How long a region stays leased without a heartbeat (heartbeats are sent every third of this)"
+    )
+
+    parser.add_argument(
+        "--max_attempts",
+        required=False,
+        default=3,
+        type=int,
+        help="Number of times a region is attempted before it is marked as failed in the queue"
     )
 
     args = parser.parse_args()
 
-    main(tar_paths=args.tars, k=args.k, graph_builder=args.g, output_directory=args.o, n_cores=args.c, n_samples=args.n, timeout=args.timeout)
+    main_kwargs = dict(
+        k=args.k,
+        graph_builder=args.g,
+        output_directory=args.o,
+        n_cores=args.c,
+        n_samples=args.n,
+        timeout=args.timeout,
+        cache_directory=args.cache,
+        cache_max_bytes=int(args.cache_size*1e9),
+        image_digest=args.image_digest,
+        seed=args.seed,
+        codec=args.archive,
+        model_path=args.model,
+        max_runtime_min=args.max_runtime_min,
+        max_ram_mb=args.max_ram_mb,
+        over_limit=args.over_limit,
+        memory_cap_mb=args.memory_cap_mb,
+        memory_cap_mode=args.memory_cap_mode,
+        scratch_directories=args.scratch,
+        scratch_factor=args.scratch_factor,
+        thread_sweep=args.thread_sweep,
+        n_repeats=args.repeats,
+        drop_cache=args.drop_cache,
+        metrics_textfile=args.metrics_textfile,
+        metrics_port=args.metrics_port,
+        upload_uri=args.upload,
+        upload_delete=args.upload_delete,
+        upload_queue=args.upload_queue,
+        n_jobs=args.jobs,
+        pin=args.pin,
+        numa_policy=args.numa_policy
+    )
+
+    if args.queue is None:
+        main(tar_paths=args.tars, **main_kwargs)
+    else:
+        run_queue(args.queue, args.tars, args.lease_seconds, args.max_attempts, main_kwargs)
@@ -0,0 +1,144 @@
+from module.BifrostQuery import BifrostQueryServer, iterate_fasta_records
+
+from concurrent.futures import ThreadPoolExecutor
+from collections import deque
+from queue import Queue
+import argparse
+import time
+import sys
+import os
+
+
+def iterate_batches(fasta_path, batch_size):
+    batch = list()
+
+    for record in iterate_fasta_records(fasta_path):
+        batch.append(record)
+
+        if len(batch) == batch_size:
+            yield batch
+            batch = list()
+
+    if len(batch) > 0:
+        yield batch
+
+
+def query_with_any_server(servers, batch):
+    # Borrow whichever server is idle, so that batches are spread across all of them
+    server = servers.get()
+
+    try:
+        return server.query(batch)
+    finally:
+        servers.put(server)
+
+
+def main(gfa_path, fasta_path, n_servers, n_threads, batch_size, executable, output_path):
+    output_directory = os.path.dirname(output_path)
+
+    if not len(output_directory) == 0:
+        if not os.path.exists(output_directory):
+            os.makedirs(output_directory)
+
+    # Each server loads the graph exactly once, and then answers any number of batches
+    servers = Queue()
+    for s in range(n_servers):
+        servers.put(BifrostQueryServer(gfa_path, n_threads=n_threads, executable=executable))
+
+    n_queries = 0
+    t = time.perf_counter()
+
+    with ThreadPoolExecutor(max_workers=n_servers) as executor, open(output_path, 'w') as file:
+        file.write("name\tn_kmers\tn_found\n")
+
+        # Keep a bounded number of batches in flight, and write results in input order
+        in_flight = deque()
+
+        for batch in iterate_batches(fasta_path, batch_size):
+            in_flight.append(executor.submit(query_with_any_server, servers, batch))
+
+            if len(in_flight) >= 2*n_servers:
+                for name,n_kmers,n_found in in_flight.popleft().result():
+                    file.write("%s\t%d\t%d\n" % (name, n_kmers, n_found))
+                    n_queries += 1
+
+        while len(in_flight) > 0:
+            for name,n_kmers,n_found in in_flight.popleft().result():
+                file.write("%s\t%d\t%d\n" % (name, n_kmers, n_found))
+                n_queries += 1
+
+    seconds = time.perf_counter() - t
+
+    while not servers.empty():
+        servers.get().close()
+
+    sys.stderr.write("Queried %d sequences in %.2fs (%.1f/s)\n" % (n_queries, seconds, n_queries/max(seconds, 1e-9)))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+
+    parser.add_argument(
+        "-g",
+        required=True,
+        type=str,
+        help="GFA to query"
+    )
+
+    parser.add_argument(
+        "-q",
+        required=True,
+        type=str,
+        help="FASTA containing sequences to query"
+    )
+
+    parser.add_argument(
+        "-p",
+        required=False,
+        default=1,
+        type=int,
+        help="Number of query processes, each of which holds its own copy of the graph in memory"
+    )
+
+    parser.add_argument(
+        "-t",
+        required=False,
+        default=1,
+        type=int,
+        help="Number of threads per query process"
+    )
+
+    parser.add_argument(
+        "--batch_size",
+        required=False,
+        default=1000,
+        type=int,
+        help="Number of sequences sent to a query process at a time"
+    )
+
+    parser.add_argument(
+        "--executable",
+        required=False,
+        default="query_gfa_with_bifrost",
+        type=str,
+        help="Path to the query_gfa_with_bifrost executable"
+    )
+
+    parser.add_argument(
+        "-o",
+        required=True,
+        type=str,
+        help="Output TSV path (name, n_kmers, n_found)"
+    )
+
+    args = parser.parse_args()
+
+    main(
+        gfa_path=args.g,
+        fasta_path=args.q,
+        n_servers=args.p,
+        n_threads=args.t,
+        batch_size=args.batch_size,
+        executable=args.executable,
+        output_path=args.o
+    )
@@ -5,27 +5,43 @@
 #include <fstream>
 
 #include <functional>
+#include <utility>
+#include <atomic>
+#include <thread>
+#include <vector>
 
 using std::ifstream;
+using std::ofstream;
+using std::istream;
+using std::ostream;
 using std::function;
 using std::getline;
+using std::atomic;
+using std::thread;
+using std::vector;
+using std::pair;
 using ghc::filesystem::path;
 
 
-void for_each_sequence_in_fasta(path fasta_path, const function<void(const string& name, const string& sequence)>& f){
-    ifstream file(fasta_path);
+class QueryResult {
+public:
+    string name;
+    size_t n_kmers = 0;
+    size_t n_found = 0;
+};
 
-    if (not (file.is_open() and file.good())){
-        throw runtime_error("ERROR: could not read file: " + fasta_path.string());
-    }
 
+void for_each_sequence_in_fasta(istream& file, const function<void(const string& name, const string& sequence)>& f){
     string name;
     string sequence;
     string line;
     size_t l = 0;
 
     while (getline(file, line)){
-        cout << line << '\n';
+        if (line.empty()){
+            continue;
+        }
+
         if (line[0] == '>'){
             if (l > 0){
                 f(name, sequence);
@@ -33,59 +49,184 @@ void for_each_sequence_in_fasta(path fasta_path, const function<void(const strin
 
             // Trim any trailing tokens from the fasta header, keep only the name
             name = line.substr(1, line.find_first_of(" \t\n") - 1);
-            cout << name << '\n';
 
             // Reset sequence
             sequence.clear();
         }
         else {
             sequence += line;
-            cout << sequence << '\n';
         }
 
         l++;
     }
 
-    f(name,sequence);
+    if (l > 0){
+        f(name,sequence);
+    }
+}
+
+
+void for_each_sequence_in_fasta(path fasta_path, const function<void(const string& name, const string& sequence)>& f){
+    ifstream file(fasta_path);
+
+    if (not (file.is_open() and file.good())){
+        throw runtime_error("ERROR: could not read file: " + fasta_path.string());
+    }
+
+    for_each_sequence_in_fasta(file, f);
+}
+
+
+/**
+ * Read FASTA records from the stream until a line containing only "//" (end of batch) or the end of the stream.
+ * Returns false if the stream ended and no records were read.
+ */
+bool read_fasta_batch(istream& input, vector <pair <string, string> >& batch){
+    batch.clear();
+
+    string line;
+    bool found_any = false;
+
+    while (getline(input, line)){
+        if (line == "//"){
+            return true;
+        }
+
+        found_any = true;
+
+        if (line.empty()){
+            continue;
+        }
+
+        if (line[0] == '>'){
+            batch.emplace_back(line.substr(1, line.find_first_of(" \t\n") - 1), "");
+        }
+        else if (not batch.empty()){
+            batch.back().second += line;
+        }
+    }
+
+    return found_any;
+}
+
+
+QueryResult query_sequence(const CompactedDBG<>& cdbg, const string& name, const string& sequence){
+    QueryResult result;
+    result.name = name;
+
+    for (KmerIterator it_km(sequence.c_str()), it_km_end; it_km != it_km_end; ++it_km) { //non-ACGT char. are discarded
+        const_UnitigMap<> um = cdbg.find(it_km->first);
+
+        result.n_kmers++;
+
+        if (not um.isEmpty) {
+            result.n_found++;
+        }
+    }
+
+    return result;
+}
+
+
+/**
+ * Query every sequence of the batch, sharing the (read only) graph between threads. Results keep the input order.
+ */
+void query_batch(const CompactedDBG<>& cdbg, const vector <pair <string, string> >& batch, vector<QueryResult>& results, size_t n_threads){
+    results.clear();
+    results.resize(batch.size());
+
+    atomic<size_t> index = 0;
+
+    auto thread_fn = [&](){
+        size_t i;
+
+        while ((i = index.fetch_add(1)) < batch.size()){
+            results[i] = query_sequence(cdbg, batch[i].first, batch[i].second);
+        }
+    };
+
+    vector<thread> threads;
+
+    for (size_t t=0; t<min(n_threads, batch.size()); t++){
+        threads.emplace_back(thread_fn);
+    }
+
+    for (auto& t: threads){
+        t.join();
+    }
 }
 
 
-int query_gfa_with_bifrost(path gfa_path, path fasta_path, size_t n_threads, path output_dir){
-    if (exists(output_dir)){
-        throw runtime_error("ERROR: output directory exists already");
+void write_results(ostream& output, const vector<QueryResult>& results){
+    for (const auto& result: results){
+        output << result.name << '\t' << result.n_kmers << '\t' << result.n_found << '\n';
     }
-    else {
-        create_directories(output_dir);
+}
+
+
+/**
+ * Load the graph once and then answer batches of FASTA queries from stdin until it is closed. Each batch is terminated
+ * by a "//" line, and its results (name, k-mer count, found k-mer count) are followed by a "//" line on stdout.
+ */
+int serve_queries(const CompactedDBG<>& cdbg, size_t n_threads){
+    vector <pair <string, string> > batch;
+    vector<QueryResult> results;
+
+    while (read_fasta_batch(cin, batch)){
+        query_batch(cdbg, batch, results, n_threads);
+        write_results(cout, results);
+
+        cout << "//" << '\n';
+        cout.flush();
+    }
+
+    return 0;
+}
+
+
+int query_gfa_with_bifrost(path gfa_path, path fasta_path, size_t n_threads, path output_dir, bool batch_mode){
+    if (not batch_mode) {
+        if (exists(output_dir)) {
+            throw runtime_error("ERROR: output directory exists already");
+        }
+        else {
+            create_directories(output_dir);
+        }
     }
 
     const size_t k = 31;
 
     CompactedDBG<> cdbg(k);
 
-    const bool verbose = true;
+    // Stdout is reserved for results in batch mode
+    const bool verbose = not batch_mode;
 
     cdbg.read(gfa_path.string(), n_threads, verbose);
 
-    cout << "K-mer size is " << cdbg.getK() << endl;
+    cerr << "K-mer size is " << cdbg.getK() << '\n';
+
+    if (batch_mode){
+        return serve_queries(cdbg, n_threads);
+    }
+
+    vector <pair <string, string> > batch;
+    vector<QueryResult> results;
 
     for_each_sequence_in_fasta(fasta_path, [&](const string& name, const string& sequence){
-        cout << "---- " << name << " ----" << '\n';
+        batch.emplace_back(name, sequence);
+    });
 
-        for (KmerIterator it_km(sequence.c_str()), it_km_end; it_km != it_km_end; ++it_km) { //non-ACGT char. are discarded
-            UnitigMap<> um = cdbg.find(it_km->first);
+    query_batch(cdbg, batch, results, n_threads);
 
-            if (um.isEmpty) {
-                cout << "Kmer " << it_km->first.toString() << " was not found" << endl;
-            }
-            else {
-                const string unitig = um.referenceUnitigToString();
-                const string strandness = um.strand ? "forward" : "reverse-complement";
-                const size_t position = um.dist;
+    path output_path = output_dir / "query_hits.tsv";
+    ofstream output_file(output_path);
 
-                cout << "Kmer " << it_km->first.toString() << " was found in the " << strandness << " direction of unitig " << "" << "at position " << position << '\n';
-            }
-        }
-    });
+    if (not (output_file.is_open() and output_file.good())){
+        throw runtime_error("ERROR: could not write file: " + output_path.string());
+    }
+
+    output_file << "name" << '\t' << "n_kmers" << '\t' << "n_found" << '\n';
+    write_results(output_file, results);
 
     return 0;
 }
@@ -96,6 +237,7 @@ int main(int argc, char* argv[]){
     path fasta_path;
     path output_dir;
     size_t n_threads = 1;
+    bool batch_mode = false;
 
     CLI::App app{"App description"};
 
@@ -108,23 +250,31 @@ int main(int argc, char* argv[]){
     app.add_option(
             "-q,--query_fasta",
             fasta_path,
-            "Path to Fasta containing sequences to query")
-            ->required();
+            "Path to Fasta containing sequences to query");
 
     app.add_option(
             "-o,--output_dir",
             output_dir,
-            "Path to (nonexistent) directory where output will be stored")
-            ->required();
+            "Path to (nonexistent) directory where output will be stored");
 
     app.add_option(
             "-t,--threads",
             n_threads,
             "(Default = " + to_string(n_threads) + ")\tMaximum number of threads to use.");
 
+    app.add_flag(
+            "-b,--batch",
+            batch_mode,
+            "Load the graph once and answer batches of FASTA queries from stdin, each terminated by a '//' line. "
+            "Results are written to stdout as TSV (name, n_kmers, n_found), each batch followed by a '//' line.");
+
     CLI11_PARSE(app, argc, argv);
 
-    query_gfa_with_bifrost(gfa_path, fasta_path, n_threads, output_dir);
+    if ((not batch_mode) and (fasta_path.empty() or output_dir.empty())){
+        throw runtime_error("ERROR: --query_fasta and --output_dir are required unless --batch is used");
+    }
+
+    query_gfa_with_bifrost(gfa_path, fasta_path, n_threads, output_dir, batch_mode);
 
     return 0;
-}
\ No newline at end of file
+}